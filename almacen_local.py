@@ -0,0 +1,231 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+# ==========================================
+# ALMACÉN LOCAL (SQLITE) - SE ESCRIBE PRIMERO AQUÍ Y LUEGO SE SINCRONIZA CON SHEETS
+# ==========================================
+RUTA_DB_LOCAL = os.environ.get("COTIZADOR_DB", "cotizador_local.db")
+INTERVALO_SINCRONIZACION = 60  # segundos, igual que el ttl que tenían los cachés de la nube
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS datasets (nombre TEXT PRIMARY KEY, contenido TEXT NOT NULL, actualizado REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS borradores (clave TEXT PRIMARY KEY, payload TEXT NOT NULL, actualizado REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS historial (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT, hora TEXT, correlativo TEXT, provisional TEXT,
+    patente TEXT, cliente TEXT, monto TEXT, sincronizado INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS pendientes (id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL, payload TEXT NOT NULL, creado REAL NOT NULL, intentos INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS historial_nube (fila INTEGER PRIMARY KEY, fecha TEXT, hora TEXT, correlativo TEXT, patente TEXT, cliente TEXT, monto INTEGER);
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS pdfs (huella TEXT PRIMARY KEY, contenido TEXT NOT NULL, tamano INTEGER NOT NULL, correlativo TEXT, patente TEXT, nombre TEXT, creado REAL NOT NULL, usado REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS pdfs_correlativo ON pdfs (correlativo);
+CREATE INDEX IF NOT EXISTS pdfs_patente ON pdfs (patente);
+CREATE INDEX IF NOT EXISTS pdfs_usado ON pdfs (usado);
+"""
+
+def _json_default(o):
+    return o.item() if hasattr(o, 'item') else str(o)
+
+class AlmacenLocal:
+    def __init__(self, ruta=RUTA_DB_LOCAL):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if ruta != ":memory:": self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(ESQUEMA)
+
+    def _q(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- Datasets (lista de precios, directorio de patentes) ---
+    def leer_dataset(self, nombre):
+        filas = self._q("SELECT contenido FROM datasets WHERE nombre = ?", (nombre,))
+        if not filas: return None
+        contenido = json.loads(filas[0]["contenido"])
+        return pd.DataFrame(contenido["filas"], columns=contenido["columnas"])
+
+    def guardar_dataset(self, nombre, df, si_sin_pendientes=False):
+        # si_sin_pendientes: la descarga de fondo no pisa cambios locales que aún no suben a la nube
+        contenido = json.dumps({"columnas": [str(c) for c in df.columns], "filas": df.values.tolist()}, default=_json_default)
+        with self._lock:
+            if si_sin_pendientes and self.total_pendientes(): return False
+            self._conn.execute("INSERT OR REPLACE INTO datasets (nombre, contenido, actualizado) VALUES (?, ?, ?)", (nombre, contenido, time.time()))
+        return True
+
+    def borrar_dataset(self, nombre):
+        self._q("DELETE FROM datasets WHERE nombre = ?", (nombre,))
+
+    # --- Borradores ---
+    def leer_borrador(self, clave):
+        filas = self._q("SELECT payload FROM borradores WHERE clave = ?", (clave,))
+        return filas[0]["payload"] if filas else None
+
+    def guardar_borrador(self, clave, payload, actualizado=None):
+        self._q("INSERT OR REPLACE INTO borradores (clave, payload, actualizado) VALUES (?, ?, ?)", (clave, payload, actualizado or time.time()))
+
+    def borrar_borrador(self, clave):
+        self._q("DELETE FROM borradores WHERE clave = ?", (clave,))
+
+    def listar_borradores(self):
+        return [dict(f) for f in self._q("SELECT clave, payload, actualizado FROM borradores ORDER BY actualizado DESC")]
+
+    # --- Historial de cotizaciones emitidas desde esta instalación ---
+    def registrar_cotizacion(self, fecha, hora, patente, cliente, monto):
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO historial (fecha, hora, patente, cliente, monto) VALUES (?, ?, ?, ?, ?)", (fecha, hora, patente, cliente, monto))
+            return cur.lastrowid
+
+    def asignar_correlativo(self, id_local, correlativo, provisional=None):
+        with self._lock:
+            if provisional is not None:
+                self._conn.execute("UPDATE historial SET provisional = ? WHERE id = ?", (provisional, id_local))
+            else:
+                self._conn.execute("UPDATE historial SET correlativo = ?, sincronizado = 1 WHERE id = ?", (correlativo, id_local))
+
+    def historial(self, limite=None):
+        sql = "SELECT * FROM historial ORDER BY id DESC" + (f" LIMIT {int(limite)}" if limite else "")
+        return [dict(f) for f in self._q(sql)]
+
+    # --- Copia incremental de la pestaña Historial (analítica) ---
+    def guardar_filas_historial(self, filas, clave_cursor, cursor):
+        # Filas y cursor en una sola transacción: si se corta a mitad, el próximo intento parte del cursor anterior
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO historial_nube (fila, fecha, hora, correlativo, patente, cliente, monto) VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+                self._conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave_cursor, str(cursor)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK"); raise
+
+    def leer_historial_nube(self):
+        with self._lock:
+            return pd.read_sql_query("SELECT * FROM historial_nube ORDER BY fila", self._conn)
+
+    def borrar_historial_nube(self, clave_cursor):
+        with self._lock:
+            self._conn.execute("DELETE FROM historial_nube")
+            self._conn.execute("DELETE FROM meta WHERE clave = ?", (clave_cursor,))
+
+    def leer_meta(self, clave, por_defecto=None):
+        filas = self._q("SELECT valor FROM meta WHERE clave = ?", (clave,))
+        return filas[0]["valor"] if filas else por_defecto
+
+    # --- Índice de PDF emitidos (los bytes están en disco, con el sha256 del contenido como nombre) ---
+    def leer_pdf(self, huella):
+        filas = self._q("SELECT * FROM pdfs WHERE huella = ?", (huella,))
+        return dict(filas[0]) if filas else None
+
+    def guardar_pdf(self, huella, contenido, tamano, correlativo, patente, nombre):
+        ahora = time.time()
+        self._q("INSERT OR REPLACE INTO pdfs (huella, contenido, tamano, correlativo, patente, nombre, creado, usado) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (huella, contenido, tamano, correlativo, patente, nombre, ahora, ahora))
+
+    def tocar_pdf(self, huella):
+        self._q("UPDATE pdfs SET usado = ? WHERE huella = ?", (time.time(), huella))
+
+    def borrar_pdf(self, huella):
+        self._q("DELETE FROM pdfs WHERE huella = ?", (huella,))
+
+    def buscar_pdfs(self, texto, limite=50):
+        # N° exacto o patente (también por el comienzo), los más recientes primero
+        return [dict(f) for f in self._q("SELECT * FROM pdfs WHERE correlativo = ? OR patente LIKE ? ORDER BY creado DESC LIMIT ?", (texto, texto + "%", int(limite)))]
+
+    def resumen_pdfs(self):
+        fila = self._q("SELECT COUNT(*) AS entradas, COUNT(DISTINCT contenido) AS archivos FROM pdfs")[0]
+        return {"entradas": fila["entradas"], "archivos": fila["archivos"], "bytes": self.bytes_pdfs()}
+
+    def bytes_pdfs(self):
+        return self._q("SELECT COALESCE(SUM(tamano), 0) AS n FROM (SELECT MAX(tamano) AS tamano FROM pdfs GROUP BY contenido)")[0]["n"]
+
+    def recortar_pdfs(self, max_bytes):
+        # Saca las entradas menos usadas hasta que los archivos entren en max_bytes.
+        # Devuelve (archivos que quedaron sin entrada, bytes que quedan)
+        with self._lock:
+            total = self.bytes_pdfs()
+            huerfanos = []
+            for f in self._conn.execute("SELECT huella, contenido, tamano FROM pdfs ORDER BY usado").fetchall():
+                if total <= max_bytes: break
+                self._conn.execute("DELETE FROM pdfs WHERE huella = ?", (f["huella"],))
+                if not self._conn.execute("SELECT 1 FROM pdfs WHERE contenido = ? LIMIT 1", (f["contenido"],)).fetchall():
+                    total -= f["tamano"]; huerfanos.append(f["contenido"])
+            return huerfanos, total
+
+    # --- Cola de operaciones pendientes de subir a Sheets (outbox) ---
+    def encolar(self, tipo, payload):
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO pendientes (tipo, payload, creado) VALUES (?, ?, ?)", (tipo, json.dumps(payload, default=_json_default), time.time()))
+            return cur.lastrowid
+
+    def pendientes(self):
+        return [{"id": f["id"], "tipo": f["tipo"], "payload": json.loads(f["payload"])} for f in self._q("SELECT * FROM pendientes ORDER BY id")]
+
+    def total_pendientes(self):
+        return self._q("SELECT COUNT(*) AS n FROM pendientes")[0]["n"]
+
+    def confirmar(self, id_op):
+        self._q("DELETE FROM pendientes WHERE id = ?", (id_op,))
+
+    def marcar_intento(self, id_op):
+        self._q("UPDATE pendientes SET intentos = intentos + 1 WHERE id = ?", (id_op,))
+
+class Sincronizador:
+    # Hilo de fondo: primero sube la cola de pendientes (en orden) y luego refresca las copias
+    # locales de los datasets. Las pantallas leen siempre de SQLite, nunca esperan a Google.
+    def __init__(self, almacen, descargas, subidas, intervalo=INTERVALO_SINCRONIZACION, al_descargar=None):
+        self.almacen = almacen
+        self.descargas = descargas  # nombre -> fn() que devuelve un DataFrame o None si no hay conexión
+        self.subidas = subidas      # tipo -> fn(payload) que lanza excepción si no pudo subir
+        self.intervalo = intervalo
+        self.al_descargar = al_descargar  # fn(nombre, df) para refrescar cachés en memoria (write-through)
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.stats = {"ciclos": 0, "subidas": 0, "descargas": 0, "errores": 0, "ultimo_ciclo": None}
+
+    def arrancar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name="sincronizador-sheets", daemon=True)
+            self._hilo.start()
+
+    def despertar(self):
+        self._evento.set()
+
+    def _bucle(self):
+        while True:
+            self.sincronizar()
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+
+    def subir_pendientes(self):
+        for op in self.almacen.pendientes():
+            fn = self.subidas.get(op["tipo"])
+            try:
+                if fn is None: raise KeyError(op["tipo"])
+                fn(op["payload"])
+            except Exception:
+                # Se corta aquí para no alterar el orden; el próximo ciclo reintenta
+                self.almacen.marcar_intento(op["id"])
+                self.stats["errores"] += 1
+                return False
+            self.almacen.confirmar(op["id"])
+            self.stats["subidas"] += 1
+        return True
+
+    def sincronizar(self):
+        with self._lock:
+            self.stats["ciclos"] += 1
+            if self.subir_pendientes():
+                for nombre, fn in self.descargas.items():
+                    try:
+                        df = fn()
+                        if df is not None and self.almacen.guardar_dataset(nombre, df, si_sin_pendientes=True):
+                            self.stats["descargas"] += 1
+                            if self.al_descargar: self.al_descargar(nombre, df)
+                    except Exception: self.stats["errores"] += 1
+            self.stats["ultimo_ciclo"] = time.time()
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+from datos import PDFS, cargar_catalogo
+from pdf_presupuesto import preparar_activos
+from cotizador import precios_por_tarifa, resolver_spec, registrar, renderizar_pdf, argumentos_pdf
+
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# API HTTP LOCAL DEL COTIZADOR
+# ==========================================
+# Uso:  python api_cotizador.py [--puerto 8765] [--trabajadores N]
+#
+# POST /cotizar con una cotización en JSON (el mismo formato de lote_presupuestos.py):
+#   200 application/pdf con los totales en las cabeceras X-Neto, X-IVA, X-Total y X-Correlativo;
+#   con ?formato=json: {"nombre", "correlativo", "neto", "iva", "total", "pdf_base64"};
+#   400 {"error": ...} si la cotización no es válida. "registrar": true pide correlativo al Historial.
+#   Una cotización idéntica a una ya emitida (mismo día) sale de la caché de PDF sin pasar por el pool.
+# GET /salud: trabajadores, cotizaciones atendidas y tiempos.
+#
+# Los hilos del servidor leen el JSON, resuelven precios en memoria y esperan; el PDF (fpdf es Python
+# puro y el GIL no deja que dos hilos lo aprovechen) se genera en un pool de procesos de un trabajador
+# por núcleo. Solo escucha en 127.0.0.1: no hay autenticación y las fotos por ruta no se aceptan.
+PUERTO = 8765
+MAX_CUERPO = 1024 * 1024
+
+class ServicioCotizador:
+    def __init__(self, trabajadores=None):
+        self.trabajadores = max(1, trabajadores or os.cpu_count() or 1)
+        self._pool = ProcessPoolExecutor(max_workers=self.trabajadores, initializer=preparar_activos)
+        self._lock = threading.Lock()
+        self._catalogo = None
+        self._precios = {}
+        self.stats = {"atendidas": 0, "errores": 0, "en_curso": 0, "max_en_curso": 0, "generados": 0, "pdf_s": 0.0, "total_s": 0.0}
+
+    def arrancar(self):
+        # Levanta los procesos (y sus activos del PDF) antes de la primera cotización
+        self._pool.submit(preparar_activos).result()
+        self.precios()
+
+    def detener(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def precios(self):
+        # El catálogo se recompila al cambiar los precios (o al vencer su ttl): solo entonces se rehace el índice
+        catalogo = cargar_catalogo()
+        with self._lock:
+            if catalogo is not self._catalogo: self._precios, self._catalogo = precios_por_tarifa(catalogo), catalogo
+            return self._precios
+
+    def cotizar(self, spec, con_correlativo=False):
+        t0 = time.perf_counter()
+        spec = {k: v for k, v in spec.items() if k != "fotos"}
+        presupuesto = resolver_spec(spec, self.precios())
+        if con_correlativo: presupuesto = registrar(presupuesto)
+        pdf, _ = PDFS.generar(argumentos_pdf(presupuesto), presupuesto["nombre"], renderizar=self.renderizar)
+        with self._lock:
+            self.stats["atendidas"] += 1
+            self.stats["total_s"] += time.perf_counter() - t0
+        return {"nombre": presupuesto["nombre"], "correlativo": presupuesto["correlativo"], "neto": presupuesto["total_neto"],
+                "iva": presupuesto["iva"], "total": presupuesto["total"], "pdf": pdf}
+
+    def renderizar(self, args):
+        with self._lock:
+            self.stats["en_curso"] += 1
+            self.stats["max_en_curso"] = max(self.stats["max_en_curso"], self.stats["en_curso"])
+        try: pdf, segundos = self._pool.submit(renderizar_pdf, args).result()
+        finally:
+            with self._lock: self.stats["en_curso"] -= 1
+        with self._lock:
+            self.stats["generados"] += 1
+            self.stats["pdf_s"] += segundos
+        return pdf
+
+    def contar_error(self):
+        with self._lock: self.stats["errores"] += 1
+
+    def salud(self):
+        with self._lock: s = dict(self.stats)
+        n, generados = s["atendidas"], s["generados"]
+        return {"trabajadores": self.trabajadores, "atendidas": n, "desde_cache": n - generados, "errores": s["errores"], "en_curso": s["en_curso"],
+                "max_en_curso": s["max_en_curso"], "pdf_ms_promedio": round(s["pdf_s"] * 1000 / generados, 1) if generados else None,
+                "total_ms_promedio": round(s["total_s"] * 1000 / n, 1) if n else None}
+
+class Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: los clientes reutilizan la conexión
+    disable_nagle_algorithm = True  # cabeceras y PDF van en envíos separados: sin esto cada respuesta espera el ACK diferido
+    servicio = None
+
+    def log_message(self, formato, *args): pass
+
+    def responder(self, codigo, cuerpo, tipo="application/json", cabeceras=None):
+        if tipo == "application/json": cuerpo = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for k, v in (cabeceras or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/salud": self.responder(200, self.servicio.salud())
+        else: self.responder(404, {"error": "Ruta desconocida"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        largo = int(self.headers.get("Content-Length") or 0)
+        if url.path != "/cotizar":
+            self.rfile.read(largo); return self.responder(404, {"error": "Ruta desconocida"})
+        if largo > MAX_CUERPO:
+            self.close_connection = True; return self.responder(413, {"error": "Cotización demasiado grande"})
+        try:
+            spec = json.loads(self.rfile.read(largo) or b"{}")
+            if not isinstance(spec, dict): raise ValueError("Se espera un objeto JSON")
+            r = self.servicio.cotizar(spec, con_correlativo=bool(spec.get("registrar")))
+        except (ValueError, TypeError) as e:
+            self.servicio.contar_error()
+            return self.responder(400, {"error": str(e)})
+        except Exception as e:
+            self.servicio.contar_error()
+            return self.responder(500, {"error": f"{type(e).__name__}: {e}"})
+        if parse_qs(url.query).get("formato") == ["json"]:
+            pdf = base64.b64encode(r.pop("pdf")).decode("ascii")
+            return self.responder(200, dict(r, pdf_base64=pdf))
+        self.responder(200, r["pdf"], "application/pdf", {
+            "Content-Disposition": f'attachment; filename="{r["nombre"]}"', "X-Correlativo": str(r["correlativo"]),
+            "X-Neto": str(r["neto"]), "X-IVA": str(r["iva"]), "X-Total": str(r["total"])})
+
+def crear_servidor(servicio, puerto=PUERTO, host="127.0.0.1"):
+    manejador = type("ManejadorCotizador", (Manejador,), {"servicio": servicio})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP local: POST /cotizar devuelve el PDF y los totales")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--trabajadores", type=int, default=os.cpu_count() or 1, help="Procesos que generan PDF")
+    args = parser.parse_args(argv)
+
+    servicio = ServicioCotizador(args.trabajadores)
+    servicio.arrancar()
+    servidor = crear_servidor(servicio, args.puerto)
+    print(f"Cotizador en http://127.0.0.1:{args.puerto} ({servicio.trabajadores} trabajadores)")
+    try: servidor.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        servidor.server_close()
+        servicio.detener()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import json
+import secrets
+import threading
+import time
+from datetime import datetime
+import gspread
+from nube import GESTOR, eliminar_filas
+from metricas import METRICAS, medido
+from planificador import PLANIFICADOR, PRIORIDAD_BORRADOR
+
+# ==========================================
+# AUTOGUARDADO DIFERIDO DEL BORRADOR (WRITE-BEHIND)
+# ==========================================
+VENTANA_AUTOGUARDADO = 2.0  # segundos
+REINTENTO_MAXIMO = 60.0     # tope del backoff tras escrituras fallidas (segundos)
+HOJA_BORRADORES = "Borradores"
+
+class AutoguardadoBorrador:
+    # Junta los cambios rápidos (cada clic en un number_input) y escribe a la nube como
+    # máximo una vez por ventana, desde un hilo aparte para no bloquear el rerun.
+    def __init__(self, escribir, ventana=VENTANA_AUTOGUARDADO):
+        self._escribir = escribir
+        self.ventana = ventana
+        self._cond = threading.Condition()
+        self._lock_escritura = threading.Lock()
+        self._pendientes = {}  # clave -> último payload sin escribir
+        self._plazos = {}      # clave -> instante (monotonic) en que se escribe
+        self._estados = {}     # clave -> "guardado" | "pendiente" | "error"
+        self._fallos = {}      # clave -> escrituras fallidas seguidas (backoff del reintento)
+        self._hilo = None
+        self.stats = {"cambios": 0, "fusionados": 0, "escrituras": 0, "errores": 0}
+
+    def _arrancar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name="autoguardado-borrador", daemon=True)
+            self._hilo.start()
+
+    def encolar(self, clave, payload):
+        with self._cond:
+            self.stats["cambios"] += 1
+            # Tras un error, un cambio nuevo no espera el backoff: se reintenta con la ventana normal
+            if clave in self._plazos and self._estados.get(clave) != "error": self.stats["fusionados"] += 1
+            else: self._plazos[clave] = time.monotonic() + self.ventana
+            self._pendientes[clave] = payload
+            self._estados[clave] = "pendiente"
+            self._arrancar()
+            self._cond.notify()
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._plazos: self._cond.wait()
+                clave, plazo = min(self._plazos.items(), key=lambda kv: kv[1])
+                espera = plazo - time.monotonic()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+            self._escribir_pendiente(clave)
+
+    def _escribir_pendiente(self, clave):
+        with self._lock_escritura:
+            with self._cond:
+                if clave not in self._pendientes: return
+                payload = self._pendientes.pop(clave)
+                self._plazos.pop(clave, None)
+            try: ok = self._escribir(clave, payload) is not False
+            except Exception: ok = False
+            with self._cond:
+                if ok:
+                    self.stats["escrituras"] += 1
+                    self._fallos.pop(clave, None)
+                else:
+                    self.stats["errores"] += 1
+                    self._fallos[clave] = self._fallos.get(clave, 0) + 1
+                if clave in self._pendientes: return  # Llegó un cambio más nuevo mientras se escribía
+                if ok: self._estados[clave] = "guardado"
+                else:
+                    # Se reintenta solo, con backoff exponencial acotado (sin red no queda en bucle)
+                    self._pendientes[clave] = payload
+                    self._plazos[clave] = time.monotonic() + min(REINTENTO_MAXIMO, self.ventana * 2 ** self._fallos[clave])
+                    self._estados[clave] = "error"
+                    self._cond.notify()
+
+    def descartar(self, clave=None):
+        # Olvida lo pendiente sin escribirlo (el borrador se va a borrar); espera la escritura en curso
+        # para que el borrado no le gane
+        with self._lock_escritura:
+            with self._cond:
+                claves = [clave] if clave is not None else list(self._pendientes)
+                for c in claves:
+                    self._pendientes.pop(c, None)
+                    self._plazos.pop(c, None)
+                    self._estados.pop(c, None)
+                    self._fallos.pop(c, None)
+
+    def estado(self, clave):
+        with self._cond:
+            return self._estados.get(clave, "guardado")
+
+# ==========================================
+# BORRADORES POR PATENTE EN LA NUBE (REGISTRO DE DELTAS, SOLO AGREGAR)
+# ==========================================
+# Pestaña "Borradores": [Clave, Version, Actualizado, Estado, Tipo, Ids]. Sheets no tiene escrituras
+# condicionales, así que nadie sobrescribe el estado de otro: cada guardado agrega una fila "delta" con
+# solo los campos que cambiaron respecto de la última versión que este equipo conoce (una llamada, sin
+# leer antes). El borrador es la foto ("estado") de versión más alta más los deltas que esa foto no
+# incluye, en orden de versión: dos equipos que escriben sobre la misma versión suman sus cambios (en una
+# misma clave gana el último agregado). Cada COMPACTAR_CADA deltas propios se agrega una foto nueva con
+# los ids que ya incluye y se eliminan las filas que cubría la foto anterior (toda foto posterior ya las
+# leyó) y las fotos que ya no son la vigente: la pestaña no crece más que los borradores vivos.
+ENCABEZADO_BORRADORES = ["Clave", "Version", "Actualizado", "Estado", "Tipo", "Ids"]
+TIPO_DELTA = "delta"
+TIPO_ESTADO = "estado"
+COMPACTAR_CADA = 20
+
+def delta_borrador(anterior, actual):
+    return {"set": {k: v for k, v in actual.items() if anterior.get(k) != v}, "del": [k for k in anterior if k not in actual]}
+
+def aplicar_delta(estado, delta):
+    nuevo = {k: v for k, v in estado.items() if k not in delta["del"]}
+    nuevo.update(delta["set"])
+    return nuevo
+
+def _json(valor):
+    return json.dumps(valor, separators=(',', ':'), ensure_ascii=False)
+
+def reconstruir_borrador(filas):
+    # filas: [(n_fila, fila)] de una misma clave; None si no hay nada legible. Las filas sin Tipo (formato
+    # anterior, una por borrador) cuentan como fotos.
+    fotos, deltas = [], []
+    for n, fila in filas:
+        fila = list(fila) + [''] * (len(ENCABEZADO_BORRADORES) - len(fila))
+        try: version, contenido = int(fila[1] or 0), json.loads(fila[3])
+        except ValueError: continue
+        if fila[4] == TIPO_DELTA: deltas.append((version, n, fila[5], contenido, fila[2]))
+        else: fotos.append((version, n, set(filter(None, fila[5].split(","))), contenido, fila[2]))
+    if not fotos and not deltas: return None
+    version, n_foto, incluidos, estado, actualizado = max(fotos, key=lambda f: (f[0], f[1])) if fotos else (0, None, set(), {}, "")
+    pendientes = sorted((d for d in deltas if d[2] not in incluidos), key=lambda d: (d[0], d[1]))
+    for v, _, _, delta, cuando in pendientes:
+        estado = aplicar_delta(estado, delta)
+        version, actualizado = max(version, v), cuando or actualizado
+    return {"version": version, "actualizado": actualizado, "estado": estado, "ids": [d[2] for d in deltas], "pendientes": len(pendientes),
+            "conflictos": len(pendientes) - len({d[0] for d in pendientes}),
+            "cubiertas": [f[1] for f in fotos] + [d[1] for d in deltas if d[2] in incluidos]}
+
+class BorradoresNube:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._conocidos = {}    # clave -> (versión, estado) base de los deltas: lo leído al listar más lo que este equipo envió
+        self._sin_compactar = {}  # clave -> deltas agregados desde la última foto conocida
+        self.stats = {"escrituras": 0, "conflictos": 0, "creados": 0, "borrados": 0, "compactaciones": 0}
+
+    def _hoja(self):
+        try: return GESTOR.worksheet(HOJA_BORRADORES)
+        except gspread.WorksheetNotFound:
+            ws = GESTOR.crear_worksheet(HOJA_BORRADORES, rows="100", cols=str(len(ENCABEZADO_BORRADORES)))
+            ws.append_row(ENCABEZADO_BORRADORES)
+            return ws
+
+    @staticmethod
+    def _por_clave(filas):
+        grupos = {}
+        for n, fila in enumerate(filas[1:], 2):
+            if fila and fila[0]: grupos.setdefault(fila[0], []).append((n, fila))
+        return grupos
+
+    def listar(self):
+        # [{clave, version, actualizado, estado}] de todos los borradores vivos; de paso fija las bases de los deltas
+        with self._lock:
+            if not GESTOR.cliente(): return None
+            borradores = []
+            for clave, filas in self._por_clave(self._hoja().get_all_values()).items():
+                r = reconstruir_borrador(filas)
+                if r is None: continue
+                self.stats["conflictos"] += r["conflictos"]
+                self._conocidos[clave] = (r["version"], r["estado"])
+                self._sin_compactar[clave] = r["pendientes"]
+                if r["estado"]: borradores.append({"clave": clave, "version": r["version"], "actualizado": r["actualizado"], "estado": r["estado"]})
+            return borradores
+
+    def escribir(self, clave, estado):
+        with self._lock:
+            ws = self._hoja()
+            version, base = self._conocidos.get(clave, (0, None))
+            # Sin base conocida no se borra nada de lo que haya en la nube: solo se fijan los campos propios
+            delta = delta_borrador(base, estado) if base is not None else {"set": dict(estado), "del": []}
+            if not delta["set"] and not delta["del"]: return True
+            ahora = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+            ws.append_row([clave, version + 1, ahora, _json(delta), TIPO_DELTA, secrets.token_hex(4)], table_range="A1")
+            self._conocidos[clave] = (version + 1, aplicar_delta(base or {}, delta))
+            self.stats["creados" if base is None else "escrituras"] += 1
+            self._sin_compactar[clave] = self._sin_compactar.get(clave, 0) + 1
+            if self._sin_compactar[clave] >= COMPACTAR_CADA:
+                # El delta ya quedó escrito: si la compactación falla se reintenta en el próximo guardado
+                try: self.compactar(clave, ws)
+                except Exception: METRICAS.contar_fallo("compactar_borrador")
+            return True
+
+    def compactar(self, clave, ws=None):
+        with self._lock:
+            ws = ws or self._hoja()
+            filas = self._por_clave(ws.get_all_values()).get(clave, [])
+            r = reconstruir_borrador(filas)
+            if r is None: return
+            ahora = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+            ws.append_row([clave, r["version"], ahora, _json(r["estado"]), TIPO_ESTADO, ",".join(r["ids"])], table_range="A1")
+            # La base de los deltas sigue siendo lo último que este equipo envió: si pasara a ser la foto, el
+            # próximo delta borraría lo que otro equipo agregó y aquí no está
+            version, propio = self._conocidos.get(clave, (0, None))
+            if propio is not None: self._conocidos[clave] = (max(version, r["version"]), propio)
+            self._sin_compactar[clave] = 0
+            self.stats["compactaciones"] += 1
+            # Las fotos anteriores y lo que cubría la vigente: cualquier foto igual o más nueva ya lo incluye
+            contenido = dict(filas)
+            self._eliminar(ws, {n: (clave, (list(contenido[n]) + [''] * 6)[5]) for n in r["cubiertas"]})
+
+    def _eliminar(self, ws, esperadas):
+        # esperadas: {n_fila: (clave, ids)} según una lectura anterior. Otra estación pudo eliminar filas desde
+        # entonces (los números se corren): se releen clave e ids y solo se eliminan las que siguen en su lugar
+        if not esperadas: return
+        claves, ids = ws.col_values(1), ws.col_values(len(ENCABEZADO_BORRADORES))
+        filas = [n for n, (clave, id_fila) in esperadas.items()
+                 if n <= len(claves) and claves[n - 1] == clave and (ids[n - 1] if n <= len(ids) else "") == id_fila]
+        if len(filas) < len(esperadas): self.stats["conflictos"] += 1
+        if filas: eliminar_filas(ws, filas)
+
+    def borrar(self, clave):
+        with self._lock:
+            ws = self._hoja()
+            # Lectura y eliminación seguidas: todas las filas de la clave (fotos y deltas) salen de la pestaña
+            filas = [n for n, c in enumerate(ws.col_values(1), 1) if c == clave and n > 1]
+            self._conocidos.pop(clave, None)
+            self._sin_compactar.pop(clave, None)
+            if not filas: return
+            eliminar_filas(ws, filas)
+            self.stats["borrados"] += 1
+
+BORRADORES_NUBE = BorradoresNube()
+
+@medido("escribir_borrador_nube")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_BORRADOR)
+def escribir_borrador_nube(clave, estado):
+    if not GESTOR.cliente(): return False
+    try: BORRADORES_NUBE.escribir(clave, estado)
+    except Exception:
+        METRICAS.contar_fallo("escribir_borrador_nube"); GESTOR.invalidar(); return False
+
+AUTOGUARDADO = AutoguardadoBorrador(escribir_borrador_nube)
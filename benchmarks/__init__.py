@@ -0,0 +1,4 @@
+# Benchmarks del cotizador. Se ejecutan desde la raíz del repositorio, por ejemplo:
+#   python -m benchmarks.bench_pdf
+#   python -m benchmarks.bench_suite --salida antes.json
+#   python -m benchmarks.bench_suite --comparar antes.json
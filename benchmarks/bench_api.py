@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import tempfile
+import threading
+import statistics
+import http.client
+
+# La base local y la caché de PDF del benchmark van a un directorio temporal (se fija antes de importar datos)
+_TEMPORAL = tempfile.mkdtemp(prefix="bench_api_")
+os.environ.setdefault("COTIZADOR_DB", os.path.join(_TEMPORAL, "bench.db"))
+os.environ.setdefault("COTIZADOR_PDFS", os.path.join(_TEMPORAL, "pdfs"))
+
+import datos
+from nube import GESTOR
+from cotizador import precios_por_tarifa, columna_tarifa
+from api_cotizador import ServicioCotizador, crear_servidor
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# COTIZACIONES POR SEGUNDO CONTRA LA API LOCAL
+# ==========================================
+# python -m benchmarks.bench_api [--clientes 1 4 16] [--segundos 10] [--trabajadores N]
+# Levanta api_cotizador en un puerto libre con la hoja falsa como backend y, para cada nivel de
+# concurrencia, cada cliente manda POST /cotizar sin pausa por una conexión keep-alive propia. Cada
+# cotización lleva un correlativo distinto (todas se generan); la última fila repite siempre las mismas
+# y mide lo que sale de la caché de PDF.
+TARIFAS = ["Hospital Temuco", "SSAS (Servicio Salud)", "Gendarmería de Chile", "Hospital Villarrica"]
+
+def sembrar(cliente):
+    ss = cliente.spreadsheet
+    df = datos.precios_semilla()
+    ss.sheet1.filas = [df.columns.tolist()] + df.values.tolist()
+    ss._hojas.clear()
+    ss.add_worksheet(datos.HOJA_META).filas = [["version_esquema", datos.VERSION_ESQUEMA]]
+    ss.add_worksheet(datos.HOJA_DIRECTORIO).filas = [datos.COLUMNAS_PATENTES] + datos.directorio_por_defecto().values.tolist()
+    ss.add_worksheet("Historial").filas = [datos.ENCABEZADO_HISTORIAL]
+
+def cotizaciones_de_prueba(n_items):
+    # Presupuestos variados: tarifa, cantidad de ítems y un repuesto manual
+    precios = precios_por_tarifa()
+    specs = []
+    for i, tarifa in enumerate(TARIFAS * 4):
+        trabajos = list(precios[columna_tarifa(tarifa)])
+        items = [{"trabajo": trabajos[(i * 7 + k) % len(trabajos)], "cantidad": k % 3 + 1} for k in range(n_items + i % 5)]
+        items.append({"descripcion": "Repuesto especial", "cantidad": 1, "unitario": 45000})
+        specs.append({"patente": f"BENCH{i:02d}", "tarifa": tarifa, "items": items})
+    return specs
+
+_correlativos = itertools.count(1000)
+
+def ronda(puerto, specs, clientes, segundos, repetidas=False):
+    fin = time.monotonic() + segundos
+    tiempos, errores = [], []
+    lock = threading.Lock()
+
+    def cliente(i):
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+        n = i
+        while time.monotonic() < fin:
+            correlativo = n % len(specs) if repetidas else next(_correlativos)
+            cuerpo = json.dumps(dict(specs[n % len(specs)], correlativo=str(correlativo))).encode("utf-8"); n += 1
+            t0 = time.perf_counter()
+            conexion.request("POST", "/cotizar", cuerpo, {"Content-Type": "application/json"})
+            respuesta = conexion.getresponse()
+            pdf = respuesta.read()
+            ms = (time.perf_counter() - t0) * 1000
+            with lock:
+                if respuesta.status == 200 and pdf.startswith(b"%PDF") and respuesta.getheader("X-Total"): tiempos.append(ms)
+                else: errores.append(respuesta.status)
+        conexion.close()
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for h in hilos: h.start()
+    for h in hilos: h.join()
+    dur = time.perf_counter() - t0
+    tiempos.sort()
+    return {"cotizaciones": len(tiempos), "por_segundo": len(tiempos) / dur, "p50_ms": statistics.median(tiempos) if tiempos else 0.0,
+            "p95_ms": tiempos[int(len(tiempos) * 0.95)] if tiempos else 0.0, "errores": len(errores)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cotizaciones por segundo de la API local con 1, 4 y 16 clientes concurrentes")
+    parser.add_argument("--clientes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--trabajadores", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--items", type=int, default=12, help="Ítems base por cotización")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    sembrar(conectar_hoja_falsa(GESTOR, args.latencia))
+    servicio = ServicioCotizador(args.trabajadores)
+    servicio.arrancar()
+    servidor = crear_servidor(servicio, puerto=0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    puerto = servidor.server_address[1]
+    specs = cotizaciones_de_prueba(args.items)
+    ronda(puerto, specs, 1, 1.0)  # calentamiento: conexiones, catálogo e índice de precios
+    ronda(puerto, specs, 1, 1.0, repetidas=True)
+
+    print(f"API en 127.0.0.1:{puerto}, {servicio.trabajadores} trabajadores ({os.cpu_count()} núcleos)")
+    print(f"{'Clientes':>8} {'Cotiz.':>7} {'Cotiz./s':>9} {'p50':>9} {'p95':>9} {'Errores':>8}")
+    for clientes in args.clientes:
+        r = ronda(puerto, specs, clientes, args.segundos)
+        print(f"{clientes:>8} {r['cotizaciones']:>7} {r['por_segundo']:>9.1f} {r['p50_ms']:>6.0f} ms {r['p95_ms']:>6.0f} ms {r['errores']:>8}")
+    clientes = max(args.clientes)
+    r = ronda(puerto, specs, clientes, args.segundos, repetidas=True)
+    print(f"{clientes:>8} {r['cotizaciones']:>7} {r['por_segundo']:>9.1f} {r['p50_ms']:>6.0f} ms {r['p95_ms']:>6.0f} ms {r['errores']:>8}  (idénticas: caché de PDF)")
+    print(f"Servicio: {servicio.salud()}")
+    servidor.shutdown(); servidor.server_close()
+    servicio.detener()
+
+if __name__ == "__main__":
+    sys.exit(main())
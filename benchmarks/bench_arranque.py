@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# ==========================================
+# TIEMPO HASTA EL PRIMER PINTADO (SESIÓN EN FRÍO)
+# ==========================================
+# python -m benchmarks.bench_arranque [--latencia 0.3] [--repeticiones 5] [--raiz otro/checkout]
+# Cada repetición es un proceso nuevo con una base local vacía y una hoja falsa con latencia por llamada:
+# mide cuánto tarda el primer rerun de app.py en dejar dibujada la pantalla de la patente (paso 1) y
+# cuánto hasta que la precarga tiene listos todos los datasets (precios, patentes, borradores, vehículos).
+# Con --raiz se mide otro checkout (p. ej. un git worktree del commit anterior) para comparar.
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIJO = """
+import os, sys, json, time, logging, tempfile, io
+os.environ["COTIZADOR_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench_arranque_"), "arranque.db")
+sys.path.insert(0, os.getcwd())
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import datos
+from nube import GESTOR
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+importar_ms = (time.perf_counter() - t0) * 1000
+for nombre in list(logging.root.manager.loggerDict):
+    if nombre.startswith("streamlit"): logging.getLogger(nombre).setLevel(logging.ERROR)
+cliente = conectar_hoja_falsa(GESTOR, {latencia})
+ss = cliente.spreadsheet
+df = datos.pd.read_csv(io.StringIO(datos.DATOS_MAESTROS))
+ss.sheet1.filas = [df.columns.tolist()] + df.values.tolist()
+ss.add_worksheet("Directorio_Patentes").filas = [["Patente", "Institucion"]] + datos.directorio_por_defecto().values.tolist()
+at = AppTest.from_file("app.py", default_timeout=600)
+t1 = time.perf_counter()
+at.run()
+primer_ms = (time.perf_counter() - t1) * 1000
+# Hasta que la precarga deja listos todos los datasets que piden los pasos siguientes
+for nombre in datos.PRECARGA.stats: datos.PRECARGA.esperar(nombre, 600)
+precarga_ms = (time.perf_counter() - t1) * 1000
+print(json.dumps({{"importar_ms": importar_ms, "primer_pintado_ms": primer_ms, "datos_listos_ms": precarga_ms, "paso_1": len(at.text_input(key="input_patente_inicio").value or "") == 0,
+                   "excepciones": len(at.exception)}}))
+"""
+
+def medir_en_frio(raiz, latencia):
+    salida = subprocess.run([sys.executable, "-c", HIJO.format(latencia=latencia)], cwd=raiz, capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer pintado de una sesión en frío")
+    parser.add_argument("--latencia", type=float, default=0.3, help="Segundos por llamada a la hoja falsa")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--raiz", default=RAIZ_REPO, help="Checkout a medir (por defecto, este)")
+    args = parser.parse_args(argv)
+
+    corridas = [medir_en_frio(args.raiz, args.latencia) for _ in range(args.repeticiones)]
+    if any(c["excepciones"] or not c["paso_1"] for c in corridas): print("⚠️ Alguna corrida no llegó a dibujar el paso 1")
+    for clave, nombre in (("importar_ms", "Importar módulos"), ("primer_pintado_ms", "Primer pintado (paso 1)"), ("datos_listos_ms", "Datasets listos")):
+        valores = sorted(c[clave] for c in corridas)
+        print(f"{nombre:<26} mediana {statistics.median(valores):>9.1f} ms  mín {valores[0]:>9.1f} ms  máx {valores[-1]:>9.1f} ms")
+
+if __name__ == "__main__":
+    sys.exit(main())
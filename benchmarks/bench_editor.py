@@ -0,0 +1,108 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+# La base local del benchmark va a un directorio temporal (se fija antes de importar datos)
+os.environ.setdefault("COTIZADOR_DB", os.path.join(tempfile.mkdtemp(prefix="bench_editor_"), "bench.db"))
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+import datos
+from nube import GESTOR
+from metricas import METRICAS
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# LATENCIA DE UN CAMBIO DE CANTIDAD EN EL PASO 2
+# ==========================================
+# python -m benchmarks.bench_editor [--trabajos 50 500 5000] [--repeticiones 5]
+# "Antes": cada cambio rerenderizaba el script completo con un number_input por trabajo.
+# "Ahora": el cambio solo reejecuta el fragmento editor_presupuesto (grillas + Resumen Final).
+RUTA_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+TARIFA = "SSAS (Servicio Salud)"
+
+def precios_sinteticos(n):
+    categorias = list(pd.read_csv(io.StringIO(datos.DATOS_MAESTROS))['Categoria'].unique())
+    filas = [[categorias[i % len(categorias)], f"Trabajo sintético N° {i}"] + [95000 + 1000 * i] * len(datos.COLUMNAS_TARIFA) for i in range(n)]
+    return pd.DataFrame(filas, columns=datos.COLUMNAS_PRECIOS)
+
+def editor_antes(grupos):
+    # Réplica del editor anterior: columnas + markdown + number_input por cada trabajo (con etiqueta,
+    # para no medir el aviso de accesibilidad que Streamlit registra por cada etiqueta vacía)
+    # AppTest.from_function ejecuta solo el cuerpo de esta función: los imports del módulo no llegan aquí
+    import time
+    import streamlit as st
+    t0 = time.perf_counter()
+    tabs = st.tabs(list(grupos))
+    for i, grupo in enumerate(grupos.values()):
+        with tabs[i]:
+            for trabajo, key_input, precio in zip(grupo["trabajos"], grupo["claves"], grupo["precios"]):
+                with st.container():
+                    c1, c2, c3 = st.columns([5.5, 1.5, 2], vertical_alignment="center")
+                    with c1: st.markdown(f"**{trabajo}**")
+                    c2.number_input("Cantidad", 0, 20, value=st.session_state.get(key_input, 0), key=key_input, label_visibility="collapsed")
+                    with c3: st.markdown(f"**${precio:,.0f}**")
+    st.session_state["_editor_ms"] = (time.perf_counter() - t0) * 1000
+
+def ultimo_ms(nombre):
+    return next((e["ultimo_ms"] for e in METRICAS.resumen() if e["nombre"] == nombre), 0.0)
+
+def medir_catalogo(cliente, n, repeticiones):
+    df = precios_sinteticos(n)
+    cliente.spreadsheet.sheet1.filas = [df.columns.tolist()] + df.values.tolist()
+    datos.ALMACEN.guardar_dataset("precios", df)
+    datos.cargar_datos.escribir(df)
+    grupos = datos.cargar_catalogo()["tarifas"][datos.TARIFA_A_COLUMNA[TARIFA]]
+    claves = [c for g in grupos.values() for c in g["claves"]]
+
+    antes = AppTest.from_function(editor_antes, args=(grupos,), default_timeout=600).run()
+    editor_antes_ms = []
+    for r in range(repeticiones):
+        antes.session_state[claves[r % len(claves)]] = 1 + r % 20
+        antes.run()
+        editor_antes_ms.append(antes.session_state["_editor_ms"])
+
+    at = AppTest.from_file(RUTA_APP, default_timeout=600)
+    at.session_state.paso_actual = 2
+    at.session_state.patente_confirmada = "BENCH01"
+    at.session_state.tipo_cliente_confirmado = TARIFA
+    at.session_state.usuario_final_confirmado = "HOSPITAL BENCH"
+    at.run()
+    if at.exception: raise RuntimeError(at.exception[0].message)
+    completo_ms, fragmento_ms = [], []
+    for r in range(repeticiones):
+        at.session_state[claves[r % len(claves)]] = 1 + r % 20
+        at.run()
+        completo_ms.append(ultimo_ms("rerun completo"))
+        fragmento_ms.append(ultimo_ms("editor_presupuesto"))
+
+    completo, fragmento = statistics.median(completo_ms), statistics.median(fragmento_ms)
+    resto = max(completo - fragmento, 0.0)
+    return {"trabajos": len(claves), "editor_antes_ms": statistics.median(editor_antes_ms), "editor_grilla_ms": fragmento,
+            "resto_script_ms": resto, "cambio_antes_ms": resto + statistics.median(editor_antes_ms), "cambio_ahora_ms": fragmento}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia de un cambio de cantidad en el paso 2, antes y después del fragmento")
+    parser.add_argument("--trabajos", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    cliente = conectar_hoja_falsa(GESTOR)
+    print(f"{'Trabajos':>8} {'Editor antes':>13} {'Editor grilla':>14} {'Resto script':>13} {'Cambio antes':>13} {'Cambio ahora':>13} {'Mejora':>7}")
+    for n in args.trabajos:
+        t0 = time.perf_counter()
+        r = medir_catalogo(cliente, n, args.repeticiones)
+        print(f"{r['trabajos']:>8} {r['editor_antes_ms']:>10.1f} ms {r['editor_grilla_ms']:>11.1f} ms {r['resto_script_ms']:>10.1f} ms "
+              f"{r['cambio_antes_ms']:>10.1f} ms {r['cambio_ahora_ms']:>10.1f} ms {r['cambio_antes_ms'] / max(r['cambio_ahora_ms'], 0.001):>6.1f}x"
+              f"  ({time.perf_counter() - t0:.0f} s)")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+# La base local del benchmark va a un directorio temporal (se fija antes de importar datos)
+os.environ.setdefault("COTIZADOR_DB", os.path.join(tempfile.mkdtemp(prefix="bench_importacion_"), "bench.db"))
+
+import pandas as pd
+import datos
+import importacion
+from nube import GESTOR
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# IMPORTACIÓN MASIVA: UNA FILA POR LLAMADA VS ESCRITURAS POR LOTES
+# ==========================================
+# python -m benchmarks.bench_importacion [--filas 1000 5000] [--latencia 0.3] [--muestra 20]
+# "Antes": cada trabajo era un append_row (guardar_nuevo_item); se mide una muestra y se proyecta a N
+# (sin contar el cupo de 60 escrituras por minuto, que lo llevaría a N / 60 minutos como mínimo).
+# "Ahora": importar() con N trabajos nuevos + 10 % de actualizaciones sobre la lista sembrada.
+def archivo_sintetico(n, base):
+    categorias = list(base['Categoria'].unique())
+    filas = [[categorias[i % len(categorias)], f"Trabajo importado N° {i}", 50000 + 100 * i] for i in range(n)]
+    # Una de cada diez filas corrige el precio de un trabajo que ya está en la hoja
+    filas += [[c, t, int(p) + 1000] for c, t, p in base[['Categoria', 'Trabajo', 'Costo_SSAS']].values[:max(1, n // 10)]]
+    buf = io.StringIO()
+    pd.DataFrame(filas, columns=["Categoria", "Trabajo", "Costo_SSAS"]).to_csv(buf, index=False)
+    return buf.getvalue().encode("utf-8")
+
+def sembrar(cliente):
+    base = datos.precios_semilla()
+    ss = cliente.spreadsheet
+    ss.sheet1.filas = [base.columns.tolist()] + base.values.tolist()
+    ss._hojas.clear()
+    ss.add_worksheet(datos.HOJA_META).filas = [["version_esquema", datos.VERSION_ESQUEMA]]
+    datos.ALMACEN.guardar_dataset("precios", base)
+    datos.cargar_datos.escribir(base)
+    return base
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importación masiva de trabajos: append_row por fila vs escrituras por lotes")
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--latencia", type=float, default=0.3, help="Segundos por llamada a la hoja falsa")
+    parser.add_argument("--latencia-por-fila", type=float, default=0.0002, help="Segundos extra por fila enviada")
+    parser.add_argument("--muestra", type=int, default=20, help="Filas a subir una por una para proyectar el 'antes'")
+    args = parser.parse_args(argv)
+
+    cliente = conectar_hoja_falsa(GESTOR, args.latencia, args.latencia_por_fila)
+    print(f"{'Filas':>6} {'Antes (proy.)':>14} {'Llamadas':>9} {'Ahora':>9} {'Llamadas':>9} {'Filas/s':>9} {'Local':>9} {'Mejora':>8}")
+    for n in args.filas:
+        base = sembrar(cliente)
+        ws = cliente.spreadsheet.sheet1
+        t0 = time.perf_counter()
+        for i in range(args.muestra): ws.append_row([base['Categoria'][0], f"Muestra {i}", 1000] + [''] * len(datos.REGLAS_PRECIO))
+        por_fila = (time.perf_counter() - t0) / args.muestra
+
+        sembrar(cliente)
+        GESTOR.worksheet(datos.HOJA_PRINCIPAL)  # handshake fuera de la medición
+        previa = importacion.preparar_importacion("precios", "bench.csv", archivo_sintetico(n, base))
+        llamadas_antes = cliente.red.total_llamadas()
+        informe = importacion.importar(previa)
+        llamadas = cliente.red.total_llamadas() - llamadas_antes
+        if informe["en_cola"] or informe["nuevas"] != n: raise RuntimeError(f"Importación incompleta: {informe}")
+        if len(ws.filas) != len(base) + n + 1: raise RuntimeError("La hoja no quedó con todas las filas")
+        n_total = informe["validas"]
+        antes_s = por_fila * n_total
+        print(f"{n_total:>6} {antes_s:>12.1f} s {n_total:>9} {informe['nube_s']:>7.2f} s {llamadas:>9} {informe['filas_por_segundo']:>9,.0f} "
+              f"{informe['local_ms']:>6.0f} ms {antes_s / max(informe['nube_s'], 0.001):>7.0f}x")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import argparse
+import statistics
+import time
+from pdf_presupuesto import ACTIVOS, encontrar_imagen, generar_pdf_exacto
+
+# Tiempo por PDF "antes" (registro vacío: cada PDF resuelve y decodifica sus imágenes, como hacía
+# PDF.header) y "después" (registro caliente, imágenes ya decodificadas y compartidas), con las imágenes
+# originales y con las variantes de impresión del encabezado, más el tamaño del PDF resultante.
+ITEMS = [{"Descripción": f"Trabajo de prueba N° {i}", "Cantidad": i % 3 + 1, "Unitario_Costo": 100000 + i * 5000, "Total_Costo": (100000 + i * 5000) * (i % 3 + 1)} for i in range(25)]
+
+def generar(is_official):
+    total = sum(x['Total_Costo'] for x in ITEMS)
+    return generar_pdf_exacto("HXRP10", "MERCEDES-BENZ SPRINTER", "KAUFMANN S.A.", "92.475.000-6", ITEMS, total, is_official,
+                              encontrar_imagen("ambulancia"), "En Espera de Aprobación", "HOSPITAL TEMUCO", "", "1234", [])
+
+def medir(is_official, repeticiones, en_frio):
+    tiempos = []
+    for _ in range(repeticiones):
+        if en_frio: ACTIVOS.limpiar()
+        t0 = time.perf_counter()
+        pdf = generar(is_official)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos), len(pdf)
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo por PDF de generar_pdf_exacto con y sin el registro de imágenes")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'Tipo':<12} {'Imágenes':<10} {'Antes (ms)':>12} {'Después (ms)':>14} {'Mejora':>8} {'PDF (KB)':>10}")
+    for is_official, nombre in ((False, "Presupuesto"), (True, "Oficial")):
+        for usar_variantes, imagenes in ((False, "originales"), (True, "variantes")):
+            ACTIVOS.usar_variantes = usar_variantes
+            antes, _ = medir(is_official, args.repeticiones, en_frio=True)
+            medir(is_official, 1, en_frio=False)
+            despues, tamano = medir(is_official, args.repeticiones, en_frio=False)
+            print(f"{nombre:<12} {imagenes:<10} {antes:>12.1f} {despues:>14.1f} {antes / despues:>7.1f}x {tamano / 1024:>10.1f}")
+    ACTIVOS.usar_variantes = True
+
+if __name__ == "__main__":
+    main()
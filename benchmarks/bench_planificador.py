@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+
+# La base local del benchmark va a un directorio temporal (se fija antes de importar datos)
+os.environ.setdefault("COTIZADOR_DB", os.path.join(tempfile.mkdtemp(prefix="bench_planificador_"), "bench.db"))
+
+import datos
+from nube import GESTOR
+from autoguardado import BORRADORES_NUBE, escribir_borrador_nube
+from planificador import PLANIFICADOR, Planificador
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# DÍA AJETREADO CONTRA EL CUPO DE SHEETS
+# ==========================================
+# python -m benchmarks.bench_planificador [--sesiones 8] [--segundos 20] [--cupo 60] [--periodo 6]
+# Varias sesiones guardan borradores sin parar y cada tanto emiten una cotización, mientras el
+# sincronizador refresca precios y patentes. La hoja falsa responde 429 al pasar el cupo (por defecto
+# 60 por cada 6 s: el minuto real comprimido 10 veces). "Antes": cada llamada iba directo a la API.
+class SinPlanificar:
+    stats = {}
+    def ejecutar(self, tipo, fn, *args, repetible=True, **kwargs): return fn(*args, **kwargs)
+
+def sembrar(cliente):
+    ss = cliente.spreadsheet
+    df = datos.precios_semilla()
+    ss.sheet1.filas = [df.columns.tolist()] + df.values.tolist()
+    ss._hojas.clear()
+    ss.add_worksheet(datos.HOJA_META).filas = [["version_esquema", datos.VERSION_ESQUEMA]]
+    ss.add_worksheet(datos.HOJA_DIRECTORIO).filas = [datos.COLUMNAS_PATENTES] + datos.directorio_por_defecto().values.tolist()
+    ss.add_worksheet("Historial").filas = [datos.ENCABEZADO_HISTORIAL]
+    ss.add_worksheet("Borradores").filas = [["Clave", "Version", "Actualizado", "Estado"]]
+
+def escenario(cliente, planificador, args):
+    sembrar(cliente)
+    GESTOR.configurar(planificador=planificador)
+    BORRADORES_NUBE._conocidos, BORRADORES_NUBE._sin_compactar = {}, {}
+    rechazos_antes = cliente.red.rechazos
+    fin = time.monotonic() + args.segundos
+    resultados = {"cotizaciones": [], "borradores_ok": 0, "borradores_error": 0}
+    lock = threading.Lock()
+
+    def sesion(i):
+        proxima_cotizacion = time.monotonic() + args.cada_cotizacion * (i + 1) / args.sesiones
+        n = 0
+        while time.monotonic() < fin:
+            n += 1
+            ok = escribir_borrador_nube(f"BENCH{i:02d}", {"paso_actual": 2, "n": n}) is not False
+            with lock: resultados["borradores_ok" if ok else "borradores_error"] += 1
+            if time.monotonic() >= proxima_cotizacion:
+                t0 = time.perf_counter()
+                correlativo = datos.obtener_y_registrar_correlativo(f"BENCH{i:02d}", "HOSPITAL BENCH", 100000)
+                with lock: resultados["cotizaciones"].append(((time.perf_counter() - t0) * 1000, str(correlativo).startswith("P-")))
+                proxima_cotizacion += args.cada_cotizacion
+            time.sleep(args.cada_borrador)
+
+    def sincronizador():
+        # Las mismas descargas (con prioridad de fondo) que corre el Sincronizador en cada ciclo
+        while time.monotonic() < fin:
+            for descargar in datos.SINCRONIZADOR.descargas.values():
+                try: descargar()
+                except Exception: pass
+            time.sleep(args.periodo)
+
+    hilos = [threading.Thread(target=sesion, args=(i,)) for i in range(args.sesiones)] + [threading.Thread(target=sincronizador)]
+    for h in hilos: h.start()
+    for h in hilos: h.join()
+    tiempos = sorted(ms for ms, _ in resultados["cotizaciones"]) or [0.0]
+    return {"cotizaciones": len(resultados["cotizaciones"]), "provisorias": sum(p for _, p in resultados["cotizaciones"]),
+            "cotizacion_p50_ms": statistics.median(tiempos), "cotizacion_max_ms": tiempos[-1],
+            "borradores_ok": resultados["borradores_ok"], "borradores_error": resultados["borradores_error"],
+            "respuestas_429": cliente.red.rechazos - rechazos_antes, "planificador": dict(planificador.stats)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cotizaciones y borradores contra el cupo de Sheets, con y sin planificador")
+    parser.add_argument("--sesiones", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=20)
+    parser.add_argument("--cupo", type=int, default=60, help="Lecturas (y escrituras) permitidas por período")
+    parser.add_argument("--periodo", type=float, default=6.0, help="Segundos que representan el minuto del cupo")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--cada-borrador", type=float, default=0.2, help="Segundos entre guardados de borrador por sesión")
+    parser.add_argument("--cada-cotizacion", type=float, default=4.0, help="Segundos entre cotizaciones por sesión")
+    args = parser.parse_args(argv)
+
+    cliente = conectar_hoja_falsa(GESTOR, args.latencia, cupo=args.cupo, periodo=args.periodo)
+    escala = args.periodo / 60.0
+    modos = {"Antes (directo)": SinPlanificar(),
+             "Ahora (planificador)": Planificador(cupos={"lectura": args.cupo, "escritura": args.cupo}, rafaga=max(1, args.cupo // 6),
+                                                  periodo=args.periodo, dormir=lambda s: time.sleep(s * escala))}
+    print(f"{'Modo':<22} {'Cotiz.':>6} {'Provis.':>7} {'p50 cotiz.':>11} {'máx cotiz.':>11} {'Borr. ok':>8} {'Borr. err':>9} {'429':>5} {'Reint.':>6} {'Máx fila':>8}")
+    for nombre, planificador in modos.items():
+        r = escenario(cliente, planificador, args)
+        p = r["planificador"]
+        print(f"{nombre:<22} {r['cotizaciones']:>6} {r['provisorias']:>7} {r['cotizacion_p50_ms']:>8.0f} ms {r['cotizacion_max_ms']:>8.0f} ms "
+              f"{r['borradores_ok']:>8} {r['borradores_error']:>9} {r['respuestas_429']:>5} {p.get('reintentos', 0):>6} {p.get('max_en_fila', 0):>8}")
+    GESTOR.configurar(planificador=PLANIFICADOR)
+
+if __name__ == "__main__":
+    sys.exit(main())
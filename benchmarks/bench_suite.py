@@ -0,0 +1,146 @@
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+# La base local del benchmark va a un directorio temporal (se fija antes de importar datos)
+os.environ.setdefault("COTIZADOR_DB", os.path.join(tempfile.mkdtemp(prefix="bench_cotizador_"), "bench.db"))
+
+from PIL import Image
+import datos
+from nube import GESTOR
+from pdf_presupuesto import encontrar_imagen, generar_pdf_exacto, limpiar_cache_fotos
+from historial import CacheHistorial
+from benchmarks.hoja_falsa import conectar_hoja_falsa
+
+# Fuera de `streamlit run` los cachés avisan en cada llamada que no hay ScriptRunContext
+for _nombre in list(logging.root.manager.loggerDict):
+    if _nombre.startswith("streamlit"): logging.getLogger(_nombre).setLevel(logging.ERROR)
+
+# ==========================================
+# SUITE DE BENCHMARKS CON HOJA FALSA
+# ==========================================
+# python -m benchmarks.bench_suite [--latencia 0.05] [--salida resultados.json] [--comparar base.json]
+
+def medir(fn, repeticiones, preparar=None, red=None, por_llamada=1):
+    tiempos = []
+    llamadas_antes = red.total_llamadas() if red else 0
+    for _ in range(repeticiones):
+        if preparar: preparar()
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000 / por_llamada)
+    tiempos.sort()
+    return {
+        "mediana_ms": round(statistics.median(tiempos), 4),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 4),
+        "min_ms": round(tiempos[0], 4),
+        "repeticiones": repeticiones,
+        "llamadas_sheets": ((red.total_llamadas() - llamadas_antes) / repeticiones) if red else 0,
+    }
+
+def fotos_sinteticas(n):
+    fotos = []
+    for i in range(n):
+        img = Image.effect_noise((2400, 1800), 30 + i % 20).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=85)
+        fotos.append(buf.getvalue())
+    return fotos
+
+def sembrar(cliente, n_patentes, n_historial):
+    ss = cliente.spreadsheet
+    df = datos.pd.read_csv(io.StringIO(datos.DATOS_MAESTROS))
+    ss.sheet1.filas = [df.columns.tolist()] + df.values.tolist()
+    directorio = datos.directorio_por_defecto().values.tolist()
+    directorio += [[f"BK{i:04d}", "HOSPITAL VILLARRICA" if i % 2 else "GENDARMERÍA DE CHILE"] for i in range(max(0, n_patentes - len(directorio)))]
+    ss.add_worksheet("Directorio_Patentes").filas = [["Patente", "Institucion"]] + directorio
+    ss.add_worksheet("Historial").filas = [datos.ENCABEZADO_HISTORIAL] + [["01/01/2026", "10:00:00", str(i), "HXRP10", "HOSPITAL TEMUCO", "$100.000"] for i in range(1, n_historial + 1)]
+    cliente.red.llamadas.clear()
+
+def version_git():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception: return None
+
+def ejecutar(args):
+    cliente = conectar_hoja_falsa(GESTOR, args.latencia, args.latencia_por_fila)
+    sembrar(cliente, args.patentes, args.historial)
+    red = cliente.red
+    rep = args.repeticiones
+    resultados = {}
+
+    def en_frio(nombre_dataset, fn_cacheada):
+        def preparar():
+            fn_cacheada.clear()
+            datos.ALMACEN.borrar_dataset(nombre_dataset)
+        return preparar
+
+    resultados["cargar_datos (nube)"] = medir(datos.cargar_datos, rep, en_frio("precios", datos.cargar_datos), red)
+    resultados["cargar_datos (local)"] = medir(datos.cargar_datos, rep, datos.cargar_datos.clear, red)
+    resultados["cargar_directorio_patentes (nube)"] = medir(datos.cargar_directorio_patentes, rep, en_frio("patentes", datos.cargar_directorio_patentes), red)
+    resultados["cargar_directorio_patentes (local)"] = medir(datos.cargar_directorio_patentes, rep, datos.cargar_directorio_patentes.clear, red)
+
+    patentes = [f"BK{i:04d}" for i in range(0, args.patentes, max(1, args.patentes // 100))] + ["HX-RP10", "ZZZZ99"]
+    def detectar_todas():
+        for p in patentes: datos.detectar_cliente_automatico(p)
+    datos.detectar_cliente_automatico("HXRP10")
+    resultados["detectar_cliente_automatico"] = medir(detectar_todas, rep, None, red, por_llamada=len(patentes))
+    resultados["detectar_cliente_automatico (recompila índice)"] = medir(lambda: datos.detectar_cliente_automatico("HXRP10"), rep, datos.cargar_indice_patentes.clear, red)
+
+    resultados["obtener_y_registrar_correlativo"] = medir(lambda: datos.obtener_y_registrar_correlativo("HXRP10", "HOSPITAL TEMUCO", "$100.000"), rep, None, red)
+
+    hist = CacheHistorial(datos.ALMACEN)
+    hist.actualizar(forzar=True)
+    resultados["historial: actualizar sin filas nuevas"] = medir(lambda: hist.actualizar(forzar=True), rep, None, red)
+    resultados["historial: agregados"] = medir(hist.agregados, rep, lambda: setattr(hist, "_agregados", None), red)
+
+    items = [{"Descripción": f"Trabajo de prueba N° {i}", "Cantidad": 1 + i % 3, "Unitario_Costo": 95000 + 1000 * i, "Total_Costo": (95000 + 1000 * i) * (1 + i % 3)} for i in range(15)]
+    total = sum(x["Total_Costo"] for x in items)
+    fotos = fotos_sinteticas(max(args.fotos))
+    for n in args.fotos:
+        def generar(n=n):
+            generar_pdf_exacto("HXRP10", "MERCEDES-BENZ SPRINTER", "KAUFMANN S.A.", "92.475.000-6", items, total, False, encontrar_imagen("ambulancia"),
+                               "En Espera de Aprobación", "HOSPITAL TEMUCO", "", "1234", [io.BytesIO(b) for b in fotos[:n]])
+        resultados[f"generar_pdf_exacto ({n} fotos)"] = medir(generar, max(3, rep // 4) if n else rep, limpiar_cache_fotos, red)
+
+    return {"commit": version_git(), "fecha": datetime.now().isoformat(timespec="seconds"),
+            "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")}, "resultados": resultados}
+
+def comparar(actual, base):
+    print(f"\nComparación contra {base.get('commit') or 'base'}:")
+    for nombre, r in actual["resultados"].items():
+        b = base.get("resultados", {}).get(nombre)
+        if not b or not b["mediana_ms"]: continue
+        ratio = r["mediana_ms"] / b["mediana_ms"]
+        marca = "  <-- REGRESIÓN" if ratio > 1.2 else ""
+        print(f"  {nombre:<50} {b['mediana_ms']:>10.3f} -> {r['mediana_ms']:>10.3f} ms ({ratio:.2f}x){marca}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide los caminos calientes del cotizador contra una hoja de Google falsa")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Segundos por llamada a la hoja falsa")
+    parser.add_argument("--latencia-por-fila", type=float, default=0.0, help="Segundos extra por fila transferida")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--patentes", type=int, default=2000, help="Tamaño del directorio de patentes sembrado")
+    parser.add_argument("--historial", type=int, default=5000, help="Filas previas en Historial")
+    parser.add_argument("--fotos", type=int, nargs="+", default=[0, 4, 20])
+    parser.add_argument("--salida", default="bench_resultados.json")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    args = parser.parse_args(argv)
+
+    informe = ejecutar(args)
+    for nombre, r in informe["resultados"].items():
+        print(f"{nombre:<50} mediana {r['mediana_ms']:>10.3f} ms  p95 {r['p95_ms']:>10.3f} ms  llamadas/rep {r['llamadas_sheets']:.1f}")
+    with open(args.salida, "w", encoding="utf-8") as f: json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f: comparar(informe, json.load(f))
+
+if __name__ == "__main__":
+    sys.exit(main())
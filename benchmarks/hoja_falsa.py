@@ -0,0 +1,212 @@
+import re
+import time
+import itertools
+import threading
+from collections import deque
+import gspread
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from planificador import Planificador, CUPO_POR_MINUTO
+
+# ==========================================
+# DOBLE EN MEMORIA DE GSPREAD (SOLO LO QUE USA EL COTIZADOR)
+# ==========================================
+# Cada llamada "de red" duerme `latencia` segundos (+ `latencia_por_fila` por fila leída o escrita)
+# y se cuenta en `llamadas`, para medir los caminos calientes sin credenciales de Google. Con `cupo`
+# responde 429 como la API cuando las lecturas o las escrituras pasan de `cupo` por `periodo` segundos.
+OPERACIONES_LECTURA = {"get_all_values", "get", "get_all_records", "col_values", "row_values", "acell", "worksheet"}
+
+class RespuestaFalsa:
+    status_code = 429
+    text = "Quota exceeded"
+    def json(self): return {"error": {"code": 429, "message": "Quota exceeded for quota metric 'Requests per minute per user'", "status": "RESOURCE_EXHAUSTED"}}
+
+class Latencia:
+    def __init__(self, latencia=0.0, latencia_por_fila=0.0, cupo=None, periodo=60.0):
+        self.latencia = latencia
+        self.latencia_por_fila = latencia_por_fila
+        self.cupo = cupo
+        self.periodo = periodo
+        self.llamadas = {}
+        self.rechazos = 0
+        self._ventanas = {"lectura": deque(), "escritura": deque()}
+        self._lock = threading.Lock()
+
+    def _dentro_del_cupo(self, operacion):
+        if self.cupo is None or operacion in ("authorize", "open"): return True
+        ventana = self._ventanas["lectura" if operacion in OPERACIONES_LECTURA else "escritura"]
+        ahora = time.monotonic()
+        while ventana and ahora - ventana[0] >= self.periodo: ventana.popleft()
+        if len(ventana) >= self.cupo:
+            self.rechazos += 1; return False
+        ventana.append(ahora)
+        return True
+
+    def esperar(self, operacion, filas=0):
+        with self._lock:
+            self.llamadas[operacion] = self.llamadas.get(operacion, 0) + 1
+            permitida = self._dentro_del_cupo(operacion)
+        if not permitida:
+            time.sleep(self.latencia)
+            raise gspread.exceptions.APIError(RespuestaFalsa())
+        segundos = self.latencia + self.latencia_por_fila * filas
+        if segundos > 0: time.sleep(segundos)
+
+    def total_llamadas(self):
+        with self._lock: return sum(self.llamadas.values())
+
+class CeldaFalsa:
+    def __init__(self, value): self.value = value
+
+_IDS_HOJAS = itertools.count()
+
+class WorksheetFalsa:
+    def __init__(self, title, red, filas=None):
+        self.title = title
+        self.id = next(_IDS_HOJAS)
+        self._red = red
+        self._lock = threading.Lock()
+        self.filas = [list(f) for f in (filas or [])]
+
+    def _valor(self, fila, col):
+        return self.filas[fila][col] if fila < len(self.filas) and col < len(self.filas[fila]) else ''
+
+    def _escribir(self, fila, col, valor):
+        while len(self.filas) <= fila: self.filas.append([])
+        while len(self.filas[fila]) <= col: self.filas[fila].append('')
+        self.filas[fila][col] = valor
+
+    def get_all_values(self):
+        with self._lock: datos = [list(f) for f in self.filas]
+        self._red.esperar("get_all_values", len(datos))
+        return datos
+
+    def get(self, range_name=None, **kwargs):
+        # Solo rangos "A5:F" / "A5:F20" (filas desde la 5); recorta filas vacías al final como la API
+        inicio, _, fin = re.sub(r"^.*!", "", range_name or "A1").partition(":")
+        fila0, col0 = a1_to_rowcol(inicio)
+        col1 = a1_to_rowcol(re.sub(r"\d+", "", fin) + "1")[1] if fin else col0
+        fila1 = int(re.sub(r"\D", "", fin)) if fin and re.search(r"\d", fin) else None
+        with self._lock: datos = [list(f[col0 - 1:col1]) for f in self.filas[fila0 - 1:fila1]]
+        while datos and not any(str(v) for v in datos[-1]): datos.pop()
+        self._red.esperar("get", len(datos))
+        return datos
+
+    def get_all_records(self):
+        with self._lock: datos = [list(f) for f in self.filas]
+        self._red.esperar("get_all_records", len(datos))
+        if len(datos) < 2: return []
+        encabezado = datos[0]
+        return [{c: (f[i] if i < len(f) else '') for i, c in enumerate(encabezado)} for f in datos[1:]]
+
+    def append_row(self, values, table_range=None, **kwargs):
+        self._red.esperar("append_row", 1)
+        with self._lock:
+            self.filas.append(list(values))
+            n = len(self.filas)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{n}:{rowcol_to_a1(n, max(1, len(values)))}"}}
+
+    def append_rows(self, values, table_range=None, **kwargs):
+        self._red.esperar("append_rows", len(values))
+        with self._lock:
+            inicio = len(self.filas) + 1
+            self.filas.extend([list(v) for v in values])
+            n = len(self.filas)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{inicio}:{rowcol_to_a1(n, max(1, max(len(v) for v in values)))}"}}
+
+    def col_values(self, col):
+        with self._lock: valores = [self._valor(i, col - 1) for i in range(len(self.filas))]
+        while valores and valores[-1] in ('', None): valores.pop()
+        self._red.esperar("col_values", len(valores))
+        return valores
+
+    def row_values(self, row):
+        with self._lock: valores = list(self.filas[row - 1]) if row - 1 < len(self.filas) else []
+        while valores and valores[-1] in ('', None): valores.pop()
+        self._red.esperar("row_values", 1)
+        return valores
+
+    def acell(self, label):
+        self._red.esperar("acell")
+        fila, col = a1_to_rowcol(label)
+        with self._lock: return CeldaFalsa(self._valor(fila - 1, col - 1))
+
+    def update_acell(self, label, value):
+        self._red.esperar("update_acell", 1)
+        fila, col = a1_to_rowcol(label)
+        with self._lock: self._escribir(fila - 1, col - 1, value)
+
+    def update(self, values=None, range_name=None, **kwargs):
+        # Acepta update(values), update(values, "B2") y la firma antigua update("B2", values)
+        if isinstance(values, str): values, range_name = range_name, values
+        self._red.esperar("update", len(values or []))
+        inicio = re.sub(r"^.*!", "", range_name or "A1").split(":")[0]
+        fila0, col0 = a1_to_rowcol(inicio)
+        with self._lock:
+            for i, fila in enumerate(values or []):
+                for j, valor in enumerate(fila): self._escribir(fila0 - 1 + i, col0 - 1 + j, valor)
+        return {"updatedRows": len(values or [])}
+
+    def batch_update(self, data, **kwargs):
+        self._red.esperar("batch_update", sum(len(d["values"]) for d in data))
+        for d in data:
+            inicio = re.sub(r"^.*!", "", d["range"]).split(":")[0]
+            fila0, col0 = a1_to_rowcol(inicio)
+            with self._lock:
+                for i, fila in enumerate(d["values"]):
+                    for j, valor in enumerate(fila): self._escribir(fila0 - 1 + i, col0 - 1 + j, valor)
+
+    def clear(self):
+        self._red.esperar("clear")
+        with self._lock: self.filas = []
+
+class SpreadsheetFalsa:
+    def __init__(self, red):
+        self._red = red
+        self.sheet1 = WorksheetFalsa("Hoja 1", red)
+        self._hojas = {}
+
+    def worksheet(self, titulo):
+        self._red.esperar("worksheet")
+        if titulo not in self._hojas: raise gspread.WorksheetNotFound(titulo)
+        return self._hojas[titulo]
+
+    def worksheets(self):
+        return [self.sheet1] + list(self._hojas.values())
+
+    def batch_update(self, body):
+        # Solo deleteDimension de filas, que es lo que usa nube.eliminar_filas
+        self._red.esperar("batch_update_spreadsheet")
+        hojas = {ws.id: ws for ws in self.worksheets()}
+        for pedido in body["requests"]:
+            rango = pedido["deleteDimension"]["range"]
+            ws = hojas[rango["sheetId"]]
+            with ws._lock: del ws.filas[rango["startIndex"]:rango["endIndex"]]
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def add_worksheet(self, title, rows=None, cols=None, **kwargs):
+        self._red.esperar("add_worksheet")
+        self._hojas[title] = WorksheetFalsa(title, self._red)
+        return self._hojas[title]
+
+class ClienteFalso:
+    def __init__(self, latencia=0.0, latencia_por_fila=0.0, cupo=None, periodo=60.0):
+        self.red = Latencia(latencia, latencia_por_fila, cupo, periodo)
+        self.spreadsheet = SpreadsheetFalsa(self.red)
+
+    def open(self, nombre):
+        self.red.esperar("open")
+        return self.spreadsheet
+
+def sin_cupo():
+    # Planificador que nunca hace esperar: los benchmarks miden su propio código, no el freno de producción
+    return Planificador(cupos={tipo: 10**9 for tipo in CUPO_POR_MINUTO}, rafaga=10**9)
+
+def conectar_hoja_falsa(gestor, latencia=0.0, latencia_por_fila=0.0, cupo=None, periodo=60.0):
+    # Reemplaza el backend del GestorSheets dado (sin cupo: solo bench_planificador mide el planificador) y
+    # devuelve el cliente falso para sembrar datos
+    cliente = ClienteFalso(latencia, latencia_por_fila, cupo, periodo)
+    def autorizar(creds):
+        cliente.red.esperar("authorize")
+        return cliente
+    gestor.configurar(fabrica_credenciales=lambda: object(), fabrica_cliente=autorizar, planificador=sin_cupo())
+    return cliente
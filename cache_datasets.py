@@ -0,0 +1,101 @@
+import time
+import functools
+import threading
+
+# ==========================================
+# CACHÉ DE DATASETS CON WRITE-THROUGH E INVALIDACIÓN DIRIGIDA
+# ==========================================
+# Reemplaza a st.cache_data.clear(), que vaciaba todos los cachés del proceso por una sola escritura.
+# Cada dataset tiene su cargador, su ttl y los datasets derivados que hay que recalcular si cambia
+# (p. ej. "catalogo" depende de "precios"). Los valores se comparten entre sesiones: son de solo lectura.
+class CacheDatasets:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cargadores = {}
+        self._ttl = {}
+        self._dependientes = {}
+        self._valores = {}  # nombre -> (valor, instante de carga)
+        self._cargas = {}   # nombre -> lock de carga: se carga fuera del lock general, un dataset a la vez
+        self._generacion = {}  # sube con cada escritura/invalidación; una carga más antigua no pisa el valor nuevo
+        self.stats = {}
+
+    def _stats(self, nombre):
+        return self.stats.setdefault(nombre, {"aciertos": 0, "fallos": 0, "escrituras": 0, "invalidaciones": 0})
+
+    def dataset(self, nombre, ttl=None, depende_de=()):
+        def decorador(fn):
+            with self._lock:
+                self._cargadores[nombre] = fn
+                self._ttl[nombre] = ttl
+                for origen in depende_de: self._dependientes.setdefault(origen, []).append(nombre)
+            @functools.wraps(fn)
+            def envoltura(): return self.obtener(nombre)
+            envoltura.clear = lambda: self.invalidar(nombre)
+            envoltura.escribir = lambda valor: self.escribir(nombre, valor)
+            return envoltura
+        return decorador
+
+    def _vigente(self, nombre):
+        guardado = self._valores.get(nombre)
+        ttl = self._ttl.get(nombre)
+        if guardado is not None and (ttl is None or time.monotonic() - guardado[1] < ttl): return guardado
+        return None
+
+    def obtener(self, nombre):
+        with self._lock:
+            guardado = self._vigente(nombre)
+            if guardado is not None:
+                self._stats(nombre)["aciertos"] += 1
+                return guardado[0]
+            carga = self._cargas.setdefault(nombre, threading.Lock())
+        # La carga (SQLite o Google) no bloquea a los demás datasets; quien llega mientras tanto espera este mismo resultado
+        with carga:
+            with self._lock:
+                guardado = self._vigente(nombre)
+                if guardado is not None:
+                    self._stats(nombre)["aciertos"] += 1
+                    return guardado[0]
+                self._stats(nombre)["fallos"] += 1
+                anterior = self._valores.get(nombre)
+                generacion = self._generacion.get(nombre, 0)
+            valor = self._cargadores[nombre]()
+            with self._lock:
+                if self._generacion.get(nombre, 0) != generacion: return valor
+                self._valores[nombre] = (valor, time.monotonic())
+                # Si al vencer el ttl llegó otro contenido, sus derivados tampoco sirven
+                if anterior is not None and not _iguales(anterior[0], valor):
+                    for derivado in self._dependientes.get(nombre, []): self.invalidar(derivado)
+            return valor
+
+    def escribir(self, nombre, valor):
+        # Write-through: el dataset queda con el valor nuevo y solo se descartan sus derivados.
+        # Si no cambió (p. ej. una descarga de fondo idéntica), no se toca nada.
+        with self._lock:
+            guardado = self._valores.get(nombre)
+            if guardado is not None and _iguales(guardado[0], valor):
+                self._valores[nombre] = (guardado[0], time.monotonic())
+                return False
+            self._valores[nombre] = (valor, time.monotonic())
+            self._generacion[nombre] = self._generacion.get(nombre, 0) + 1
+            self._stats(nombre)["escrituras"] += 1
+            for derivado in self._dependientes.get(nombre, []): self.invalidar(derivado)
+            return True
+
+    def invalidar(self, nombre):
+        with self._lock:
+            self._generacion[nombre] = self._generacion.get(nombre, 0) + 1
+            if self._valores.pop(nombre, None) is not None: self._stats(nombre)["invalidaciones"] += 1
+            for derivado in self._dependientes.get(nombre, []): self.invalidar(derivado)
+
+    def estadisticas(self):
+        with self._lock:
+            ahora = time.monotonic()
+            return {nombre: {**self._stats(nombre), "edad_s": round(ahora - self._valores[nombre][1], 1) if nombre in self._valores else None}
+                    for nombre in self._cargadores}
+
+def _iguales(a, b):
+    if a is b: return True
+    if hasattr(a, 'equals'):
+        try: return a.equals(b)
+        except Exception: return False
+    return False
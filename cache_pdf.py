@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+import pdf_presupuesto
+from pdf_presupuesto import generar_pdf_exacto, encontrar_imagen, leer_bytes, ACTIVOS_PDF
+from metricas import METRICAS
+
+# ==========================================
+# CACHÉ DE PDF EMITIDOS (DIRECCIONADA POR CONTENIDO)
+# ==========================================
+# Cada PDF generado queda en RUTA_PDFS con el sha256 de sus bytes como nombre y se indexa en el almacén
+# local por la huella de sus entradas: los argumentos de generar_pdf_exacto, el contenido de las imágenes
+# y fotos, la fecha que se imprime y la versión de pdf_presupuesto.py. Regenerar lo mismo devuelve los
+# bytes guardados sin dibujar nada; el índice también guarda correlativo y patente para recuperar
+# cualquier presupuesto desde el panel de administración. Al pasar de MAX_BYTES_PDFS se borran los
+# menos usados.
+RUTA_PDFS = os.environ.get("COTIZADOR_PDFS", ".pdfs_emitidos")
+MAX_BYTES_PDFS = int(os.environ.get("COTIZADOR_PDFS_MB", "512")) * 1024 * 1024
+FRACCION_TRAS_RECORTE = 0.9  # al pasarse se baja al 90 %, para no recortar en cada PDF nuevo
+
+def _sha(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+with open(pdf_presupuesto.__file__, 'rb') as _f: VERSION_DISENO = _sha(_f.read())[:16]
+
+_lock_archivos = threading.Lock()
+_huellas_archivos = {}  # (ruta, mtime, tamaño) -> sha256: las imágenes fijas se leen una vez
+
+def huella_archivo(ruta):
+    if not ruta: return None
+    try: st = os.stat(ruta)
+    except OSError: return ruta
+    clave = (ruta, st.st_mtime_ns, st.st_size)
+    with _lock_archivos: huella = _huellas_archivos.get(clave)
+    if huella is None:
+        with open(ruta, 'rb') as f: huella = _sha(f.read())
+        with _lock_archivos: _huellas_archivos[clave] = huella
+    return huella
+
+def _valor_json(o):
+    return o.item() if hasattr(o, 'item') else str(o)
+
+def huella_pdf(args, fecha=None):
+    # args: los argumentos (por nombre) de generar_pdf_exacto
+    fotos = []
+    for foto in args.get("fotos_adjuntas") or []:
+        try: fotos.append(_sha(leer_bytes(foto)))
+        except Exception: fotos.append(None)
+    entradas = dict(args, watermark_file=huella_archivo(args.get("watermark_file")), fotos_adjuntas=fotos, is_official=bool(args.get("is_official")),
+                    fecha=fecha or datetime.now().strftime('%d-%m-%Y'), diseno=VERSION_DISENO,
+                    activos=[huella_archivo(encontrar_imagen(nombre)) for nombre, _ in ACTIVOS_PDF])
+    return _sha(json.dumps(entradas, sort_keys=True, ensure_ascii=False, default=_valor_json).encode('utf-8'))
+
+class CachePDF:
+    def __init__(self, almacen, ruta=RUTA_PDFS, max_bytes=MAX_BYTES_PDFS):
+        self.almacen = almacen
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # escritura y recorte: un archivo no se borra mientras otro hilo lo vuelve a guardar
+        self._bytes = None  # total en disco, se lee del índice la primera vez y luego se lleva aquí
+        self.stats = {"aciertos": 0, "generados": 0, "descartados": 0}
+
+    def _archivo(self, contenido):
+        return os.path.join(self.ruta, contenido + ".pdf")
+
+    def leer(self, entrada):
+        try:
+            with open(self._archivo(entrada["contenido"]), 'rb') as f: return f.read()
+        except OSError:
+            # El archivo ya no está (borrado a mano): la entrada tampoco sirve
+            self.almacen.borrar_pdf(entrada["huella"])
+            return None
+
+    def obtener(self, huella):
+        entrada = self.almacen.leer_pdf(huella)
+        pdf = self.leer(entrada) if entrada else None
+        if pdf is not None: self.almacen.tocar_pdf(huella)
+        return pdf
+
+    def guardar(self, huella, pdf, correlativo=None, patente=None, nombre=None):
+        contenido = _sha(pdf)
+        destino = self._archivo(contenido)
+        with self._lock:
+            try:
+                if self._bytes is None: self._bytes = self.almacen.bytes_pdfs()
+                if not os.path.exists(destino):
+                    os.makedirs(self.ruta, exist_ok=True)
+                    temporal = destino + ".tmp"
+                    with open(temporal, 'wb') as f: f.write(pdf)
+                    os.replace(temporal, destino)
+                    self._bytes += len(pdf)
+                self.almacen.guardar_pdf(huella, contenido, len(pdf), str(correlativo) if correlativo is not None else None, str(patente or "").upper(), nombre)
+                if self._bytes > self.max_bytes:
+                    huerfanos, self._bytes = self.almacen.recortar_pdfs(int(self.max_bytes * FRACCION_TRAS_RECORTE))
+                    for viejo in huerfanos:
+                        self.stats["descartados"] += 1
+                        try: os.remove(self._archivo(viejo))
+                        except OSError: pass
+            except OSError: METRICAS.contar_fallo("guardar_pdf")
+
+    def generar(self, args, nombre=None, renderizar=None):
+        # Devuelve (bytes, True si vino de la caché). renderizar(args) reemplaza a generar_pdf_exacto (p. ej. un pool de procesos)
+        huella = huella_pdf(args)
+        pdf = self.obtener(huella)
+        if pdf is not None:
+            self.stats["aciertos"] += 1
+            return pdf, True
+        pdf = renderizar(args) if renderizar else generar_pdf_exacto(**args)
+        self.stats["generados"] += 1
+        self.guardar(huella, pdf, args.get("correlativo"), args.get("patente"), nombre)
+        return pdf, False
+
+    def buscar(self, texto, limite=50):
+        texto = str(texto or "").strip().upper()
+        return self.almacen.buscar_pdfs(texto, limite) if texto else []
+
+    def estadisticas(self):
+        return {**self.stats, **self.almacen.resumen_pdfs(), "max_bytes": self.max_bytes}
@@ -0,0 +1,112 @@
+import math
+import time
+from datos import TARIFA_A_COLUMNA, TARIFA_POR_DEFECTO, PDFS, cargar_catalogo, detectar_cliente_automatico, obtener_y_registrar_correlativo
+from pdf_presupuesto import generar_pdf_exacto, encontrar_imagen, format_clp
+from precios import a_pesos, totalizar
+
+# ==========================================
+# NÚCLEO DE COTIZACIÓN (SIN STREAMLIT)
+# ==========================================
+# Lo que decide un presupuesto fuera del flujo de la app: columna de tarifa, datos de facturación por
+# defecto, marca de agua, precios, totales con IVA y el PDF. Lo usan app.py, lote_presupuestos.py y
+# api_cotizador.py; una cotización es un dict como los del lote:
+#   {"patente": "HXRP10", "tarifa": "Hospital Temuco", "items": [{"trabajo": "...", "cantidad": 2},
+#    {"descripcion": "Repuesto", "cantidad": 1, "unitario": 45000}], "estado": ..., "correlativo": ...}
+INSTITUCIONES = ["SSAS (Servicio Salud)", "Hospital Temuco", "Hospital Villarrica", "Hospital Lautaro", "Hospital Pitrufquén", "Gendarmería de Chile"]
+FACTURACION_INSTITUCIONES = ("KAUFMANN S.A.", "92.475.000-6")
+
+def columna_tarifa(tarifa):
+    return TARIFA_A_COLUMNA.get(tarifa, 'Costo_Gend')
+
+def facturacion_por_defecto(tarifa):
+    # (razón social, RUT) que la pantalla propone: las instituciones se facturan a Kaufmann
+    return FACTURACION_INSTITUCIONES if tarifa in INSTITUCIONES else ("", "")
+
+def marca_de_agua(tarifa):
+    if tarifa == "Gendarmería de Chile": return encontrar_imagen("gendarmeria")
+    if tarifa == "Cliente Particular": return None
+    return encontrar_imagen("ambulancia")
+
+def precios_por_tarifa(catalogo=None):
+    # {columna: {trabajo: precio en pesos}} desde el catálogo compilado (compartido con la app)
+    catalogo = catalogo if catalogo is not None else cargar_catalogo()
+    return {col: {t: int(p) for grupo in grupos.values() for t, p in zip(grupo["trabajos"], grupo["precios"])}
+            for col, grupos in catalogo["tarifas"].items()}
+
+def _numero(valor, error):
+    # Números o texto numérico (las filas del CSV llegan como texto); lo demás es un error de la cotización
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str)): raise ValueError(error)
+    try: numero = float(valor)
+    except ValueError: raise ValueError(error) from None
+    if not math.isfinite(numero): raise ValueError(error)
+    return numero
+
+def resolver_spec(spec, precios_tarifas, n=1):
+    # Deja el presupuesto listo para generar_pdf_exacto, con los mismos valores por defecto que la UI.
+    # Cualquier cotización mal formada termina en ValueError (la API responde 400)
+    if not isinstance(spec, dict): raise ValueError("La cotización debe ser un objeto")
+    tarifa = spec.get("tarifa") or TARIFA_POR_DEFECTO
+    if not isinstance(tarifa, str): raise ValueError(f"Tarifa inválida: {tarifa}")
+    patente = str(spec.get("patente") or "").upper()
+    if not patente: raise ValueError("Falta la patente")
+    precios = precios_tarifas.get(columna_tarifa(tarifa), {})
+    lista = spec.get("items") or []
+    if not isinstance(lista, list): raise ValueError("\"items\" debe ser una lista de ítems")
+    items = []
+    for item in lista:
+        if not isinstance(item, dict): raise ValueError(f"Ítem inválido: {item}")
+        cantidad = _numero(item.get("cantidad", 1), f"Cantidad inválida: {item}")
+        if cantidad <= 0 or cantidad != int(cantidad): raise ValueError(f"Cantidad inválida: {item}")
+        cantidad = int(cantidad)
+        if "unitario" in item:
+            unitario = a_pesos(_numero(item["unitario"], f"Precio unitario inválido: {item}"))
+            descripcion = item.get("descripcion") or item.get("trabajo")
+            if not isinstance(descripcion, str) or not descripcion.strip(): raise ValueError(f"Ítem sin descripción: {item}")
+        else:
+            descripcion = item.get("trabajo")
+            if not isinstance(descripcion, str) or descripcion not in precios: raise ValueError(f"Trabajo sin precio para {tarifa}: {descripcion}")
+            unitario = precios[descripcion]
+        items.append({"Descripción": descripcion, "Cantidad": cantidad, "Unitario_Costo": unitario, "Total_Costo": unitario * cantidad})
+    if not items: raise ValueError("El presupuesto no tiene ítems")
+
+    totales = totalizar([x["Unitario_Costo"] for x in items], [x["Cantidad"] for x in items])
+    usuario_auto, _ = detectar_cliente_automatico(patente)
+    es_institucion = tarifa in INSTITUCIONES
+    cliente, rut = facturacion_por_defecto(tarifa)
+    oficial = spec.get("oficial", False)
+    if isinstance(oficial, str): oficial = oficial.strip().lower() in ("1", "si", "sí", "true")
+    correlativo = str(spec.get("correlativo") or "BORRADOR")
+    return {
+        "patente": patente, "marca_modelo": spec.get("marca_modelo") or ("MERCEDES-BENZ SPRINTER" if es_institucion else "NO ESPECIFICADO"),
+        "cliente_nombre": spec.get("cliente") or cliente, "cliente_rut": spec.get("rut") or rut,
+        "items": items, "total_neto": totales["neto"], "is_official": bool(oficial), "watermark_file": marca_de_agua(tarifa),
+        "estado_trabajo": spec.get("estado") or "En Espera de Aprobación",
+        "usuario_final_txt": spec.get("usuario_final") or usuario_auto or ("CLIENTE PARTICULAR" if tarifa == "Cliente Particular" else "HOSPITAL [ESPECIFICAR]"),
+        "observaciones": spec.get("observaciones") or "", "correlativo": correlativo, "fotos_adjuntas": list(spec.get("fotos") or []),
+        "nombre": nombre_pdf(correlativo, patente, n), "iva": totales["iva"], "total": totales["total"],
+    }
+
+def nombre_pdf(correlativo, patente, n=1):
+    return f"Presupuesto {correlativo} - {patente}.pdf" if correlativo != "BORRADOR" else f"Presupuesto BORRADOR-{n} - {patente}.pdf"
+
+def registrar(presupuesto):
+    # Número definitivo en el Historial (o provisorio sin nube) para los que no traen uno
+    if presupuesto["correlativo"] != "BORRADOR": return presupuesto
+    correlativo = obtener_y_registrar_correlativo(presupuesto["patente"], presupuesto["usuario_final_txt"], format_clp(presupuesto["total"]))
+    return dict(presupuesto, correlativo=correlativo, nombre=nombre_pdf(correlativo, presupuesto["patente"]))
+
+def argumentos_pdf(presupuesto):
+    return {k: v for k, v in presupuesto.items() if k not in ("nombre", "iva", "total")}
+
+def renderizar_pdf(presupuesto):
+    # Solo genera el PDF (CPU pura, sin Sheets ni la caché): es lo que corre en los procesos del pool
+    t0 = time.perf_counter()
+    return generar_pdf_exacto(**argumentos_pdf(presupuesto)), time.perf_counter() - t0
+
+def cotizar(spec, precios_tarifas=None, con_correlativo=False):
+    # Todo en el hilo que llama: {"nombre", "correlativo", "neto", "iva", "total", "pdf"}
+    presupuesto = resolver_spec(spec, precios_tarifas if precios_tarifas is not None else precios_por_tarifa())
+    if con_correlativo: presupuesto = registrar(presupuesto)
+    pdf, _ = PDFS.generar(argumentos_pdf(presupuesto), presupuesto["nombre"])
+    return {"nombre": presupuesto["nombre"], "correlativo": presupuesto["correlativo"], "neto": presupuesto["total_neto"],
+            "iva": presupuesto["iva"], "total": presupuesto["total"], "pdf": pdf}
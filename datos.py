@@ -0,0 +1,562 @@
+import io
+import re
+import json
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import gspread
+import streamlit as st
+from nube import GESTOR, HOJA_PRINCIPAL, agregar_al_historial, escribir_correlativo, fusionar_por_lotes
+from autoguardado import AUTOGUARDADO, BORRADORES_NUBE
+from almacen_local import AlmacenLocal, Sincronizador
+from metricas import METRICAS, medido, fallo_cache
+from planificador import PLANIFICADOR, PRIORIDAD_CORRELATIVO, PRIORIDAD_FONDO, PRIORIDAD_BORRADOR
+from cache_datasets import CacheDatasets
+from cache_pdf import CachePDF
+from vehiculos import IndiceVehiculos, cargar_base_vehiculos
+from precarga import Precarga
+from pdf_presupuesto import preparar_activos
+from precios import REGLAS_PRECIO, a_pesos, resolver_tarifas, compactar_tarifas
+
+# ==========================================
+# DATOS SEMILLA
+# ==========================================
+COLUMNAS_PRECIOS = ['Categoria', 'Trabajo', 'Costo_SSAS', 'Costo_Hosp_Temuco', 'Costo_Hosp_Villarrica', 'Costo_Hosp_Lautaro', 'Costo_Hosp_Pitrufquen', 'Costo_Gend']
+COLUMNAS_TARIFA = COLUMNAS_PRECIOS[2:]
+COLUMNAS_PATENTES = ["Patente", "Institucion"]
+ENCABEZADO_HISTORIAL = ["Fecha", "Hora", "Correlativo", "Patente", "Cliente", "Monto Total"]
+
+DIRECTORIO_GENDARMERIA = [["BYRH67", "GENDARMERÍA DE CHILE"], ["CGZP59", "GENDARMERÍA DE CHILE"], ["CVXV81", "GENDARMERÍA DE CHILE"], ["DJDS43", "GENDARMERÍA DE CHILE"], ["DRTY89", "GENDARMERÍA DE CHILE"], ["DRTY99", "GENDARMERÍA DE CHILE"], ["JZPJ79", "GENDARMERÍA DE CHILE"], ["CGCR37", "GENDARMERÍA DE CHILE"], ["GTBC75", "GENDARMERÍA DE CHILE"], ["GXSW72", "GENDARMERÍA DE CHILE"], ["GYPT12", "GENDARMERÍA DE CHILE"], ["HHBL18", "GENDARMERÍA DE CHILE"], ["HHBL19", "GENDARMERÍA DE CHILE"], ["HKRL36", "GENDARMERÍA DE CHILE"], ["HKRL50", "GENDARMERÍA DE CHILE"], ["JBDP22", "GENDARMERÍA DE CHILE"], ["JBDP23", "GENDARMERÍA DE CHILE"]]
+
+DIRECTORIO_HOSPITALES = {
+    "CWKV42": "HOSPITAL PADRE LAS CASAS", "DLTL67": "SAMU", "FLJW92": "HOSPITAL TOLTEN", "GRCH58": "HOSPITAL LONCOCHE", "GXTD94": "HOSPITAL CUNCO", "GXTD96": "HOSPITAL MIRAFLORES", "HKPH64": "HOSPITAL CUNCO", "HKPH65": "HOSPITAL TOLTEN", "HKPH66": "HOSPITAL GALVARINO", "HKPP33": "HOSPITAL LONCOCHE", "HKPV98": "HOSPITAL LAUTARO", "HKRC82": "HOSPITAL PITRUFQUEN", "HKRC84": "HOSPITAL VILLARRICA", "HKRC85": "SAMU / VILCUN", "HRCH58": "HOSPITAL LONCOCHE", "HXRP10": "HOSPITAL TEMUCO", "HXRP11": "HOSPITAL CARAHUE", "HXRP12": "HOSPITAL CUNCO", "HXRP14": "HOSPITAL LONCOCHE", "HXRP15": "HOSPITAL GALVARINO", "HXRP16": "HOSPITAL CARAHUE", "HXRP18": "HOSPITAL PITRUFQUEN", "HXRP19": "HOSPITAL VILLARRICA", "HXRP20": "HOSPITAL TOLTEN", "HXRP21": "HOSPITAL TEMUCO", "HXRP22": "HOSPITAL VILCUN", "HXRP23": "HOSPITAL TEMUCO", "HXRP24": "HOSPITAL GORBEA", "HXRP26": "HOSPITAL LONCOCHE", "HZGX64": "SAMU", "HZGX65": "HOSPITAL VILLARRICA", "HZGX66": "HOSPITAL PITRUFQUEN", "HZGX70": "HOSPITAL TEMUCO", "JHFX18": "SAMU", "KYWG26": "SAMU", "LPCT51": "HOSPITAL TEMUCO", "LPCT53": "HOSPITAL VILLARRICA", "LZPG72": "HOSPITAL PADRE LAS CASAS", "LZPG73": "HOSPITAL PADRE LAS CASAS", "PPYV76": "HOSPITAL LONCOCHE", "RBFR24": "HOSPITAL CARAHUE", "RBFR25": "HOSPITAL PITRUFQUEN", "RBFR28": "HOSPITAL SAAVEDRA", "RBFR29": "HOSPITAL TOLTEN", "RBFR30": "HOSPITAL VILCUN", "SHLF84": "HOSPITAL TEMUCO", "SHLF85": "HOSPITAL GORBEA", "SYTG24": "HOSPITAL NUEVA IMPERIAL"
+}
+
+DATOS_MAESTROS = """Categoria,Trabajo,Costo_SSAS,Costo_Hosp_Temuco,Costo_Hosp_Villarrica,Costo_Hosp_Lautaro,Costo_Hosp_Pitrufquen,Costo_Gend
+Cabina y Tablero,Reparación circuito eléctrico tablero,180000,189000,180000,180000,180000,215800
+Equipamiento y Radio,Cambiar sirena y parlante con accesorios,893700,600000,893700,893700,893700,895670
+Cabina y Tablero,Reparación eléctrica Balizas/Sirena/Luces,280000,294000,280000,280000,280000,280000
+Equipamiento y Radio,Cambiar inversor de corriente (2500W),845000,887250,845000,845000,845000,895400
+Luces y Exterior,Cambio foco perimetral,195000,204750,195000,195000,195000,212630
+Luces y Exterior,Cambio foco escena,195000,204750,195000,195000,195000,212630
+Luces y Exterior,Cambio foco faenero,74900,78645,74900,74900,74900,74900
+Luces y Exterior,Cambio baliza barral doble LED,1485700,1559985,1485700,1485700,1485700,1505300
+Luces y Exterior,Cambio focos iluminación interior (x unidad),68900,72345,68900,68900,68900,68600
+Luces y Exterior,Instalación focos adicionales LED (Kit Neblineros),0,0,0,0,0,125500
+Seguridad y Calabozos,Reparación sistema tecno vigilancia (Cámaras),0,0,0,0,0,290000
+Luces y Exterior,Instalación alarma advertencia retroceso,0,0,0,0,0,79300
+Climatización y Aire,Cambio control de calefacción,0,0,0,0,0,145200
+Climatización y Aire,Cambiar llave de paso de calefacción,0,0,0,0,0,95600
+Climatización y Aire,Reparación de sistema de calefacción,0,0,0,0,0,290000
+Climatización y Aire,Carga Aire Acondicionado,45000,47250,45000,45000,45000,60000
+Climatización y Aire,Cambio de compresor A/C,0,0,0,0,0,580900
+Climatización y Aire,Reparación sistema eléctrico A/C,0,0,0,0,0,290000
+Climatización y Aire,Cambio de presostato sistema A/C,0,0,0,0,0,145000
+Climatización y Aire,Cambiar mangueras de A/C,0,0,0,0,0,90000
+Climatización y Aire,Reparar línea de A/C,0,0,0,0,0,180000
+Climatización y Aire,Radiador de aire acondicionado,0,0,0,0,0,350000
+Climatización y Aire,Cambio filtro deshidratante,0,0,0,0,0,450000
+Climatización y Aire,Cambio válvula de expansión,0,0,0,0,0,165000
+Climatización y Aire,Reparación de evaporador,0,0,0,0,0,480000
+Climatización y Aire,Cambio de evaporador,0,0,0,0,0,480000
+Carrocería y Vidrios,Lámina seguridad transparente parabrisas (4 micras),120000,126000,120000,120000,120000,140000
+Carrocería y Vidrios,Lámina seguridad 8 micras color (Ventana Puerta),75000,78750,75000,75000,75000,75000
+Carrocería y Vidrios,Grabado de patente (Parabrisas/Ventanas/Espejos) x unidad,0,0,0,0,0,10000
+Interior Sanitario,Goma para piso interior cabina (x metro),45000,47250,45000,45000,45000,45000
+Asientos y Tapiz,Reparación de tapices de asientos,65000,68250,65000,65000,65000,65000
+Asientos y Tapiz,Cambio tapices asientos cabina y calabozos,130000,136500,130000,130000,130000,130000
+Climatización y Aire,Extractores de aire (calabozo),390000,409500,390000,390000,390000,390000
+Carrocería y Vidrios,Servicio Ploteo emblemas corporativos (x pieza),60000,63000,60000,60000,60000,65000
+Seguridad y Calabozos,Reparación/Acondicionamiento Calabozos (m2),120000,126000,120000,120000,120000,120000
+Seguridad y Calabozos,Modificaciones estructuras de móviles (m2),120000,126000,120000,120000,120000,120000
+Seguridad y Calabozos,Protecciones metálicas/Mallas (m2),120000,126000,120000,120000,120000,120000
+Interior Sanitario,Reparar línea de oxígeno central (x línea),180000,189000,180000,180000,180000,180000
+Interior Sanitario,Reparar línea de aspiración paciente (x línea),165000,173250,165000,165000,165000,180000
+Asientos y Tapiz,Tapizado de asiento de paramédico,125000,131250,125000,125000,125000,130000
+Asientos y Tapiz,Tapizado de asiento longitudinal,90000,94500,90000,90000,90000,130000
+Asientos y Tapiz,Cambio de asiento de paramédico,475800,499590,475800,475800,475800,495000
+Asientos y Tapiz,Cambio de asiento longitudinal,160000,168000,160000,160000,160000,210000
+Camilla,Tapizado de colchoneta de camilla,120000,126000,120000,120000,120000,126000
+Carrocería y Vidrios,Cambio de vidrio de puerta Corredera lateral,290000,304500,290000,290000,290000,290000
+Carrocería y Vidrios,Láminas Seguridad 10 micras (Ventanas),75000,78750,75000,75000,75000,75000
+Interior Sanitario,Cambio de luces interiores de gabinete sanitario,58000,60900,58000,58000,58000,58000
+Interior Sanitario,Cambiar conjunto motor A/C gabinete,765000,803250,765000,765000,765000,765000
+Equipamiento y Radio,Instalar Radio Transmisor Antena y acc.,1143650,1200832.5,1143650,1143650,1143650,1143650
+Equipamiento y Radio,Cambiar botonera accesorios emergencia,28900,30345,28900,28900,28900,28900
+Camilla,Cambiar colchoneta de camilla,90000,94500,90000,90000,90000,90000
+Camilla,Reparar Camilla (respaldo elevación),345800,363090,345800,345800,345800,345800
+Camilla,Reparar Camilla (vástagos y pasadores),165765,174053,165765,165765,165765,165765
+Camilla,Cambiar 1 Rueda de Camilla,135800,142590,135800,135800,135800,135800
+Camilla,Aceitar y lubricar partes articuladas camilla,90000,94500,90000,90000,90000,90000"""
+
+# Reglas institución -> tarifa: la primera regla cuyo texto aparezca en la institución gana.
+# usuario=None conserva el nombre de la institución tal como viene del directorio.
+REGLAS_TARIFA = [
+    {"contiene": ("GENDARMERÍA", "GENDARMERIA"), "tipo": "Gendarmería de Chile", "usuario": "GENDARMERÍA DE CHILE"},
+    {"contiene": ("TEMUCO",), "tipo": "Hospital Temuco", "usuario": None},
+    {"contiene": ("VILLARRICA",), "tipo": "Hospital Villarrica", "usuario": None},
+    {"contiene": ("LAUTARO",), "tipo": "Hospital Lautaro", "usuario": None},
+    {"contiene": ("PITRUFQUEN", "PITRUFQUÉN"), "tipo": "Hospital Pitrufquén", "usuario": None},
+]
+TARIFA_POR_DEFECTO = "SSAS (Servicio Salud)"
+
+TARIFA_A_COLUMNA = {
+    "SSAS (Servicio Salud)": 'Costo_SSAS',
+    "Hospital Temuco": 'Costo_Hosp_Temuco',
+    "Hospital Villarrica": 'Costo_Hosp_Villarrica',
+    "Hospital Lautaro": 'Costo_Hosp_Lautaro',
+    "Hospital Pitrufquén": 'Costo_Hosp_Pitrufquen',
+    "Gendarmería de Chile": 'Costo_Gend',
+}
+
+def precios_semilla():
+    # DATOS_MAESTROS ya en el esquema vigente (tarifas derivadas en blanco)
+    return aplicar_migraciones(pd.read_csv(io.StringIO(DATOS_MAESTROS)), 0)
+
+def directorio_por_defecto():
+    default_data = DIRECTORIO_GENDARMERIA + [[k, v] for k, v in DIRECTORIO_HOSPITALES.items()]
+    return pd.DataFrame(default_data, columns=COLUMNAS_PATENTES)
+
+def conectar_google_sheets():
+    # El cliente autorizado y los handles de las hojas viven en GESTOR (uno por proceso)
+    return GESTOR.cliente()
+
+# ==========================================
+# MIGRACIONES DE ESQUEMA DE LA LISTA DE PRECIOS
+# ==========================================
+# La versión vive en la pestaña "Meta" (A1 = "version_esquema", B1 = número). Las descargas solo
+# la leen (una vez por proceso); la reescritura de la hoja la hace migrar_esquema(), a pedido del Admin.
+HOJA_META = "Meta"
+HOJA_DIRECTORIO = "Directorio_Patentes"
+CELDA_VERSION_ESQUEMA = "B1"
+
+def quitar_columnas_venta(df):
+    return df.drop(columns=['Venta_SSAS', 'Venta_Hosp', 'Venta_Gend'], errors='ignore')
+
+def separar_costo_hospitales(df):
+    if 'Costo_Hosp' not in df.columns: return df
+    df = df.rename(columns={'Costo_Hosp': 'Costo_Hosp_Temuco'})
+    for col in ('Costo_Hosp_Villarrica', 'Costo_Hosp_Lautaro', 'Costo_Hosp_Pitrufquen'): df[col] = df['Costo_SSAS']
+    return df
+
+# (versión a la que deja la hoja, descripción, fn(df) -> df). Cada paso debe poder repetirse sin efecto.
+MIGRACIONES = [
+    (1, "Quitar columnas Venta_*", quitar_columnas_venta),
+    (2, "Separar Costo_Hosp en Temuco/Villarrica/Lautaro/Pitrufquén", separar_costo_hospitales),
+    (3, "Tarifas en pesos enteros; en blanco las que salen de su regla (p. ej. Temuco = SSAS × 1,05)", compactar_tarifas),
+]
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+_version_leida = None
+_lock_migracion = threading.Lock()
+
+def leer_version_esquema(forzar=False):
+    global _version_leida
+    # Devuelve None sin conexión o si la lectura falla (no se guarda: se reintenta); sin pestaña "Meta" es versión 0
+    if _version_leida is not None and not forzar: return _version_leida
+    try:
+        ws = GESTOR.worksheet(HOJA_META)
+        if ws is None: return None
+        valor = ws.acell(CELDA_VERSION_ESQUEMA).value
+    except gspread.WorksheetNotFound: valor = None
+    except Exception:
+        METRICAS.contar_fallo("leer_version_esquema"); GESTOR.invalidar()
+        return None
+    _version_leida = int(valor) if valor and str(valor).isdigit() else 0
+    return _version_leida
+
+def escribir_version_esquema(version):
+    global _version_leida
+    try: ws = GESTOR.worksheet(HOJA_META)
+    except gspread.WorksheetNotFound: ws = GESTOR.crear_worksheet(HOJA_META, rows="2", cols="2")
+    ws.update([["version_esquema", version]], "A1")
+    _version_leida = version
+
+def aplicar_migraciones(df, desde):
+    for version, _, migrar in MIGRACIONES:
+        if version > desde: df = migrar(df)
+    return df[[c for c in COLUMNAS_PRECIOS if c in df.columns]]
+
+@medido("migrar_esquema")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_FONDO)
+def migrar_esquema():
+    # Explícita y de una vez: la hoja se reescribe con UNA sola llamada (sin clear previo, las columnas
+    # sobrantes quedan en blanco) y recién después se sube la versión. Si algo falla a mitad de camino,
+    # volver a correrla es seguro porque cada migración es idempotente.
+    with _lock_migracion:
+        if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+        try:
+            desde = leer_version_esquema(forzar=True)
+            if desde is None: raise ConnectionError("No se pudo leer la versión del esquema")
+            if desde >= VERSION_ESQUEMA: return desde
+            sheet = GESTOR.worksheet(HOJA_PRINCIPAL)
+            data = sheet.get_all_records()
+            if data:
+                df_original = pd.DataFrame(data)
+                df = aplicar_migraciones(df_original, desde)
+                if [df.columns.tolist()] + df.values.tolist() != [df_original.columns.tolist()] + df_original.values.tolist():
+                    ancho = max(len(df.columns), len(df_original.columns))
+                    valores = [df.columns.values.tolist()] + df.values.tolist()
+                    sheet.update([fila + [''] * (ancho - len(fila)) for fila in valores], "A1")
+                    ALMACEN.guardar_dataset("precios", df, si_sin_pendientes=True)
+            escribir_version_esquema(VERSION_ESQUEMA)
+        except:
+            GESTOR.invalidar(); raise
+    cargar_datos.clear()  # arrastra al catálogo; patentes y vehículos no se tocan
+    return VERSION_ESQUEMA
+
+# ==========================================
+# LADO NUBE: DESCARGAS Y SUBIDAS QUE HACE EL SINCRONIZADOR
+# ==========================================
+@medido("descargar_precios")
+def descargar_precios():
+    if not conectar_google_sheets(): return None
+    try:
+        sheet = GESTOR.worksheet(HOJA_PRINCIPAL)
+        data = sheet.get_all_records()
+        if not data:
+            df_init = precios_semilla()
+            sheet.update([df_init.columns.values.tolist()] + df_init.values.tolist())
+            escribir_version_esquema(VERSION_ESQUEMA)
+            return df_init
+        
+        df = pd.DataFrame(data)
+        # Hoja sin migrar: se adapta solo en memoria; nunca se reescribe en medio de una descarga
+        desde = leer_version_esquema()
+        if desde is None: raise ConnectionError("No se pudo leer la versión del esquema")
+        if desde < VERSION_ESQUEMA: df = aplicar_migraciones(df, desde)
+        return df
+    except:
+        GESTOR.invalidar(); raise
+
+@medido("descargar_directorio")
+def descargar_directorio():
+    if not conectar_google_sheets(): return None
+    try:
+        try:
+            ws = GESTOR.worksheet(HOJA_DIRECTORIO)
+            data = ws.get_all_records()
+            return pd.DataFrame(data) if data else None
+        except gspread.WorksheetNotFound:
+            df_default = directorio_por_defecto()
+            ws = GESTOR.crear_worksheet(HOJA_DIRECTORIO, rows="500", cols="2")
+            ws.update([df_default.columns.values.tolist()] + df_default.values.tolist())
+            return df_default
+    except:
+        GESTOR.invalidar(); raise
+
+def hoja_historial():
+    try: return GESTOR.worksheet("Historial")
+    except gspread.WorksheetNotFound:
+        worksheet_hist = GESTOR.crear_worksheet("Historial", rows="1000", cols="6")
+        worksheet_hist.append_row(ENCABEZADO_HISTORIAL)
+        return worksheet_hist
+
+def registrar_en_historial(id_local, fila):
+    # Dos llamadas: el append fija la fila (y con ella el número) y luego el número se escribe en su celda.
+    # Si falla la segunda solo esa queda en cola: volver a agregar la fila dejaría una huérfana y un duplicado
+    ws = hoja_historial()
+    n_fila, correlativo = agregar_al_historial(ws, fila)
+    ALMACEN.asignar_correlativo(id_local, correlativo)
+    try: escribir_correlativo(ws, n_fila, correlativo)
+    except:
+        METRICAS.contar_fallo("escribir_correlativo"); GESTOR.invalidar()
+        ALMACEN.encolar("numerar_cotizacion", {"fila": n_fila, "correlativo": correlativo})
+    return correlativo
+
+@medido("subir_cotizacion")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_CORRELATIVO)
+def subir_cotizacion(payload):
+    # Reconciliación de una cotización emitida sin conexión: recibe su número definitivo
+    if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+    try: registrar_en_historial(payload["id_local"], payload["fila"])
+    except:
+        GESTOR.invalidar(); raise
+
+@medido("subir_numeracion")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_CORRELATIVO)
+def subir_numeracion(payload):
+    # La fila ya está en el Historial; solo falta escribir su número
+    if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+    try: escribir_correlativo(hoja_historial(), payload["fila"], payload["correlativo"])
+    except:
+        GESTOR.invalidar(); raise
+
+@medido("subir_borrado_borrador")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_BORRADOR)
+def subir_borrado_borrador(payload):
+    if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+    try: BORRADORES_NUBE.borrar(payload["clave"])
+    except:
+        GESTOR.invalidar(); raise
+
+@medido("subir_nuevo_item")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_FONDO)
+def subir_nuevo_item(payload):
+    if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+    try: GESTOR.worksheet(HOJA_PRINCIPAL).append_row(payload["fila"])
+    except:
+        GESTOR.invalidar(); raise
+
+@medido("subir_importacion")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_FONDO)
+def subir_importacion(payload):
+    # Importación masiva (precios o patentes): una lectura y pocas escrituras por lotes, idempotente
+    if not conectar_google_sheets(): raise ConnectionError("Sin conexión a Google Sheets")
+    try:
+        if payload["hoja"] == "patentes":
+            try: ws = GESTOR.worksheet(HOJA_DIRECTORIO)
+            except gspread.WorksheetNotFound: ws = GESTOR.crear_worksheet(HOJA_DIRECTORIO, rows="500", cols="2")
+            encabezado, clave = COLUMNAS_PATENTES, lambda fila: limpiar_patente(str(fila.get("Patente", "")))
+        else:
+            ws = GESTOR.worksheet(HOJA_PRINCIPAL)
+            encabezado, clave = COLUMNAS_PRECIOS, lambda fila: clave_trabajo(fila.get("Categoria", ""), fila.get("Trabajo", ""))
+        # Solo las columnas que traía el archivo; en las filas que ya existen las demás quedan como están
+        return fusionar_por_lotes(ws, encabezado, [dict(zip(payload["columnas"], f)) for f in payload["filas"]], clave)
+    except:
+        GESTOR.invalidar(); raise
+
+ALMACEN = AlmacenLocal()
+CACHE = CacheDatasets()
+PDFS = CachePDF(ALMACEN)
+# El refresco periódico va con prioridad de fondo; la primera descarga (sin copia local) es interactiva
+en_fondo = PLANIFICADOR.con_prioridad(PRIORIDAD_FONDO)
+SINCRONIZADOR = Sincronizador(ALMACEN,
+    descargas={"precios": en_fondo(descargar_precios), "patentes": en_fondo(descargar_directorio)},
+    subidas={"cotizacion": subir_cotizacion, "numerar_cotizacion": subir_numeracion, "nuevo_item": subir_nuevo_item, "borrar_borrador": subir_borrado_borrador,
+             "importacion": subir_importacion},
+    al_descargar=CACHE.escribir)
+
+# ==========================================
+# LÓGICA DE CORRELATIVOS Y BORRADOR
+# ==========================================
+@medido("obtener_y_registrar_correlativo")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_CORRELATIVO)
+def obtener_y_registrar_correlativo(patente, cliente, total):
+    ahora = datetime.now()
+    fila = [ahora.strftime("%d/%m/%Y"), ahora.strftime("%H:%M:%S"), "", patente, cliente, total]
+    id_local = ALMACEN.registrar_cotizacion(fila[0], fila[1], patente, cliente, total)
+    if conectar_google_sheets():
+        try: return registrar_en_historial(id_local, fila)
+        except:
+            METRICAS.contar_fallo("obtener_y_registrar_correlativo"); GESTOR.invalidar()
+    # Sin nube: número provisorio local; el sincronizador le asigna el definitivo al volver la conexión
+    provisional = f"P-{id_local}"
+    ALMACEN.asignar_correlativo(id_local, None, provisional=provisional)
+    ALMACEN.encolar("cotizacion", {"id_local": id_local, "fila": fila})
+    return provisional
+
+def clave_borrador(patente):
+    # Un borrador por patente: dos equipos con la misma patente comparten borrador (la nube fusiona los deltas)
+    return limpiar_patente(patente) or "SIN-PATENTE"
+
+def estado_borrador():
+    # Solo lo necesario para retomar: confirmaciones, listas y las cantidades distintas de cero
+    keys_to_save = ['paso_actual', 'lista_particular', 'items_manuales_extra']
+    return {k: v for k, v in st.session_state.items()
+            if k.endswith('_confirmado') or k.endswith('_confirmada') or k in keys_to_save or (k.startswith('q_') and v)}
+
+@medido("guardar_borrador_nube")
+def guardar_borrador_nube():
+    # Se guarda al instante en SQLite; la escritura a Sheets la hace AUTOGUARDADO en segundo plano
+    if 'patente_confirmada' not in st.session_state: return
+    clave = clave_borrador(st.session_state.patente_confirmada)
+    estado = estado_borrador()
+    ALMACEN.guardar_borrador(clave, json.dumps(estado))
+    AUTOGUARDADO.encolar(clave, estado)
+
+def resumen_borrador(clave, instante, estado):
+    items = sum(1 for k, v in estado.items() if k.startswith('q_') and v) + len(estado.get('lista_particular') or []) + len(estado.get('items_manuales_extra') or [])
+    return {"clave": clave, "patente": estado.get('patente_confirmada', ''), "tipo_cliente": estado.get('tipo_cliente_confirmado', ''),
+            "items": items, "actualizado": datetime.fromtimestamp(instante).strftime("%d/%m/%Y %H:%M") if instante else ""}
+
+@medido("traer_borradores_nube")
+def traer_borradores_nube():
+    # Copia a SQLite los borradores de la nube más nuevos que los locales (corre en la precarga, no en el rerun)
+    if not conectar_google_sheets(): return 0
+    try: remotos = BORRADORES_NUBE.listar() or []
+    except Exception:
+        METRICAS.contar_fallo("traer_borradores_nube"); GESTOR.invalidar(); return 0
+    locales = {fila["clave"]: fila["actualizado"] for fila in ALMACEN.listar_borradores()}
+    traidos = 0
+    for b in remotos:
+        try: instante = datetime.strptime(b["actualizado"], "%d/%m/%Y %H:%M:%S").timestamp()
+        except ValueError: instante = 0
+        if 'patente_confirmada' in b["estado"] and instante > locales.get(b["clave"], 0):
+            ALMACEN.guardar_borrador(b["clave"], json.dumps(b["estado"]), instante)
+            traidos += 1
+    return traidos
+
+@medido("listar_borradores")
+def listar_borradores(incluir_nube=True):
+    # Presupuestos en pausa de este equipo (SQLite) y, si se pide, también los de la nube
+    if incluir_nube: traer_borradores_nube()
+    borradores = {}
+    for fila in ALMACEN.listar_borradores():
+        try: estado = json.loads(fila["payload"])
+        except ValueError: continue
+        if 'patente_confirmada' in estado: borradores[fila["clave"]] = (fila["actualizado"], estado)
+    return [resumen_borrador(c, t, e) for c, (t, e) in sorted(borradores.items(), key=lambda kv: -kv[1][0])]
+
+@medido("cargar_borrador_nube")
+def cargar_borrador_nube(clave):
+    val = ALMACEN.leer_borrador(clave)
+    if not val: return None
+    estado = json.loads(val)
+    # Borradores del esquema anterior (una sola celda compartida, clave 'A1'): se pasan a su clave por patente
+    nueva = clave_borrador(estado.get('patente_confirmada', ''))
+    if nueva != clave:
+        ALMACEN.borrar_borrador(clave)
+        ALMACEN.guardar_borrador(nueva, val)
+    return estado
+
+@medido("limpiar_borrador_nube")
+@PLANIFICADOR.con_prioridad(PRIORIDAD_BORRADOR)
+def limpiar_borrador_nube(clave=None):
+    if clave is None:
+        if 'patente_confirmada' not in st.session_state: return
+        clave = clave_borrador(st.session_state.patente_confirmada)
+    # Lo pendiente se descarta (no se escribe algo que se va a borrar) y una escritura tardía no lo revive
+    AUTOGUARDADO.descartar(clave)
+    ALMACEN.borrar_borrador(clave)
+    if conectar_google_sheets():
+        try:
+            BORRADORES_NUBE.borrar(clave); return
+        except Exception:
+            METRICAS.contar_fallo("limpiar_borrador_nube"); GESTOR.invalidar()
+    # Sin nube: el sincronizador lo borra al volver la conexión
+    ALMACEN.encolar("borrar_borrador", {"clave": clave})
+    SINCRONIZADOR.despertar()
+
+# ==========================================
+# LISTA DE PRECIOS Y DIRECTORIO (LECTURA LOCAL)
+# ==========================================
+def cargar_dataset_local(nombre, descargar, por_defecto):
+    # Copia local si existe; si no (primer arranque), se descarga una vez y se guarda
+    df = ALMACEN.leer_dataset(nombre)
+    if df is not None: return df
+    try: df = descargar()
+    except Exception:
+        METRICAS.contar_fallo(f"cargar_dataset_local ({nombre})"); df = None
+    if df is None: return por_defecto()
+    ALMACEN.guardar_dataset(nombre, df)
+    return df
+
+@medido("cargar_directorio_patentes", cacheada=True)
+@CACHE.dataset("patentes", ttl=60)
+@fallo_cache
+def cargar_directorio_patentes():
+    return cargar_dataset_local("patentes", descargar_directorio, directorio_por_defecto)
+
+@medido("cargar_datos", cacheada=True)
+@CACHE.dataset("precios", ttl=60)
+@fallo_cache
+def cargar_datos():
+    return cargar_dataset_local("precios", descargar_precios, precios_semilla)
+
+@medido("guardar_nuevo_item")
+def guardar_nuevo_item(categoria, nombre, costo):
+    # Solo la base: las demás tarifas (Temuco = SSAS × 1,05, etc.) salen de REGLAS_PRECIO al compilar
+    fila = [categoria, nombre, a_pesos(costo)] + [''] * len(REGLAS_PRECIO)
+    try:
+        df = ALMACEN.leer_dataset("precios")
+        if df is None: df = precios_semilla()
+        df = pd.concat([df, pd.DataFrame([fila], columns=COLUMNAS_PRECIOS)], ignore_index=True)
+        ALMACEN.guardar_dataset("precios", df)
+        ALMACEN.encolar("nuevo_item", {"fila": fila})
+    except Exception:
+        METRICAS.contar_fallo("guardar_nuevo_item"); return False
+    # Write-through: solo cambia "precios" (y se recompila su catálogo); patentes y vehículos siguen calientes
+    cargar_datos.escribir(df)
+    SINCRONIZADOR.despertar()
+    return True
+
+# ==========================================
+# CATÁLOGO PRECOMPILADO POR TARIFA
+# ==========================================
+def compilar_catalogo(df_precios):
+    # {"categorias": [...], "tarifas": {col: {cat: {"trabajos", "claves", "precios"}}}} con solo los
+    # trabajos de precio > 0 y los precios en pesos enteros, ya resueltos por el motor de precios.
+    categorias = list(df_precios['Categoria'].unique())
+    trabajos = df_precios['Trabajo'].astype(str).to_numpy()
+    # La clave del number_input se mantiene como antes (q_<Trabajo>_<índice>) para no romper borradores
+    claves = np.array([f"q_{t}_{i}" for t, i in zip(df_precios['Trabajo'], df_precios.index)], dtype=object)
+    posiciones_cat = df_precios.groupby('Categoria', sort=False).indices
+    tarifas = {}
+    for col, precios in resolver_tarifas(df_precios).items():
+        grupos = {}
+        for cat, pos in posiciones_cat.items():
+            validas = pos[precios[pos] > 0]
+            if len(validas): grupos[cat] = {"trabajos": trabajos[validas].tolist(), "claves": claves[validas].tolist(), "precios": precios[validas]}
+        tarifas[col] = grupos
+    return {"categorias": categorias, "tarifas": tarifas}
+
+def clave_trabajo(categoria, trabajo):
+    # Un trabajo se identifica por categoría + nombre, sin distinguir mayúsculas ni espacios de más
+    return (" ".join(str(categoria).split()).casefold(), " ".join(str(trabajo).split()).casefold())
+
+@medido("cargar_catalogo", cacheada=True)
+@CACHE.dataset("catalogo", ttl=60, depende_de=("precios",))
+@fallo_cache
+def cargar_catalogo():
+    return compilar_catalogo(cargar_datos())
+
+def lineas_seleccionadas(grupo, cantidades):
+    # Totales de una categoría en una pasada vectorizada; devuelve solo las líneas con cantidad > 0
+    cantidades = np.asarray(cantidades, dtype=np.int64)
+    totales = grupo["precios"] * cantidades
+    return [{"Descripción": grupo["trabajos"][k], "Cantidad": int(cantidades[k]), "Unitario_Costo": int(grupo["precios"][k]), "Total_Costo": int(totales[k])}
+            for k in np.flatnonzero(cantidades)]
+
+# ==========================================
+# ÍNDICE DE PATENTES (DETECCIÓN AUTOMÁTICA DE CLIENTE)
+# ==========================================
+def limpiar_patente(texto):
+    if not texto: return ""
+    return re.sub(r'[^A-Z0-9]', '', texto.upper())
+
+def clasificar_institucion(institucion, reglas=REGLAS_TARIFA):
+    for regla in reglas:
+        if any(palabra in institucion for palabra in regla["contiene"]):
+            return regla["usuario"] or institucion, regla["tipo"]
+    return institucion, TARIFA_POR_DEFECTO
+
+def compilar_indice_patentes(df_patentes):
+    # patente limpia -> (usuario, tipo). Cada institución se clasifica una sola vez y,
+    # si una patente se repite, gana la primera fila (como el antiguo match.iloc[0]).
+    indice = {}
+    clasificadas = {}
+    for patente, institucion in zip(df_patentes['Patente'].astype(str), df_patentes['Institucion'].astype(str)):
+        clave = limpiar_patente(patente)
+        if not clave or clave in indice: continue
+        institucion = institucion.upper()
+        if institucion not in clasificadas: clasificadas[institucion] = clasificar_institucion(institucion)
+        indice[clave] = clasificadas[institucion]
+    return indice
+
+@medido("cargar_indice_patentes", cacheada=True)
+@CACHE.dataset("indice_patentes", ttl=60, depende_de=("patentes",))
+@fallo_cache
+def cargar_indice_patentes():
+    # El dict se comparte sin copiarlo en cada tecla (st.cache_data lo deserializaría entero)
+    return compilar_indice_patentes(cargar_directorio_patentes())
+
+def detectar_cliente_automatico(patente_input):
+    patente_clean = limpiar_patente(patente_input)
+    if not patente_clean: return None, None
+    return cargar_indice_patentes().get(patente_clean, (None, None))
+
+# ==========================================
+# ÍNDICE DE VEHÍCULOS Y PRECARGA DEL ARRANQUE
+# ==========================================
+@medido("cargar_indice_vehiculos", cacheada=True)
+@CACHE.dataset("indice_vehiculos", ttl=3600)
+@fallo_cache
+def cargar_indice_vehiculos():
+    # El catálogo de marcas/modelos y su índice se comparten entre sesiones; se piden recién en el paso 2
+    return IndiceVehiculos(cargar_base_vehiculos())
+
+# Todas a la vez (un hilo por tarea); se encolan en el orden en que los pide la app por si se limita el pool
+PRECARGA = Precarga([("indice_patentes", cargar_indice_patentes), ("borradores_nube", traer_borradores_nube),
+                     ("catalogo", cargar_catalogo), ("indice_vehiculos", cargar_indice_vehiculos),
+                     ("activos_pdf", preparar_activos)])
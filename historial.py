@@ -0,0 +1,169 @@
+import io
+import re
+import numbers
+import time
+import zipfile
+import tempfile
+import threading
+from xml.sax.saxutils import escape
+import pandas as pd
+from nube import GESTOR
+from datos import ALMACEN, ENCABEZADO_HISTORIAL, conectar_google_sheets, hoja_historial
+from metricas import METRICAS, medido
+from planificador import PLANIFICADOR, PRIORIDAD_FONDO
+
+# ==========================================
+# HISTORIAL: COPIA LOCAL INCREMENTAL Y ANALÍTICA
+# ==========================================
+CLAVE_CURSOR = "historial_cursor"   # última fila de datos ya copiada (1 = primera fila bajo el encabezado)
+INTERVALO_MINIMO = 30               # segundos entre consultas a la nube mientras el dashboard está abierto
+FILAS_POR_BLOQUE = 5000             # tamaño de bloque al exportar
+MAX_EN_MEMORIA_EXPORTACION = 8 * 1024 * 1024  # sobre esto el archivo exportado pasa a disco
+
+def monto_a_entero(texto):
+    # "$1.234.567" -> 1234567 (los montos se guardan con format_clp, sin decimales)
+    digitos = re.sub(r"[^\d]", "", str(texto or ""))
+    return int(digitos) if digitos else 0
+
+def columnar(df):
+    # Tipos listos para agrupar: fecha como datetime64 y monto como int64
+    return pd.DataFrame({
+        "fila": df["fila"].astype("int64"),
+        "fecha": pd.to_datetime(df["fecha"], format="%d/%m/%Y", errors="coerce"),
+        "hora": df["hora"].astype(str), "correlativo": df["correlativo"].astype(str),
+        "patente": df["patente"].astype(str), "cliente": df["cliente"].astype(str),
+        "monto": df["monto"].fillna(0).astype("int64"),
+    })
+
+class CacheHistorial:
+    # La pestaña Historial solo crece: se baja lo posterior al cursor con UNA llamada (rango A{n}:F),
+    # se agrega a SQLite y a las columnas en memoria, y los agregados se recalculan solo si hubo filas nuevas.
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self._lock = threading.RLock()
+        self._df = None
+        self._agregados = None
+        self._ultima_consulta = 0.0
+        self.stats = {"consultas": 0, "filas_nuevas": 0, "errores": 0}
+
+    def cursor(self):
+        return int(self.almacen.leer_meta(CLAVE_CURSOR, 0))
+
+    def datos(self):
+        with self._lock:
+            if self._df is None: self._df = columnar(self.almacen.leer_historial_nube())
+            return self._df
+
+    @medido("actualizar_historial")
+    @PLANIFICADOR.con_prioridad(PRIORIDAD_FONDO)
+    def actualizar(self, forzar=False):
+        with self._lock:
+            if not forzar and time.monotonic() - self._ultima_consulta < INTERVALO_MINIMO: return 0
+            if not conectar_google_sheets(): return 0
+            cursor = self.cursor()
+            try: valores = hoja_historial().get(f"A{cursor + 2}:F")
+            except Exception:
+                self.stats["errores"] += 1; METRICAS.contar_fallo("actualizar_historial"); GESTOR.invalidar(); return 0
+            self._ultima_consulta = time.monotonic()
+            self.stats["consultas"] += 1
+            filas = []
+            nuevo_cursor = cursor
+            completas = True
+            for n, fila in enumerate(valores or [], cursor + 1):
+                fila = [str(v) for v in fila] + [''] * (6 - len(fila))
+                if any(fila): filas.append((n, fila[0], fila[1], fila[2], fila[3], fila[4], monto_a_entero(fila[5])))
+                # Una fila sin correlativo se está escribiendo (append_row + update_acell): el cursor no la
+                # pasa, así que se vuelve a bajar en la próxima consulta y queda con su número definitivo.
+                if completas and (fila[2] or not any(fila)): nuevo_cursor = n
+                else: completas = False
+            if not filas: return 0
+            self.almacen.guardar_filas_historial(filas, CLAVE_CURSOR, nuevo_cursor)
+            df = self.datos()
+            nuevas = columnar(pd.DataFrame(filas, columns=["fila", "fecha", "hora", "correlativo", "patente", "cliente", "monto"]))
+            self._df = pd.concat([df[df["fila"] <= cursor], nuevas], ignore_index=True)
+            self._agregados = None
+            self.stats["filas_nuevas"] += len(filas)
+            return len(filas)
+
+    def reconstruir(self):
+        with self._lock:
+            self.almacen.borrar_historial_nube(CLAVE_CURSOR)
+            self._df = None
+            self._agregados = None
+        return self.actualizar(forzar=True)
+
+    def agregados(self):
+        with self._lock:
+            if self._agregados is not None: return self._agregados
+            df = self.datos()
+            # to_period en vez de strftime: formatear 50.000 fechas como texto toma ~100x más
+            mes = df["fecha"].dt.to_period("M")
+            self._agregados = {
+                "por_institucion_mes": df.assign(mes=mes).groupby(["cliente", "mes"])["monto"].sum().unstack(fill_value=0),
+                "top_patentes": df.groupby("patente").agg(cotizaciones=("fila", "size"), monto=("monto", "sum"))
+                                  .sort_values(["cotizaciones", "monto"], ascending=False).head(10),
+                "por_dia": df.dropna(subset=["fecha"]).groupby("fecha").size().rename("cotizaciones"),
+            }
+            return self._agregados
+
+HISTORIAL = CacheHistorial(ALMACEN)
+
+# ==========================================
+# EXPORTACIÓN POR BLOQUES (CSV / EXCEL)
+# ==========================================
+def tabla_exportable(df):
+    return pd.DataFrame({
+        ENCABEZADO_HISTORIAL[0]: df["fecha"].dt.strftime("%d/%m/%Y").fillna(""), ENCABEZADO_HISTORIAL[1]: df["hora"],
+        ENCABEZADO_HISTORIAL[2]: df["correlativo"], ENCABEZADO_HISTORIAL[3]: df["patente"],
+        ENCABEZADO_HISTORIAL[4]: df["cliente"], ENCABEZADO_HISTORIAL[5]: df["monto"],
+    })
+
+def exportar_csv(df):
+    # Se escribe bloque a bloque a un archivo temporal (pasa a disco si crece) en vez de armar todo el texto en memoria
+    archivo = tempfile.SpooledTemporaryFile(max_size=MAX_EN_MEMORIA_EXPORTACION)
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    tabla = tabla_exportable(df)
+    for inicio in range(0, max(len(tabla), 1), FILAS_POR_BLOQUE):
+        tabla.iloc[inicio:inicio + FILAS_POR_BLOQUE].to_csv(texto, header=(inicio == 0), index=False)
+    texto.flush(); texto.detach()
+    archivo.seek(0)
+    return archivo
+
+XLSX_TIPOS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>')
+XLSX_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+XLSX_LIBRO = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Historial" sheetId="1" r:id="rId1"/></sheets></workbook>')
+XLSX_LIBRO_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/></Relationships>')
+
+def celda_xlsx(valor):
+    if isinstance(valor, numbers.Number) and not isinstance(valor, bool): return f'<c><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(valor))}</t></is></c>'
+
+def exportar_xlsx(df):
+    # .xlsx mínimo sin dependencias (textos en línea, sin estilos); la hoja se comprime fila a fila
+    archivo = tempfile.SpooledTemporaryFile(max_size=MAX_EN_MEMORIA_EXPORTACION)
+    tabla = tabla_exportable(df)
+    with zipfile.ZipFile(archivo, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", XLSX_TIPOS)
+        zf.writestr("_rels/.rels", XLSX_RELS)
+        zf.writestr("xl/workbook.xml", XLSX_LIBRO)
+        zf.writestr("xl/_rels/workbook.xml.rels", XLSX_LIBRO_RELS)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as hoja:
+            hoja.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            hoja.write(("<row>" + "".join(celda_xlsx(c) for c in tabla.columns) + "</row>").encode("utf-8"))
+            for inicio in range(0, len(tabla), FILAS_POR_BLOQUE):
+                bloque = tabla.iloc[inicio:inicio + FILAS_POR_BLOQUE].itertuples(index=False)
+                hoja.write("".join("<row>" + "".join(celda_xlsx(v) for v in fila) + "</row>" for fila in bloque).encode("utf-8"))
+            hoja.write(b"</sheetData></worksheet>")
+    archivo.seek(0)
+    return archivo
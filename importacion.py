@@ -0,0 +1,199 @@
+import io
+import re
+import time
+import zipfile
+import unicodedata
+import xml.etree.ElementTree as ET
+import pandas as pd
+from datos import (ALMACEN, SINCRONIZADOR, COLUMNAS_PRECIOS, COLUMNAS_PATENTES, conectar_google_sheets, subir_importacion, clave_trabajo,
+                   limpiar_patente, cargar_datos, cargar_directorio_patentes, precios_semilla, directorio_por_defecto)
+from metricas import METRICAS, medido
+from precios import COLUMNA_BASE, REGLAS_PRECIO, columna_pesos, compactar_tarifas
+
+# ==========================================
+# IMPORTACIÓN MASIVA: LISTA DE PRECIOS Y DIRECTORIO DE PATENTES
+# ==========================================
+# El archivo se valida y deduplica en local, se fusiona con la copia de SQLite (los cachés se
+# actualizan por write-through) y se sube en pocas escrituras por lotes; sin conexión queda en la cola.
+ALIAS_COLUMNAS = {
+    "precios": {"categoria": "Categoria", "trabajo": "Trabajo", "descripcion": "Trabajo", "nombre": "Trabajo",
+                "costo": COLUMNA_BASE, "precio": COLUMNA_BASE},
+    "patentes": {"patente": "Patente", "ppu": "Patente", "institucion": "Institucion", "cliente": "Institucion"},
+}
+OBLIGATORIAS = {"precios": ["Categoria", "Trabajo", COLUMNA_BASE], "patentes": COLUMNAS_PATENTES}
+
+# ==========================================
+# LECTURA DE CSV / EXCEL (SIN DEPENDENCIAS)
+# ==========================================
+NS_XLSX = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+           "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships"}
+
+def texto_xlsx(nodo):
+    return "".join(t.text or "" for t in nodo.iter(f"{{{NS_XLSX['m']}}}t"))
+
+def columna_xlsx(referencia):
+    # "AB12" -> 27 (desde 0)
+    n = 0
+    for letra in re.match(r"[A-Z]+", referencia).group(): n = n * 26 + ord(letra) - 64
+    return n - 1
+
+def leer_xlsx(contenido):
+    # Primera hoja del libro como texto: cadenas compartidas, en línea y números tal cual vienen
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+        nombres = set(zf.namelist())
+        compartidas = []
+        if "xl/sharedStrings.xml" in nombres:
+            compartidas = [texto_xlsx(si) for si in ET.fromstring(zf.read("xl/sharedStrings.xml")).iterfind("m:si", NS_XLSX)]
+        id_hoja = ET.fromstring(zf.read("xl/workbook.xml")).find("m:sheets/m:sheet", NS_XLSX).get(f"{{{NS_XLSX['r']}}}id")
+        destino = next(r.get("Target") for r in ET.fromstring(zf.read("xl/_rels/workbook.xml.rels")) if r.get("Id") == id_hoja)
+        hoja = ET.fromstring(zf.read(destino.lstrip("/") if destino.startswith("/") else "xl/" + destino))
+    filas = []
+    for fila in hoja.iterfind("m:sheetData/m:row", NS_XLSX):
+        celdas = {}
+        for c in fila.iterfind("m:c", NS_XLSX):
+            columna = columna_xlsx(c.get("r")) if c.get("r") else len(celdas)
+            if c.get("t") == "inlineStr": celdas[columna] = texto_xlsx(c); continue
+            v = c.find("m:v", NS_XLSX)
+            if v is not None: celdas[columna] = compartidas[int(v.text)] if c.get("t") == "s" else (v.text or "")
+        filas.append([celdas.get(k, "") for k in range(max(celdas, default=-1) + 1)])
+    if not filas: return pd.DataFrame()
+    ancho = max(len(f) for f in filas)
+    filas = [f + [""] * (ancho - len(f)) for f in filas]
+    return pd.DataFrame(filas[1:], columns=filas[0], dtype=object)
+
+def leer_csv(contenido):
+    # Separador detectado (Excel en español exporta con ";"); UTF-8 con o sin BOM, o Latin-1
+    try: texto = contenido.decode("utf-8-sig")
+    except UnicodeDecodeError: texto = contenido.decode("latin-1")
+    return pd.read_csv(io.StringIO(texto), sep=None, engine="python", dtype=str, keep_default_na=False)
+
+def leer_archivo(nombre, contenido):
+    if nombre.lower().endswith(".xlsx"): return leer_xlsx(contenido)
+    if nombre.lower().endswith(".csv"): return leer_csv(contenido)
+    raise ValueError(f"Formato no soportado: {nombre} (use .csv o .xlsx)")
+
+# ==========================================
+# VALIDACIÓN Y DEDUPLICACIÓN LOCAL
+# ==========================================
+def normalizar_encabezado(texto):
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "_", texto.lower()).strip("_")
+
+def limpiar_texto(serie):
+    return serie.fillna("").astype(str).str.split().str.join(" ")
+
+def normalizar_columnas(df, tipo):
+    alias = {**ALIAS_COLUMNAS[tipo], **{normalizar_encabezado(c): c for c in (COLUMNAS_PRECIOS if tipo == "precios" else COLUMNAS_PATENTES)}}
+    df = df.rename(columns={c: alias.get(normalizar_encabezado(c), c) for c in df.columns})
+    df = df.loc[:, ~df.columns.duplicated()]
+    faltan = [c for c in OBLIGATORIAS[tipo] if c not in df.columns]
+    if faltan: raise ValueError(f"Faltan columnas: {', '.join(faltan)}")
+    return df
+
+def validar_precios(df):
+    # -> (DataFrame en el esquema de la hoja, descartes [{fila, motivo}], duplicadas)
+    df = normalizar_columnas(df, "precios")
+    categoria, trabajo = limpiar_texto(df["Categoria"]), limpiar_texto(df["Trabajo"])
+    base = columna_pesos(df[COLUMNA_BASE])
+    motivos = pd.Series("", index=df.index)
+    for columna in reversed([c for c in REGLAS_PRECIO if c in df.columns]):
+        texto = limpiar_texto(df[columna])
+        motivos[(texto != "") & pd.isna(columna_pesos(texto))] = f"{columna} no es un número"
+    motivos[~(base > 0)] = "Costo SSAS vacío, no numérico o ≤ 0"
+    motivos[trabajo == ""] = "Sin nombre de trabajo"
+    motivos[categoria == ""] = "Sin categoría"
+    vacia = (categoria == "") & (trabajo == "") & (limpiar_texto(df[COLUMNA_BASE]) == "")
+    validas = (motivos == "") & ~vacia
+    # Una tarifa que no viene en el archivo no se toca: se conservan las excepciones que ya tenga la hoja
+    presentes = [c for c in COLUMNAS_PRECIOS if c in OBLIGATORIAS["precios"] or c in df.columns]
+    limpio = pd.DataFrame({"Categoria": categoria, "Trabajo": trabajo, COLUMNA_BASE: base}, index=df.index)
+    for columna in presentes[3:]: limpio[columna] = limpiar_texto(df[columna])
+    limpio = limpio[validas]
+    claves = pd.Series([clave_trabajo(c, t) for c, t in zip(limpio["Categoria"], limpio["Trabajo"])], index=limpio.index)
+    # Si un trabajo se repite en el archivo, manda la última fila
+    unicas = limpio[~claves.duplicated(keep="last")]
+    descartes = [{"fila": i + 2, "motivo": m} for i, m in motivos[(motivos != "") & ~vacia].items()]
+    return compactar_tarifas(unicas)[presentes].reset_index(drop=True), descartes, len(limpio) - len(unicas)
+
+def validar_patentes(df):
+    df = normalizar_columnas(df, "patentes")
+    patente = df["Patente"].fillna("").astype(str).map(limpiar_patente)
+    institucion = limpiar_texto(df["Institucion"]).str.upper()
+    motivos = pd.Series("", index=df.index)
+    motivos[institucion == ""] = "Sin institución"
+    motivos[(patente != "") & ~patente.str.len().between(5, 8)] = "Patente de largo inválido"
+    motivos[patente == ""] = "Sin patente"
+    vacia = (patente == "") & (institucion == "")
+    validas = (motivos == "") & ~vacia
+    limpio = pd.DataFrame({"Patente": patente, "Institucion": institucion}, index=df.index)[validas]
+    unicas = limpio[~limpio["Patente"].duplicated(keep="last")]
+    descartes = [{"fila": i + 2, "motivo": m} for i, m in motivos[(motivos != "") & ~vacia].items()]
+    return unicas.reset_index(drop=True), descartes, len(limpio) - len(unicas)
+
+VALIDADORES = {"precios": validar_precios, "patentes": validar_patentes}
+
+@medido("preparar_importacion")
+def preparar_importacion(tipo, nombre, contenido):
+    # Todo lo que se puede saber sin tocar la nube; la vista previa del Admin muestra esto
+    df = leer_archivo(nombre, contenido)
+    filas, descartes, duplicadas = VALIDADORES[tipo](df)
+    return {"tipo": tipo, "leidas": len(df), "filas": filas, "descartes": descartes, "duplicadas": duplicadas}
+
+# ==========================================
+# FUSIÓN LOCAL Y SUBIDA
+# ==========================================
+def fusionar_local(actual, nuevas, claves):
+    # Upsert en memoria con la misma regla que la nube: las filas que ya están se reemplazan en su
+    # lugar (el índice no cambia, así las claves q_ del editor siguen valiendo) y las demás se agregan
+    actual = actual.reset_index(drop=True)
+    posiciones = {}
+    for i, k in enumerate(claves(actual)):
+        posiciones.setdefault(k, i)
+    destino = [posiciones.get(k) for k in claves(nuevas)]
+    existentes = [(i, j) for i, j in enumerate(destino) if j is not None]
+    columnas = [c for c in nuevas.columns if c in actual.columns]
+    previo = actual.loc[[j for _, j in existentes], columnas].astype(str).to_numpy()
+    entrante = nuevas.iloc[[i for i, _ in existentes]][columnas].astype(str).to_numpy()
+    cambiaron = (previo != entrante).any(axis=1) if len(existentes) else []
+    actualizadas = [(i, j) for (i, j), cambio in zip(existentes, cambiaron) if cambio]
+    actual = actual.astype(object)
+    for i, j in actualizadas: actual.loc[j, columnas] = nuevas.iloc[i][columnas].tolist()
+    agregadas = nuevas.iloc[[i for i, j in enumerate(destino) if j is None]]
+    fusion = pd.concat([actual, agregadas], ignore_index=True).fillna("") if len(agregadas) else actual
+    return fusion, {"nuevas": len(agregadas), "actualizadas": len(actualizadas), "sin_cambios": len(existentes) - len(actualizadas)}
+
+DESTINOS = {
+    "precios": {"cargar": cargar_datos, "por_defecto": precios_semilla,
+                "claves": lambda df: [clave_trabajo(c, t) for c, t in zip(df["Categoria"], df["Trabajo"])]},
+    "patentes": {"cargar": cargar_directorio_patentes, "por_defecto": directorio_por_defecto,
+                 "claves": lambda df: [limpiar_patente(str(p)) for p in df["Patente"]]},
+}
+
+@medido("importar")
+def importar(previa):
+    # Devuelve el informe: conteos, llamadas a Sheets y filas por segundo de la subida
+    tipo, filas = previa["tipo"], previa["filas"]
+    destino = DESTINOS[tipo]
+    t0 = time.perf_counter()
+    actual = ALMACEN.leer_dataset(tipo)
+    if actual is None: actual = destino["por_defecto"]()
+    fusion, informe = fusionar_local(actual, filas, destino["claves"])
+    ALMACEN.guardar_dataset(tipo, fusion)
+    destino["cargar"].escribir(fusion)
+    informe.update(leidas=previa["leidas"], validas=len(filas), descartadas=len(previa["descartes"]), duplicadas=previa["duplicadas"],
+                   local_ms=round((time.perf_counter() - t0) * 1000, 1), llamadas=0, en_cola=False)
+    payload = {"hoja": tipo, "columnas": filas.columns.tolist(), "filas": filas.values.tolist()}
+    t1 = time.perf_counter()
+    en_nube = None
+    if conectar_google_sheets():
+        try: en_nube = subir_importacion(payload)
+        except Exception: METRICAS.contar_fallo("importar")
+    segundos = time.perf_counter() - t1
+    if en_nube is None:
+        # Sin nube (o falló a mitad): el sincronizador la repite entera; la fusión no duplica filas
+        ALMACEN.encolar("importacion", payload)
+        SINCRONIZADOR.despertar()
+        informe["en_cola"] = True
+    else:
+        informe.update(llamadas=en_nube["llamadas"], nube_s=round(segundos, 2), filas_por_segundo=round(len(filas) / max(segundos, 1e-6), 1))
+    return informe
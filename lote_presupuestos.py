@@ -0,0 +1,103 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datos import PDFS
+from cache_pdf import huella_pdf
+from cotizador import precios_por_tarifa, resolver_spec, registrar, renderizar_pdf, argumentos_pdf
+
+# ==========================================
+# REGENERACIÓN DE PRESUPUESTOS EN LOTE (SIN STREAMLIT)
+# ==========================================
+# Uso:  python lote_presupuestos.py specs.json --salida pdfs/ [--procesos 4] [--registrar]
+#
+# JSON: lista de presupuestos, por ejemplo
+#   [{"patente": "HXRP10", "tarifa": "Hospital Temuco", "estado": "Trabajo Realizado", "observaciones": "",
+#     "correlativo": "812", "items": [{"trabajo": "Cambio foco escena", "cantidad": 2},
+#                                     {"descripcion": "Repuesto especial", "cantidad": 1, "unitario": 45000}]}]
+# CSV: una fila por ítem; las filas con el mismo valor en "presupuesto" forman un presupuesto.
+#   presupuesto,patente,tarifa,estado,observaciones,correlativo,trabajo,cantidad,unitario
+#
+# Campos opcionales por presupuesto: marca_modelo, cliente, rut, usuario_final, oficial, fotos (rutas).
+# Los que ya se emitieron hoy con las mismas entradas salen de la caché de PDF sin pasar por el pool.
+CAMPOS_PRESUPUESTO = ["patente", "tarifa", "estado", "observaciones", "correlativo", "marca_modelo", "cliente", "rut", "usuario_final", "oficial"]
+
+def leer_specs(ruta):
+    if ruta.lower().endswith('.json'):
+        with open(ruta, encoding='utf-8') as f: return json.load(f)
+    specs = {}
+    with open(ruta, encoding='utf-8', newline='') as f:
+        for fila in csv.DictReader(f):
+            clave = fila.get("presupuesto") or f"{fila.get('patente')}|{fila.get('correlativo')}"
+            if clave not in specs:
+                specs[clave] = {k: fila[k] for k in CAMPOS_PRESUPUESTO if fila.get(k)}
+                specs[clave]["items"] = []
+            # Texto tal cual: resolver_spec lo convierte dentro del try de cada presupuesto (una fila mala no corta el lote)
+            item = {"cantidad": fila.get("cantidad") or 1}
+            if fila.get("unitario"): item.update(descripcion=fila.get("trabajo") or fila.get("descripcion"), unitario=fila["unitario"])
+            else: item["trabajo"] = fila.get("trabajo")
+            specs[clave]["items"].append(item)
+    return list(specs.values())
+
+def renderizar(presupuesto, salida):
+    # Corre en un proceso del pool: solo genera el PDF, nunca toca Sheets
+    pdf_bytes, segundos = renderizar_pdf(presupuesto)
+    return escribir(presupuesto, pdf_bytes, salida), pdf_bytes, segundos
+
+def escribir(presupuesto, pdf_bytes, salida):
+    ruta = os.path.join(salida, presupuesto["nombre"])
+    with open(ruta, 'wb') as f: f.write(pdf_bytes)
+    return ruta
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera presupuestos PDF en lote a partir de un CSV o JSON")
+    parser.add_argument("specs", help="Archivo .json o .csv con los presupuestos")
+    parser.add_argument("--salida", default="presupuestos_lote", help="Directorio de salida")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--registrar", action="store_true", help="Asigna correlativos nuevos en el Historial a los que no traen uno")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.salida, exist_ok=True)
+    specs = leer_specs(args.specs)
+    precios = precios_por_tarifa()
+    errores = []
+    listos = []
+    for n, spec in enumerate(specs, 1):
+        try: listos.append(resolver_spec(spec, precios, n))
+        except Exception as e: errores.append((f"#{n} {spec.get('patente', '') if isinstance(spec, dict) else ''}", f"{type(e).__name__}: {e}"))
+    if args.registrar: listos = [registrar(p) for p in listos]
+
+    t0 = time.perf_counter()
+    generados = desde_cache = 0
+    faltantes = []
+    for p in listos:
+        huella = huella_pdf(argumentos_pdf(p))
+        pdf_bytes = PDFS.obtener(huella)
+        if pdf_bytes is None: faltantes.append((p, huella)); continue
+        desde_cache += 1
+        print(f"CACHÉ {escribir(p, pdf_bytes, args.salida)}")
+    with ProcessPoolExecutor(max_workers=max(1, args.procesos)) as pool:
+        futuros = {pool.submit(renderizar, p, args.salida): (p, huella) for p, huella in faltantes}
+        for futuro in as_completed(futuros):
+            p, huella = futuros[futuro]
+            try:
+                ruta, pdf_bytes, seg = futuro.result()
+                generados += 1
+                PDFS.guardar(huella, pdf_bytes, p["correlativo"], p["patente"], p["nombre"])
+                print(f"OK    {ruta} ({len(pdf_bytes) / 1024:.0f} KB, {seg * 1000:.0f} ms)")
+            except Exception as e:
+                errores.append((p["nombre"], "".join(traceback.format_exception_only(type(e), e)).strip()))
+    dur = time.perf_counter() - t0
+
+    for nombre, error in errores: print(f"ERROR {nombre}: {error}", file=sys.stderr)
+    # El ritmo solo tiene sentido si se generó algo: servir todo desde la caché no es un PDF/s del pool
+    ritmo = f" en {dur:.2f} s ({generados / dur:.1f} PDF/s, {args.procesos} procesos)" if generados and dur else ""
+    print(f"{generados} PDF generados{ritmo}, {desde_cache} desde la caché, {len(errores)} errores")
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
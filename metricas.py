@@ -0,0 +1,104 @@
+import json
+import time
+import functools
+import threading
+from datetime import datetime
+
+# ==========================================
+# MÉTRICAS DE RENDIMIENTO (POR PROCESO Y POR RERUN)
+# ==========================================
+class Metricas:
+    # Acumula por nombre: llamadas, latencia, aciertos/fallos de caché, errores y las fallas que
+    # los except silenciosos se tragan. Además guarda los eventos del rerun en curso (por hilo).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {}
+        self._local = threading.local()
+
+    def _entrada(self, nombre):
+        if nombre not in self._datos:
+            self._datos[nombre] = {"llamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "ultimo_ms": 0.0, "errores": 0,
+                                   "aciertos_cache": 0, "fallos_cache": 0, "fallos_silenciados": 0}
+        return self._datos[nombre]
+
+    def _evento(self, evento):
+        rerun = getattr(self._local, 'eventos', None)
+        if rerun is not None: rerun.append(evento)
+
+    def registrar(self, nombre, ms, error=False, cache=None):
+        with self._lock:
+            e = self._entrada(nombre)
+            e["llamadas"] += 1
+            e["total_ms"] += ms
+            e["max_ms"] = max(e["max_ms"], ms)
+            e["ultimo_ms"] = ms
+            if error: e["errores"] += 1
+            if cache is True: e["aciertos_cache"] += 1
+            elif cache is False: e["fallos_cache"] += 1
+        self._evento({"nombre": nombre, "ms": round(ms, 3), "cache": cache, "error": error})
+
+    def contar_fallo(self, nombre):
+        # Para los except que siguen de largo: la falla no se propaga, pero queda contada
+        with self._lock: self._entrada(nombre)["fallos_silenciados"] += 1
+        self._evento({"nombre": nombre, "fallo_silenciado": True})
+
+    def iniciar_rerun(self):
+        self._local.eventos = []
+        self._local.inicio = time.perf_counter()
+
+    def cerrar_rerun(self):
+        inicio = getattr(self._local, 'inicio', None)
+        if inicio is None: return None
+        ms = (time.perf_counter() - inicio) * 1000
+        eventos = self._local.eventos
+        self._local.eventos = None
+        self._local.inicio = None
+        self.registrar("rerun completo", ms)
+        return {"total_ms": round(ms, 3), "eventos": eventos}
+
+    def resumen(self):
+        with self._lock:
+            filas = []
+            for nombre, e in sorted(self._datos.items()):
+                fila = {"nombre": nombre, **e}
+                fila["promedio_ms"] = e["total_ms"] / e["llamadas"] if e["llamadas"] else 0.0
+                filas.append(fila)
+            return filas
+
+    def exportar_json(self, **extra):
+        return json.dumps({"generado": datetime.now().isoformat(timespec="seconds"), "metricas": self.resumen(), **extra},
+                          indent=2, ensure_ascii=False, default=str)
+
+    def reiniciar(self):
+        with self._lock: self._datos = {}
+
+METRICAS = Metricas()
+_marcos = threading.local()
+
+def medido(nombre, cacheada=False):
+    # Decorador externo: mide cada llamada. Con cacheada=True, la función cacheada debe llevar
+    # @fallo_cache por dentro (bajo @st.cache_*) para distinguir aciertos de recálculos.
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            pila = _marcos.__dict__.setdefault('pila', [])
+            pila.append(False)
+            t0 = time.perf_counter()
+            error = False
+            try: return fn(*args, **kwargs)
+            except Exception:
+                error = True; raise
+            finally:
+                recalculo = pila.pop()
+                METRICAS.registrar(nombre, (time.perf_counter() - t0) * 1000, error, cache=(not recalculo) if cacheada else None)
+        if hasattr(fn, 'clear'): envoltura.clear = fn.clear
+        return envoltura
+    return decorador
+
+def fallo_cache(fn):
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        pila = getattr(_marcos, 'pila', None)
+        if pila: pila[-1] = True
+        return fn(*args, **kwargs)
+    return envoltura
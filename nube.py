@@ -0,0 +1,241 @@
+import os
+import re
+import functools
+import threading
+from datetime import datetime, timedelta
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from metricas import METRICAS
+from planificador import PLANIFICADOR
+
+# ==========================================
+# GESTOR DE CONEXIÓN A GOOGLE SHEETS (UNO POR PROCESO)
+# ==========================================
+NOMBRE_HOJA_GOOGLE = "DB_Cotizador"
+SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+MARGEN_RENOVACION_TOKEN = timedelta(minutes=5)
+HOJA_PRINCIPAL = None  # Clave de sheet1 (lista de precios) en el caché de worksheets
+COLUMNA_CORRELATIVO = 3  # Columna C del Historial
+FILAS_POR_LLAMADA = 1000  # filas por escritura masiva (el cuerpo queda muy por debajo del límite de la API)
+LECTURAS = {"get_all_records", "get_all_values", "get", "batch_get", "col_values", "row_values", "acell", "cell", "worksheet", "worksheets"}
+ESCRITURAS = {"append_row", "append_rows", "update", "update_acell", "update_cell", "batch_update", "clear",
+              "insert_row", "insert_rows", "delete_rows", "add_worksheet"}
+NO_REPETIBLES = {"append_row", "append_rows", "insert_row", "insert_rows", "delete_rows", "add_worksheet"}  # solo se reintentan ante un 429
+
+def cargar_credenciales():
+    try:
+        import streamlit as st
+        if "gcp_service_account" in st.secrets:
+            return ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], SCOPE)
+    except Exception: pass
+    if os.path.exists('credentials.json'):
+        return ServiceAccountCredentials.from_json_keyfile_name('credentials.json', SCOPE)
+    return None
+
+class HojaPlanificada:
+    # Envuelve un spreadsheet o worksheet de gspread: cada llamada a la API pasa por el planificador
+    # (cupo, prioridad, reintentos); atributos y métodos locales se entregan tal cual
+    def __init__(self, objeto, planificador):
+        self._objeto = objeto
+        self._planificador = planificador
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        tipo = "lectura" if nombre in LECTURAS else "escritura" if nombre in ESCRITURAS else None
+        if tipo is None or not callable(valor): return valor
+        return functools.partial(self._planificador.ejecutar, tipo, valor, repetible=nombre not in NO_REPETIBLES)
+
+class GestorSheets:
+    # Mantiene un solo cliente autorizado, renueva el token antes de que expire y
+    # guarda los handles del spreadsheet y de cada worksheet para no reabrirlos en cada rerun.
+    def __init__(self, nombre_hoja=NOMBRE_HOJA_GOOGLE, fabrica_credenciales=cargar_credenciales, fabrica_cliente=gspread.authorize,
+                 planificador=PLANIFICADOR):
+        self.nombre_hoja = nombre_hoja
+        self.planificador = planificador
+        self._fabrica_credenciales = fabrica_credenciales
+        self._fabrica_cliente = fabrica_cliente
+        self._lock = threading.RLock()
+        self._lock_creacion = threading.Lock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self.stats = {"autorizaciones": 0, "autorizaciones_ahorradas": 0, "renovaciones_token": 0,
+                      "aperturas": 0, "aperturas_ahorradas": 0, "worksheets": 0, "worksheets_ahorradas": 0,
+                      "invalidaciones": 0}
+
+    def _renovar_si_expira(self):
+        http = getattr(self._client, 'http_client', None)
+        auth = getattr(http, 'auth', None)
+        expiry = getattr(auth, 'expiry', None)
+        if expiry is None or expiry - datetime.utcnow() > MARGEN_RENOVACION_TOKEN: return
+        try:
+            http.login()
+            self.stats["renovaciones_token"] += 1
+        except Exception:
+            METRICAS.contar_fallo("renovar_token_sheets"); self.invalidar()
+
+    def cliente(self):
+        with self._lock:
+            if self._client is not None: self._renovar_si_expira()
+            if self._client is not None:
+                self.stats["autorizaciones_ahorradas"] += 1
+                return self._client
+            try:
+                creds = self._fabrica_credenciales()
+                if creds is None: return None
+                self._client = self._fabrica_cliente(creds)
+                self.stats["autorizaciones"] += 1
+            except Exception:
+                METRICAS.contar_fallo("autorizar_sheets"); self._client = None
+            return self._client
+
+    def hoja(self):
+        with self._lock:
+            client = self.cliente()
+            if client is None: return None
+            if self._spreadsheet is not None:
+                self.stats["aperturas_ahorradas"] += 1
+                return self._spreadsheet
+            self._spreadsheet = HojaPlanificada(self.planificador.ejecutar("lectura", client.open, self.nombre_hoja), self.planificador)
+            self.stats["aperturas"] += 1
+            return self._spreadsheet
+
+    def worksheet(self, titulo=HOJA_PRINCIPAL):
+        # Lanza gspread.WorksheetNotFound si la pestaña no existe; devuelve None si no hay conexión.
+        # El handshake va bajo el lock (uno solo por proceso), pero la búsqueda de la pestaña no: la
+        # precarga abre varias a la vez y no tienen por qué hacer fila.
+        with self._lock:
+            if titulo in self._worksheets:
+                self.stats["worksheets_ahorradas"] += 1
+                return self._worksheets[titulo]
+            sheet = self.hoja()
+        if sheet is None: return None
+        # sheet1 también consulta la API (metadatos del spreadsheet)
+        ws = HojaPlanificada(self.planificador.ejecutar("lectura", lambda: sheet.sheet1) if titulo is HOJA_PRINCIPAL else sheet.worksheet(titulo), self.planificador)
+        with self._lock:
+            self.stats["worksheets"] += 1
+            if sheet is self._spreadsheet: ws = self._worksheets.setdefault(titulo, ws)
+            return ws
+
+    def crear_worksheet(self, titulo, rows, cols):
+        # Las creaciones sí van de a una (dos add_worksheet con el mismo título chocan en la API)
+        with self._lock_creacion:
+            with self._lock:
+                if titulo in self._worksheets: return self._worksheets[titulo]
+                sheet = self.hoja()
+            if sheet is None: return None
+            ws = HojaPlanificada(sheet.add_worksheet(title=titulo, rows=rows, cols=cols), self.planificador)
+            with self._lock:
+                if sheet is self._spreadsheet: self._worksheets[titulo] = ws
+                return ws
+
+    def configurar(self, fabrica_credenciales=None, fabrica_cliente=None, planificador=None):
+        # Permite conectar otro backend (p. ej. la hoja falsa de benchmarks/) sin tocar los helpers
+        with self._lock:
+            if fabrica_credenciales is not None: self._fabrica_credenciales = fabrica_credenciales
+            if fabrica_cliente is not None: self._fabrica_cliente = fabrica_cliente
+            if planificador is not None: self.planificador = planificador
+            self.invalidar()
+
+    def invalidar(self):
+        # Se llama cuando una operación falla: el próximo acceso vuelve a autorizar y abrir
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._worksheets = {}
+            self.stats["invalidaciones"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            s = dict(self.stats)
+        s["handshakes_ahorrados"] = s["autorizaciones_ahorradas"] + s["aperturas_ahorradas"] + s["worksheets_ahorradas"]
+        return s
+
+GESTOR = GestorSheets()
+
+# ==========================================
+# CORRELATIVOS EN O(1)
+# ==========================================
+def fila_desde_rango(rango):
+    # "'Historial'!A57:F57" -> 57
+    match = re.search(r'![A-Z]+(\d+)', rango)
+    if not match: raise ValueError(f"Rango inesperado: {rango}")
+    return int(match.group(1))
+
+def agregar_al_historial(ws, fila):
+    # Sheets serializa los append: la fila asignada es única aunque dos estaciones finalicen
+    # a la vez, y el número sale de ella sin descargar el Historial. La fila 1 son los
+    # encabezados, así que el correlativo es fila - 1 (mismo esquema que len(get_all_values())).
+    # Devuelve (fila, correlativo): desde aquí el número ya es definitivo.
+    resp = ws.append_row(fila, table_range="A1")
+    n_fila = fila_desde_rango(resp['updates']['updatedRange'])
+    return n_fila, str(n_fila - 1) # SIN RELLENO DE CEROS
+
+def escribir_correlativo(ws, n_fila, correlativo, columna=COLUMNA_CORRELATIVO):
+    # Idempotente: reintentarla no duplica nada
+    ws.update_acell(gspread.utils.rowcol_to_a1(n_fila, columna), correlativo)
+
+# ==========================================
+# ESCRITURA MASIVA POR LOTES
+# ==========================================
+def rangos_contiguos(numeros):
+    # [5, 6, 7, 10] -> [(5, 7), (10, 10)]
+    rangos = []
+    for n in sorted(numeros):
+        if rangos and n == rangos[-1][1] + 1: rangos[-1][1] = n
+        else: rangos.append([n, n])
+    return [tuple(r) for r in rangos]
+
+def eliminar_filas(ws, filas):
+    # Elimina (no blanquea) las filas dadas en UNA llamada: un deleteDimension por rango contiguo, de abajo
+    # hacia arriba para que cada uno no corra a los siguientes. Como append, no se repite salvo ante un 429
+    # (call-time repetible pisa al del partial), porque repetida eliminaría otras filas.
+    sheet = GESTOR.hoja()
+    if sheet is None: raise ConnectionError("Sin conexión a Google Sheets")
+    pedidos = [{"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": i - 1, "endIndex": j}}}
+               for i, j in reversed(rangos_contiguos(filas))]
+    return sheet.batch_update({"requests": pedidos}, repetible=False)
+
+def fusionar_por_lotes(ws, encabezado, filas, clave):
+    # Upsert de miles de filas con una lectura y pocas escrituras: `filas` son dicts columna -> valor y
+    # `clave(dict)` identifica la fila. Las que ya están y cambiaron se reescriben en su lugar (un
+    # batch_update con un rango por tramo contiguo), las nuevas se agregan con append_rows; todo en
+    # llamadas de hasta FILAS_POR_LLAMADA filas (el planificador las espacia según el cupo). Repetirla
+    # no duplica nada: sirve de reintento.
+    actuales = ws.get_all_values()
+    columnas = list(actuales[0]) if actuales else []
+    faltantes = [c for c in encabezado if c not in columnas]
+    resumen = {"nuevas": 0, "actualizadas": 0, "sin_cambios": 0, "llamadas": 1}
+    if faltantes:
+        # Hoja vacía o sin alguna columna: primero se completa el encabezado
+        columnas += faltantes
+        ws.update([columnas], "A1"); resumen["llamadas"] += 1
+    posiciones = {}
+    for n, valores in enumerate(actuales[1:], start=2):
+        k = clave(dict(zip(columnas, valores)))
+        if k and k not in posiciones: posiciones[k] = (n, valores)
+    cambios, nuevas = {}, []
+    for fila in filas:
+        n, valores = posiciones.get(clave(fila), (None, None))
+        if n is None:
+            nuevas.append([fila.get(c, '') for c in columnas]); continue
+        valores = list(valores) + [''] * (len(columnas) - len(valores))
+        fusionada = [fila.get(c, v) for c, v in zip(columnas, valores)]
+        if [str(v) for v in fusionada] == [str(v) for v in valores]: resumen["sin_cambios"] += 1
+        else: cambios[n] = fusionada
+    ultima = re.sub(r"\d", "", gspread.utils.rowcol_to_a1(1, len(columnas)))
+    lote, en_lote = [], 0
+    for inicio, fin in rangos_contiguos(cambios):
+        for desde in range(inicio, fin + 1, FILAS_POR_LLAMADA):
+            hasta = min(desde + FILAS_POR_LLAMADA - 1, fin)
+            if en_lote and en_lote + hasta - desde + 1 > FILAS_POR_LLAMADA:
+                ws.batch_update(lote); resumen["llamadas"] += 1
+                lote, en_lote = [], 0
+            lote.append({"range": f"A{desde}:{ultima}{hasta}", "values": [cambios[n] for n in range(desde, hasta + 1)]})
+            en_lote += hasta - desde + 1
+    if lote:
+        ws.batch_update(lote); resumen["llamadas"] += 1
+    for desde in range(0, len(nuevas), FILAS_POR_LLAMADA):
+        ws.append_rows(nuevas[desde:desde + FILAS_POR_LLAMADA], table_range="A1"); resumen["llamadas"] += 1
+    resumen["actualizadas"], resumen["nuevas"] = len(cambios), len(nuevas)
+    return resumen
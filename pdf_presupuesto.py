@@ -0,0 +1,452 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fpdf import FPDF
+from PIL import Image, ImageOps
+from metricas import METRICAS, medido
+from precios import calcular_iva
+
+# ==========================================
+# DATOS DE LA EMPRESA Y PLANTILLAS DEL PDF
+# ==========================================
+EMPRESA_NOMBRE = "C.H. SERVICIO AUTOMOTRIZ"
+RUT_EMPRESA = "13.961.700-2" 
+DIRECCION = "Francisco Pizarro 495, Padre las Casas, Región de la Araucanía"
+TELEFONO = "+56 9 8922 0616"
+EMAIL = "c.h.servicioautomotriz@gmail.com"
+
+# Textos fijos de encabezado y pie, armados una vez por variante (False = presupuesto, True = oficial Kaufmann)
+PLANTILLAS = {
+    False: {"empresa": EMPRESA_NOMBRE, "lineas": (f"RUT: {RUT_EMPRESA} | {TELEFONO}", EMAIL), "titulo": "PRESUPUESTO",
+            "pie": DIRECCION + " | Validez oferta: 15 días. Garantía: 3 meses.", "pie_multilinea": True},
+    True: {"empresa": "KAUFMANN S.A.", "lineas": ("Repuestos y Servicio Técnico Mercedes-Benz",), "titulo": "COTIZACIÓN",
+           "pie": "Kaufmann S.A. - Líderes en Movilidad", "pie_multilinea": False},
+}
+
+def format_clp(value):
+    try: return f"${float(value):,.0f}".replace(",", ".")
+    except: return "$0"
+
+# ==========================================
+# REGISTRO DE IMÁGENES (RESUELTAS Y DECODIFICADAS UNA VEZ POR PROCESO)
+# ==========================================
+RUTA_VARIANTES = os.environ.get("COTIZADOR_ACTIVOS", ".activos_pdf")
+DPI_ACTIVOS = 300      # resolución de impresión de las variantes
+CALIDAD_ACTIVOS = 88   # JPEG
+ANCHO_LOGO = 90        # mm, logo del taller en el encabezado
+ANCHO_LOGO_HEADER = 30 # mm, ambulancia / gendarmería junto al nombre de la empresa
+ACTIVOS_PDF = [("logo", ANCHO_LOGO), ("ambulancia", ANCHO_LOGO_HEADER), ("gendarmeria", ANCHO_LOGO_HEADER)]
+
+def buscar_imagen(nombre_base):
+    extensiones = ['.jpg', '.png', '.jpeg', '.JPG', '.PNG']
+    for ext in extensiones:
+        if os.path.exists(nombre_base + ext): return nombre_base + ext
+        if os.path.exists(nombre_base.capitalize() + ext): return nombre_base.capitalize() + ext
+    return None
+
+def variante_impresion(ruta, ancho_mm):
+    # JPEG al tamaño en que se imprime (ancho_mm a DPI_ACTIVOS). Se guarda en RUTA_VARIANTES con el hash del
+    # original en el nombre: si la imagen cambia, cambia el nombre y la variante anterior se descarta.
+    # Devuelve None si conviene incrustar el original (un JPEG que ya es igual o más chico que la variante).
+    with open(ruta, 'rb') as f: contenido = f.read()
+    ancho_px = round(ancho_mm / 25.4 * DPI_ACTIVOS)
+    prefijo = f"{os.path.splitext(os.path.basename(ruta))[0]}_{ancho_px}px_q{CALIDAD_ACTIVOS}_"
+    destino = os.path.join(RUTA_VARIANTES, prefijo + hashlib.sha256(contenido).hexdigest()[:16] + ".jpg")
+    if os.path.exists(destino):
+        with open(destino, 'rb') as f: datos = f.read()
+    else:
+        original = Image.open(io.BytesIO(contenido))
+        img = ImageOps.exif_transpose(original)
+        if original.format == 'JPEG' and img.width <= ancho_px: return None
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # FPDF no incrusta transparencias: se aplana sobre blanco, que es el fondo del encabezado
+            img = img.convert('RGBA')
+            fondo = Image.new('RGB', img.size, (255, 255, 255))
+            fondo.paste(img, mask=img.getchannel('A'))
+            img = fondo
+        img = img.convert('RGB')
+        if img.width > ancho_px: img = img.resize((ancho_px, max(1, round(img.height * ancho_px / img.width))), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=CALIDAD_ACTIVOS, optimize=True)
+        datos = buf.getvalue()
+        try:
+            os.makedirs(RUTA_VARIANTES, exist_ok=True)
+            for viejo in os.listdir(RUTA_VARIANTES):
+                if viejo.startswith(prefijo): os.remove(os.path.join(RUTA_VARIANTES, viejo))
+            temporal = destino + ".tmp"
+            with open(temporal, 'wb') as f: f.write(datos)
+            os.replace(temporal, destino)
+        except OSError: METRICAS.contar_fallo("guardar_variante_activo")
+    w, h = Image.open(io.BytesIO(datos)).size
+    return {'w': w, 'h': h, 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'DCTDecode', 'data': datos}
+
+class RegistroActivos:
+    # Guarda la ruta de cada imagen y su versión ya parseada por FPDF. Con ancho_mm se usa la variante de
+    # impresión (el PNG de la ambulancia pesa 2,4 MB a resolución completa y se imprime a 30 mm).
+    # Cada PDF recibe una copia del dict listo para incrustar.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}
+        self._imagenes = {}
+        self._preparando = {}  # clave -> lock mientras se prepara esa imagen
+        self.usar_variantes = True
+        self.stats = {"busquedas": 0, "busquedas_ahorradas": 0, "decodificaciones": 0, "reutilizaciones": 0, "variantes": 0}
+
+    def ruta(self, nombre_base):
+        with self._lock:
+            if nombre_base in self._rutas:
+                self.stats["busquedas_ahorradas"] += 1
+                return self._rutas[nombre_base]
+            self.stats["busquedas"] += 1
+            self._rutas[nombre_base] = buscar_imagen(nombre_base)
+            return self._rutas[nombre_base]
+
+    def info(self, ruta, ancho_mm=None):
+        if not self.usar_variantes: ancho_mm = None
+        try:
+            # Tamaño + mtime: si el archivo cambia se vuelve a preparar (y a hashear) su variante
+            st_archivo = os.stat(ruta)
+            firma = (st_archivo.st_size, st_archivo.st_mtime_ns) if ancho_mm else None
+        except OSError: firma = None
+        clave = (ruta, ancho_mm, firma)
+        with self._lock:
+            if clave in self._imagenes:
+                self.stats["reutilizaciones"] += 1
+                return self._imagenes[clave]
+            lock_clave = self._preparando.setdefault(clave, threading.Lock())
+        # Decodificar y escalar va fuera del lock general (ruta() y las demás imágenes no esperan); el de la
+        # clave evita que dos PDF preparen la misma variante a la vez
+        with lock_clave:
+            with self._lock:
+                if clave in self._imagenes:
+                    self.stats["reutilizaciones"] += 1
+                    return self._imagenes[clave]
+            info, variante = self._preparar(ruta, ancho_mm, firma)
+            with self._lock:
+                if variante: self.stats["variantes"] += 1
+                if info is not None: self.stats["decodificaciones"] += 1
+                self._imagenes[clave] = info
+                self._preparando.pop(clave, None)
+            return info
+
+    def _preparar(self, ruta, ancho_mm, firma):
+        info = None
+        if ancho_mm and firma:
+            try: info = variante_impresion(ruta, ancho_mm)
+            except Exception: METRICAS.contar_fallo("variante_impresion")
+            if info is not None: return info, True
+        if os.path.exists(ruta):
+            parser = FPDF()
+            ext = ruta.rsplit('.', 1)[-1].lower()
+            parsers = [parser._parsepng] if ext == 'png' else [parser._parsejpg] if ext in ('jpg', 'jpeg') else [parser._parsejpg, parser._parsepng]
+            for parse in parsers:
+                try:
+                    info = parse(ruta); break
+                except Exception: pass
+        return info, False
+
+    def colocar(self, pdf, ruta, x, y, w=0, h=0):
+        info = self.info(ruta, w or None)
+        if info is None: return False
+        nombre = f"{ruta}@{w}mm"
+        if nombre not in pdf.images:
+            # FPDF borra 'data' del dict al escribir el PDF: se entrega una copia, el original queda en caché
+            copia = dict(info)
+            copia['i'] = len(pdf.images) + 1
+            pdf.images[nombre] = copia
+        pdf.image(nombre, x=x, y=y, w=w, h=h)
+        return True
+
+    def limpiar(self):
+        with self._lock:
+            self._rutas = {}
+            self._imagenes = {}
+
+ACTIVOS = RegistroActivos()
+
+def encontrar_imagen(nombre_base):
+    return ACTIVOS.ruta(nombre_base)
+
+def preparar_activos():
+    # Deja listas (en disco y en memoria) las variantes del encabezado; corre en la precarga del arranque
+    listas = 0
+    for nombre, ancho in ACTIVOS_PDF:
+        ruta = ACTIVOS.ruta(nombre)
+        if ruta and ACTIVOS.info(ruta, ancho) is not None: listas += 1
+    return listas
+
+# ==========================================
+# FOTOS DEL REGISTRO FOTOGRÁFICO (EN MEMORIA, EN PARALELO Y CACHEADAS POR CONTENIDO)
+# ==========================================
+MAX_HILOS_FOTOS = min(8, (os.cpu_count() or 1) + 2)
+MAX_FOTOS_EN_CACHE = 128
+
+_pool_fotos = None
+_lock_fotos = threading.Lock()
+_cache_fotos = OrderedDict()  # sha256 del archivo original -> info lista para FPDF (LRU)
+STATS_FOTOS = {"preparadas": 0, "aciertos_cache": 0, "errores": 0}
+
+def leer_bytes(foto):
+    if isinstance(foto, (bytes, bytearray)): return bytes(foto)
+    if isinstance(foto, str):
+        with open(foto, 'rb') as f: return f.read()
+    if hasattr(foto, 'getvalue'): return foto.getvalue()
+    foto.seek(0)
+    return foto.read()
+
+def preparar_foto(contenido):
+    # Mismo tratamiento que antes (orientación EXIF, RGB, 600 px, JPEG q60), pero en memoria:
+    # se devuelve el dict que FPDF habría armado al leer el JPEG temporal.
+    img = Image.open(io.BytesIO(contenido))
+    img = ImageOps.exif_transpose(img)
+    img = img.convert('RGB')
+    img.thumbnail((600, 600))
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=60, optimize=True)
+    return {'w': img.width, 'h': img.height, 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'DCTDecode', 'data': buf.getvalue()}
+
+def _pool():
+    global _pool_fotos
+    with _lock_fotos:
+        if _pool_fotos is None: _pool_fotos = ThreadPoolExecutor(max_workers=MAX_HILOS_FOTOS, thread_name_prefix="fotos-pdf")
+        return _pool_fotos
+
+def preparar_fotos(fotos):
+    # Devuelve [(clave, info | None)] en el mismo orden; PIL suelta el GIL al decodificar y
+    # redimensionar, así que las fotos nuevas se procesan de verdad en paralelo.
+    resultado = [None] * len(fotos)
+    trabajos = {}
+    for i, foto in enumerate(fotos):
+        try: contenido = leer_bytes(foto)
+        except Exception:
+            METRICAS.contar_fallo("preparar_fotos"); STATS_FOTOS["errores"] += 1; resultado[i] = (None, None); continue
+        clave = "foto_" + hashlib.sha256(contenido).hexdigest()
+        with _lock_fotos:
+            info = _cache_fotos.get(clave)
+            if info is not None:
+                _cache_fotos.move_to_end(clave)
+                STATS_FOTOS["aciertos_cache"] += 1
+        if info is not None: resultado[i] = (clave, info)
+        else: trabajos[i] = (clave, _pool().submit(preparar_foto, contenido))
+    for i, (clave, futuro) in trabajos.items():
+        try: info = futuro.result()
+        except Exception:
+            METRICAS.contar_fallo("preparar_fotos"); STATS_FOTOS["errores"] += 1; resultado[i] = (None, None); continue
+        with _lock_fotos:
+            STATS_FOTOS["preparadas"] += 1
+            _cache_fotos[clave] = info
+            while len(_cache_fotos) > MAX_FOTOS_EN_CACHE: _cache_fotos.popitem(last=False)
+        resultado[i] = (clave, info)
+    return resultado
+
+def limpiar_cache_fotos():
+    with _lock_fotos: _cache_fotos.clear()
+
+def colocar_foto(pdf, clave, info, x, y, w, h):
+    if clave not in pdf.images:
+        copia = dict(info)
+        copia['i'] = len(pdf.images) + 1
+        pdf.images[clave] = copia
+    pdf.image(clave, x=x, y=y, w=w, h=h)
+
+# ==========================================
+# GENERACIÓN DEL PDF
+# ==========================================
+class PDF(FPDF):
+    def __init__(self, logo_header=None, correlativo=""):
+        super().__init__()
+        self.logo_header = logo_header
+        self.correlativo = correlativo
+
+    def header(self):
+        plantilla = PLANTILLAS[bool(self.is_official)]
+        logo_path = ACTIVOS.ruta("logo")
+        
+        # --- LÓGICA DE ENCABEZADO CORREGIDA ---
+        # Si hay logo y NO es oficial, dibujamos el logo en la izquierda (ancho grande) y OMITIMOS el texto duplicado
+        logo_dibujado = not self.is_official and logo_path and ACTIVOS.colocar(self, logo_path, x=10, y=8, w=ANCHO_LOGO)
+        if not logo_dibujado:
+            # Si es oficial o no hay logo, escribimos el texto a la izquierda
+            if self.logo_header and ACTIVOS.colocar(self, self.logo_header, x=10, y=8, w=ANCHO_LOGO_HEADER):
+                self.set_xy(45, 10)
+            else:
+                self.set_xy(10, 10)
+                
+            self.set_font('Arial', 'B', 16)
+            self.cell(0, 10, plantilla["empresa"], 0, 1, 'L')
+            
+            self.set_font('Arial', '', 9)
+            for linea in plantilla["lineas"]:
+                self.set_x(45 if self.logo_header else 10)
+                self.cell(0, 5, linea, 0, 1, 'L')
+        
+        # --- CAJA DE CORRELATIVO ROJA ---
+        self.set_xy(130, 10)
+        self.set_text_color(220, 0, 0) 
+        self.set_draw_color(220, 0, 0)
+        self.set_line_width(0.4)
+        
+        self.set_font('Arial', 'B', 16)
+        self.cell(70, 10, plantilla["titulo"], 'LTR', 1, 'C') 
+        
+        self.set_x(130)
+        self.set_font('Arial', 'B', 14)
+        correlativo_txt = f"N° {self.correlativo}" if self.correlativo and self.correlativo != "BORRADOR" else "N° BORRADOR"
+        self.cell(70, 10, correlativo_txt, 'LBR', 1, 'C')
+        
+        self.set_text_color(0, 0, 0)
+        self.set_draw_color(0, 0, 0)
+        self.set_line_width(0.2)
+        self.ln(15)
+
+    def footer(self):
+        # Footer automático en cada página (Línea + Legal)
+        self.set_y(-20)
+        self.set_font('Arial', 'I', 8)
+        self.line(10, self.get_y(), 200, self.get_y())
+        self.ln(2)
+        plantilla = PLANTILLAS[bool(self.is_official)]
+        if plantilla["pie_multilinea"]:
+            self.multi_cell(0, 4, plantilla["pie"], 0, 'C')
+        else:
+            self.cell(0, 4, plantilla["pie"], 0, 1, 'C')
+
+@medido("generar_pdf_exacto")
+def generar_pdf_exacto(patente, marca_modelo, cliente_nombre, cliente_rut, items, total_neto, is_official, watermark_file, estado_trabajo, usuario_final_txt, observaciones, correlativo, fotos_adjuntas):
+    pdf = PDF(logo_header=watermark_file, correlativo=correlativo)
+    pdf.is_official = is_official 
+    pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=30) 
+    
+    def fila_dinamica(lbl1, val1, lbl2, val2, is_last=False):
+        start_y = pdf.get_y()
+        pdf.set_font('Arial', 'B', 9); pdf.set_xy(10, start_y); pdf.cell(25, 6, lbl1, 0, 0, 'L')
+        pdf.set_font('Arial', '', 9); pdf.set_xy(35, start_y); pdf.multi_cell(70, 6, f": {val1}", 0, 'L')
+        y_left = pdf.get_y()
+        
+        y_right = start_y
+        if lbl2:
+            pdf.set_font('Arial', 'B', 9); pdf.set_xy(105, start_y); pdf.cell(30, 6, lbl2, 0, 0, 'L')
+            pdf.set_font('Arial', '', 9); pdf.set_xy(135, start_y); pdf.multi_cell(65, 6, f": {val2}", 0, 'L')
+            y_right = pdf.get_y()
+        
+        max_y = max(y_left, y_right, start_y + 6)
+        pdf.line(10, start_y, 10, max_y)
+        pdf.line(200, start_y, 200, max_y)
+        if is_last: pdf.line(10, max_y, 200, max_y)
+        pdf.set_xy(10, max_y)
+
+    pdf.set_y(45) 
+    pdf.set_font('Arial', 'B', 10)
+    pdf.set_fill_color(10, 37, 64) 
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(190, 6, "  DATOS DEL CLIENTE", 1, 1, 'L', 1)
+    pdf.set_text_color(0, 0, 0)
+    
+    nom = usuario_final_txt if is_official else cliente_nombre
+    rut = "" if is_official else cliente_rut
+    us_final = "" if is_official else usuario_final_txt
+    
+    fila_dinamica(" Señor(es)", str(nom).upper(), " Fecha Emisión", datetime.now().strftime('%d/%m/%Y'))
+    
+    if not is_official:
+        fila_dinamica(" RUT", str(rut).upper(), " Usuario Final", str(us_final).upper(), is_last=True)
+    else:
+        if rut: fila_dinamica(" RUT", str(rut).upper(), "", "", is_last=True) 
+        else: pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(4)
+    
+    pdf.set_font('Arial', 'B', 10)
+    pdf.set_fill_color(10, 37, 64)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(190, 6, "  DATOS DEL VEHÍCULO", 1, 1, 'L', 1)
+    pdf.set_text_color(0, 0, 0)
+    
+    fila_dinamica(" Marca / Modelo", str(marca_modelo).upper(), " Patente", str(patente).upper())
+    fila_dinamica(" Estado", str(estado_trabajo).upper(), "", "", is_last=True)
+    pdf.ln(6)
+
+    pdf.set_font('Arial', 'B', 9)
+    pdf.set_fill_color(10, 37, 64) 
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(115, 7, "Descripción", 1, 0, 'C', 1)
+    pdf.cell(15, 7, "Cant.", 1, 0, 'C', 1)
+    pdf.cell(30, 7, "Unitario", 1, 0, 'C', 1)
+    pdf.cell(30, 7, "Total", 1, 1, 'C', 1)
+    pdf.set_text_color(0, 0, 0) 
+    
+    pdf.set_font('Arial', '', 9)
+    for item in items:
+        unit = item['Unitario_Costo']
+        tot = item['Total_Costo']
+        x = pdf.get_x(); y = pdf.get_y()
+        pdf.multi_cell(115, 6, item['Descripción'].upper(), 1, 'L')
+        h = pdf.get_y() - y
+        pdf.set_xy(x+115, y)
+        pdf.cell(15, h, str(item['Cantidad']), 1, 0, 'C')
+        pdf.cell(30, h, format_clp(unit), 1, 0, 'R')
+        pdf.cell(30, h, format_clp(tot), 1, 1, 'R')
+        pdf.set_xy(x, y + h)
+
+    pdf.ln(5)
+    iva = calcular_iva(total_neto); bruto = total_neto + iva
+    
+    totals_width = 60 
+    safe_margin_right = 200 - totals_width
+    pdf.set_x(safe_margin_right)
+    
+    pdf.set_font('Arial', 'B', 9)
+    pdf.cell(30, 6, "SUB TOTAL", 1, 0, 'L'); pdf.set_font('Arial', '', 9); pdf.cell(30, 6, format_clp(total_neto), 1, 1, 'R')
+    pdf.set_x(safe_margin_right)
+    pdf.set_font('Arial', 'B', 9); pdf.cell(30, 6, "I.V.A. (19%)", 1, 0, 'L'); pdf.set_font('Arial', '', 9); pdf.cell(30, 6, format_clp(iva), 1, 1, 'R')
+    pdf.set_x(safe_margin_right)
+    pdf.set_font('Arial', 'B', 10)
+    pdf.set_fill_color(10, 37, 64) 
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(30, 8, "TOTAL", 1, 0, 'L', 1); pdf.cell(30, 8, format_clp(bruto), 1, 1, 'R', 1)
+    pdf.set_text_color(0, 0, 0)
+
+    if observaciones:
+        pdf.ln(8); pdf.set_font('Arial', 'B', 9); pdf.cell(0, 6, "OBSERVACIONES / NOTAS:", 0, 1)
+        pdf.set_font('Arial', '', 9); pdf.multi_cell(0, 5, observaciones, 0, 'L')
+
+    # --- FIRMA INTELIGENTE (SIN LOGO EXTRA) ---
+    if pdf.get_y() > 240:
+        pdf.add_page()
+    else:
+        pdf.ln(15)
+
+    fecha = datetime.now().strftime('%d-%m-%Y')
+    pdf.set_font('Arial', '', 10)
+    pdf.cell(0, 6, f"Padre las Casas, {fecha}", 0, 1, 'C')
+    firmante = PLANTILLAS[bool(is_official)]["empresa"]
+    pdf.set_font('Arial', 'B', 10)
+    pdf.cell(0, 5, firmante, 0, 1, 'C')
+
+    if fotos_adjuntas:
+        pdf.add_page()
+        pdf.set_font('Arial', 'B', 14); pdf.set_text_color(20, 20, 60)
+        pdf.cell(0, 10, "REGISTRO FOTOGRÁFICO", 0, 1, 'C')
+        pdf.ln(5)
+        
+        margin_x = 15; margin_y = 60
+        w_photo = 85; h_photo = 85
+        col_gap = 10; row_gap = 10
+        
+        fotos_listas = preparar_fotos(fotos_adjuntas)
+        for i, (clave, info) in enumerate(fotos_listas):
+            if i > 0 and i % 4 == 0:
+                pdf.add_page()
+                pdf.cell(0, 10, "REGISTRO FOTOGRÁFICO (Cont.)", 0, 1, 'C')
+            
+            pos_page = i % 4
+            row = pos_page // 2; col = pos_page % 2
+            x = margin_x + (col * (w_photo + col_gap))
+            y = margin_y + (row * (h_photo + row_gap))
+            
+            if info is not None: colocar_foto(pdf, clave, info, x, y, w_photo, h_photo)
+
+    return pdf.output(dest='S').encode('latin-1')
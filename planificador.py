@@ -0,0 +1,151 @@
+import time
+import heapq
+import random
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+import requests
+import gspread
+
+# ==========================================
+# PLANIFICADOR DE LLAMADAS A GOOGLE SHEETS
+# ==========================================
+# Toda llamada a la API pasa por aquí (GESTOR envuelve el spreadsheet y cada worksheet):
+# - un balde de fichas por tipo (lectura / escritura) al ritmo del cupo de Google;
+# - con el balde vacío se hace fila por prioridad: el correlativo de una cotización pasa antes que lo
+#   que espera una pantalla, eso antes que el sincronizador y todo antes que el guardado de borradores;
+# - un 429 o un 5xx se reintenta con backoff exponencial y jitter completo en vez de llegar al except;
+#   lo que no se puede repetir (agregar filas, crear pestañas) solo ante un 429, que asegura que no se aplicó.
+# El cupo es por usuario (60 lecturas y 60 escrituras por minuto) y todas las estaciones comparten la
+# cuenta de servicio: cada proceso va bajo ese ritmo y los 429 que provoquen los demás se reintentan.
+PRIORIDAD_CORRELATIVO = 0
+PRIORIDAD_INTERACTIVA = 1   # lo que una pantalla espera (descargas del primer arranque, versión del esquema)
+PRIORIDAD_FONDO = 2         # sincronizador, historial, importaciones
+PRIORIDAD_BORRADOR = 3
+NOMBRES_PRIORIDAD = {PRIORIDAD_CORRELATIVO: "correlativo", PRIORIDAD_INTERACTIVA: "interactiva",
+                     PRIORIDAD_FONDO: "fondo", PRIORIDAD_BORRADOR: "borrador"}
+
+CUPO_POR_MINUTO = {"lectura": 60, "escritura": 60}
+RAFAGA = 10            # fichas que se pueden gastar de golpe; la reposición deja cualquier minuto bajo el cupo
+MAX_INTENTOS = 5
+BACKOFF_BASE = 1.0     # segundos; se duplica en cada reintento hasta BACKOFF_MAX (y se sortea entre 0 y eso)
+BACKOFF_MAX = 32.0
+ESPERA_MAXIMA = {PRIORIDAD_CORRELATIVO: 20.0, PRIORIDAD_INTERACTIVA: 30.0, PRIORIDAD_FONDO: 120.0, PRIORIDAD_BORRADOR: 60.0}
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+_HILO = threading.local()  # prioridad del hilo actual; compartida por todos los planificadores
+
+class CupoAgotado(Exception):
+    # La llamada esperó en la fila más que ESPERA_MAXIMA de su prioridad; quien llama cae a su camino
+    # sin nube (número provisorio, cola de pendientes, borrador local) como con cualquier otro error.
+    pass
+
+def codigo_error(e):
+    if isinstance(e, gspread.exceptions.APIError): return getattr(e, "code", None) or getattr(e.response, "status_code", None)
+    return None
+
+def es_reintentable(e):
+    return codigo_error(e) in ESTADOS_REINTENTABLES or isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+class Balde:
+    def __init__(self, cupo, rafaga, periodo):
+        # capacidad + ritmo * periodo = cupo: ninguna ventana de `periodo` segundos pasa del cupo
+        self.capacidad = min(rafaga, cupo)
+        self.ritmo = (cupo - self.capacidad) / periodo or cupo / periodo
+        self.fichas = float(self.capacidad)
+        self._t = time.monotonic()
+
+    def espera(self, ahora):
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._t) * self.ritmo)
+        self._t = ahora
+        return 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.ritmo
+
+class Planificador:
+    def __init__(self, cupos=CUPO_POR_MINUTO, rafaga=RAFAGA, periodo=60.0, dormir=time.sleep, azar=random.random):
+        self._cond = threading.Condition()
+        self._baldes = {tipo: Balde(cupo, rafaga, periodo) for tipo, cupo in cupos.items()}
+        self._filas = {tipo: [] for tipo in cupos}  # heap de (prioridad, turno)
+        self._turnos = itertools.count()
+        self._dormir = dormir
+        self._azar = azar
+        self.stats = {"llamadas": 0, "esperas": 0, "espera_s": 0.0, "reintentos": 0, "errores_cupo": 0, "rendidas": 0, "max_en_fila": 0,
+                      "por_prioridad": {nombre: 0 for nombre in NOMBRES_PRIORIDAD.values()}}
+
+    # --- Prioridad del hilo actual (la más interna gana) ---
+    @contextmanager
+    def prioridad(self, prioridad):
+        previa = getattr(_HILO, "prioridad", PRIORIDAD_INTERACTIVA)
+        _HILO.prioridad = prioridad
+        try: yield
+        finally: _HILO.prioridad = previa
+
+    def con_prioridad(self, prioridad):
+        def decorar(fn):
+            @functools.wraps(fn)
+            def envuelta(*args, **kwargs):
+                with self.prioridad(prioridad): return fn(*args, **kwargs)
+            return envuelta
+        return decorar
+
+    # --- Fila y fichas ---
+    def _turno(self, tipo, prioridad):
+        # Bloquea hasta que hay ficha y nadie más prioritario (o que llegó antes con la misma prioridad) espera
+        balde, fila = self._baldes[tipo], self._filas[tipo]
+        with self._cond:
+            boleto = (prioridad, next(self._turnos))
+            heapq.heappush(fila, boleto)
+            self.stats["max_en_fila"] = max(self.stats["max_en_fila"], len(fila))
+            self._cond.notify_all()  # el que estaba primero puede dejar de estarlo
+            t0 = time.monotonic()
+            limite = t0 + ESPERA_MAXIMA.get(prioridad, ESPERA_MAXIMA[PRIORIDAD_FONDO])
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    espera = balde.espera(ahora) if fila[0] == boleto else None
+                    if espera == 0.0:
+                        balde.fichas -= 1; break
+                    if ahora >= limite:
+                        self.stats["rendidas"] += 1
+                        raise CupoAgotado(f"{tipo}: {ahora - t0:.0f} s en la fila de Sheets ({NOMBRES_PRIORIDAD.get(prioridad, prioridad)})")
+                    self._cond.wait(min(espera, limite - ahora) if espera is not None else limite - ahora)
+            finally:
+                fila.remove(boleto); heapq.heapify(fila)
+                self._cond.notify_all()
+            esperado = time.monotonic() - t0
+            if esperado > 0.001:
+                self.stats["esperas"] += 1; self.stats["espera_s"] += esperado
+            self.stats["llamadas"] += 1
+            self.stats["por_prioridad"][NOMBRES_PRIORIDAD.get(prioridad, "fondo")] += 1
+
+    def _vaciar(self, tipo):
+        # Un 429 dice que el cupo compartido ya se gastó (otra estación): se frena también a los que vienen
+        with self._cond:
+            self.stats["errores_cupo"] += 1
+            self._baldes[tipo].fichas = min(self._baldes[tipo].fichas, 0.0)
+
+    def ejecutar(self, tipo, fn, *args, repetible=True, **kwargs):
+        # repetible=False: un 5xx o un corte pueden llegar con la llamada ya aplicada; repetirla duplicaría
+        # filas, así que el error va a quien llama (o a la cola de pendientes)
+        prioridad = getattr(_HILO, "prioridad", PRIORIDAD_INTERACTIVA)
+        for intento in range(1, MAX_INTENTOS + 1):
+            self._turno(tipo, prioridad)
+            try: return fn(*args, **kwargs)
+            except Exception as e:
+                reintentar = es_reintentable(e) if repetible else codigo_error(e) == 429
+                if intento == MAX_INTENTOS or not reintentar: raise
+                if codigo_error(e) == 429: self._vaciar(tipo)
+                with self._cond: self.stats["reintentos"] += 1
+                self._dormir(self._azar() * min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (intento - 1)))
+
+    def estadisticas(self):
+        with self._cond:
+            s = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.stats.items()}
+            ahora = time.monotonic()
+            for balde in self._baldes.values(): balde.espera(ahora)
+            s["en_fila"] = {tipo: len(fila) for tipo, fila in self._filas.items()}
+            s["fichas"] = {tipo: round(balde.fichas, 2) for tipo, balde in self._baldes.items()}
+        s["espera_s"] = round(s["espera_s"], 2)
+        return s
+
+PLANIFICADOR = Planificador()
@@ -0,0 +1,65 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metricas import METRICAS
+
+# ==========================================
+# PRECARGA EN SEGUNDO PLANO
+# ==========================================
+# La pantalla del paso 1 se dibuja sin esperar a nadie; mientras el usuario escribe la patente, un pool
+# calienta a la vez lo que pedirán los pasos siguientes (catálogo, índices, borradores de la nube): las
+# descargas son independientes, así que el arranque en frío dura lo que la más lenta y no la suma.
+# Cada tarea es una función sin argumentos que deja su resultado en su propio caché (y en resultado())
+# apenas termina; quien necesita un dataset espera solo ese (esperar(nombre) o el lock de su caché).
+class Precarga:
+    def __init__(self, tareas, hilos=None):
+        self.tareas = list(tareas)  # [(nombre, fn)]
+        self.hilos = hilos or len(self.tareas)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._hilo = None
+        # Cada arrancar() abre una ronda nueva: lo que terminó en una ronda anterior no cuenta como listo para esta
+        self._ronda = 0
+        self._terminadas = {}  # nombre -> última ronda en que terminó
+        self._resultados = {}  # nombre -> resultado de esa ronda (None si falló)
+        self.stats = {nombre: {"corridas": 0, "ultimo_ms": None, "errores": 0} for nombre, _ in self.tareas}
+
+    def arrancar(self):
+        # No bloquea: si ya hay una precarga en curso, esa misma sirve. Devuelve la ronda que hay que esperar
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive(): return self._ronda
+            self._ronda += 1
+            self._hilo = threading.Thread(target=self._correr, args=(self._ronda,), name="precarga", daemon=True)
+            self._hilo.start()
+            return self._ronda
+
+    def _correr(self, ronda):
+        # El hilo "precarga" sigue vivo hasta que terminan todas, así arrancar() no duplica la ronda
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="precarga") as pool:
+            for nombre, fn in self.tareas: pool.submit(self._tarea, ronda, nombre, fn)
+
+    def _tarea(self, ronda, nombre, fn):
+        t0 = time.perf_counter()
+        resultado = None
+        try: resultado = fn()
+        except Exception:
+            self.stats[nombre]["errores"] += 1; METRICAS.contar_fallo(f"precarga ({nombre})")
+        self.stats[nombre]["corridas"] += 1
+        self.stats[nombre]["ultimo_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        with self._cond:
+            self._resultados[nombre] = resultado
+            self._terminadas[nombre] = ronda
+            self._cond.notify_all()
+
+    def _lista(self, nombre, ronda):
+        return self._terminadas.get(nombre, 0) >= (ronda or self._ronda or 1)
+
+    def lista(self, nombre, ronda=None):
+        # Sin ronda, la última que se arrancó
+        with self._lock: return self._lista(nombre, ronda)
+
+    def resultado(self, nombre, ronda=None, por_defecto=None):
+        with self._lock: return self._resultados.get(nombre, por_defecto) if self._lista(nombre, ronda) else por_defecto
+
+    def esperar(self, nombre, timeout=None, ronda=None):
+        with self._cond: return self._cond.wait_for(lambda: self._lista(nombre, ronda), timeout)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# MOTOR DE PRECIOS EN PESOS ENTEROS
+# ==========================================
+# Todo monto es un entero de pesos (int64). La hoja guarda Costo_SSAS y, en las demás columnas de
+# tarifa, solo las excepciones: una celda vacía se deriva de la base con su regla y un número la reemplaza.
+COLUMNA_BASE = 'Costo_SSAS'
+IVA = (19, 100)
+
+# columna -> (numerador, denominador) sobre la base, redondeado al peso (mitades hacia arriba)
+REGLAS_PRECIO = {
+    'Costo_Hosp_Temuco': (105, 100),
+    'Costo_Hosp_Villarrica': (1, 1),
+    'Costo_Hosp_Lautaro': (1, 1),
+    'Costo_Hosp_Pitrufquen': (1, 1),
+    'Costo_Gend': (1, 1),
+}
+
+def redondear(numerador, denominador):
+    # numerador / denominador al peso, mitades hacia arriba, sin pasar por float (sirve con escalares y arreglos)
+    return (numerador * 2 + denominador) // (denominador * 2)
+
+def a_pesos(valor):
+    # 95000, "95000", 1200832.5 (heredado de costo * 1.05) -> entero; vacío o texto -> 0
+    try: return int(np.floor(float(valor) + 0.5))
+    except (TypeError, ValueError): return 0
+
+def columna_pesos(serie):
+    # Vectorizado: NaN donde la celda está vacía (hay que derivarla), pesos enteros donde no
+    valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+    return np.floor(valores + 0.5)
+
+def derivar(base, columna):
+    numerador, denominador = REGLAS_PRECIO[columna]
+    return redondear(base * numerador, denominador)
+
+def resolver_tarifas(df):
+    # {columna: int64[]} con todas las tarifas resueltas (excepción si la hay, si no la regla)
+    base = np.nan_to_num(columna_pesos(df[COLUMNA_BASE])).astype(np.int64)
+    tarifas = {COLUMNA_BASE: base}
+    for columna in REGLAS_PRECIO:
+        derivada = derivar(base, columna)
+        if columna not in df.columns: tarifas[columna] = derivada; continue
+        explicita = columna_pesos(df[columna])
+        tarifas[columna] = np.where(np.isnan(explicita), derivada, np.nan_to_num(explicita)).astype(np.int64)
+    return tarifas
+
+def compactar_tarifas(df):
+    # Forma que se guarda en la hoja: base en pesos y en blanco toda celda igual a lo que da su regla
+    tarifas = resolver_tarifas(df)
+    df = df.copy()
+    df[COLUMNA_BASE] = tarifas[COLUMNA_BASE].tolist()
+    for columna in REGLAS_PRECIO:
+        derivada = derivar(tarifas[COLUMNA_BASE], columna)
+        df[columna] = pd.Series(['' if v == d else int(v) for v, d in zip(tarifas[columna], derivada)], index=df.index, dtype=object)
+    return df
+
+def totalizar(unitarios, cantidades):
+    # Una pasada vectorizada: total por línea, neto, IVA (sobre el neto, al peso) y total a pagar
+    lineas = np.asarray(unitarios, dtype=np.int64) * np.asarray(cantidades, dtype=np.int64)
+    neto = int(lineas.sum())
+    iva = int(redondear(neto * IVA[0], IVA[1]))
+    return {"lineas": lineas, "neto": neto, "iva": iva, "total": neto + iva}
+
+def calcular_iva(neto):
+    return int(redondear(int(neto) * IVA[0], IVA[1]))
@@ -0,0 +1,114 @@
+import os
+import json
+import unicodedata
+import pandas as pd
+from metricas import METRICAS
+
+# ==========================================
+# CATÁLOGO DE MARCAS Y MODELOS
+# ==========================================
+RUTA_VEHICULOS_CSV = "vehiculos.csv"
+SUFIJO_CATALOGO = ".catalogo.json"  # vehiculos.csv -> vehiculos.csv.catalogo.json
+OPCION_SIN_MARCA = "--- Seleccione Marca ---"
+MARCA_ESPECIALES = "Especiales / Conversiones"
+MODELOS_ESPECIALES = ["Carro de Arrastre", "Clínica Móvil", "Conversión a Ambulancia", "Oficina Móvil", "Remolque Especial"]
+
+BASE_POR_DEFECTO = {
+    OPCION_SIN_MARCA: ["---"],
+    "Mercedes-Benz": ["Sprinter", "Vito", "Citan", "Clase A", "Clase C", "GLA", "GLC", "GLE"],
+    MARCA_ESPECIALES: MODELOS_ESPECIALES,
+    "Chevrolet": ["Sail", "Spark", "Tracker", "Colorado", "Silverado", "D-Max", "Captiva", "Onix", "Groove", "Spin", "N300", "Optra"],
+    "Toyota": ["Yaris", "Hilux", "RAV4", "Corolla", "Auris", "4Runner", "Fortuner", "Land Cruiser", "Prius", "Rush", "Urban Cruiser"],
+    "Hyundai": ["Accent", "Tucson", "Santa Fe", "Elantra", "Creta", "Grand i10", "H-1", "Porter", "Venue", "Kona", "Ioniq"],
+    "Kia": ["Morning", "Rio", "Cerato", "Sportage", "Sorento", "Frontier", "Soluto", "Sonet", "Niro", "Carnival", "Carens"],
+    "Nissan": ["Versa", "Sentra", "Qashqai", "X-Trail", "NP300", "Navara", "Kicks", "March", "Pathfinder", "Terrano", "Tiida"],
+    "Suzuki": ["Swift", "Baleno", "Vitara", "Grand Nomade", "Jimny", "Dzire", "S-Presso", "Ertiga", "Celerio", "Alto", "S-Cross"],
+    "Peugeot": ["208", "2008", "308", "3008", "5008", "Partner", "Boxer", "Expert", "Rifter"],
+    "Ford": ["Ranger", "F-150", "Territory", "Escape", "Explorer", "Edge", "Transit", "Ecosport", "Puma"]
+}
+
+def construir_base_vehiculos(df):
+    # Una sola pasada agrupada: marca -> modelos únicos ordenados (antes era un filtro por marca, O(marcas × filas))
+    base = {OPCION_SIN_MARCA: ["---"], MARCA_ESPECIALES: list(MODELOS_ESPECIALES)}
+    df = df[['Marca', 'Modelo']].dropna(subset=['Marca'])
+    df = pd.DataFrame({'Marca': df['Marca'].astype(str), 'Modelo': df['Modelo']})
+    grupos = df.dropna(subset=['Modelo']).groupby('Marca', sort=False)['Modelo'].agg(lambda s: sorted(set(s.astype(str))))
+    for marca in sorted(df['Marca'].unique()):
+        if marca not in base: base[marca] = grupos.get(marca, [])
+    return base
+
+def firma_archivo(ruta):
+    st_archivo = os.stat(ruta)
+    return [st_archivo.st_size, st_archivo.st_mtime_ns]
+
+def cargar_base_vehiculos(ruta_csv=RUTA_VEHICULOS_CSV):
+    # El catálogo compilado se guarda junto al CSV y se reutiliza mientras el CSV no cambie (tamaño + mtime)
+    if not os.path.exists(ruta_csv): return BASE_POR_DEFECTO
+    ruta_catalogo = ruta_csv + SUFIJO_CATALOGO
+    try:
+        firma = firma_archivo(ruta_csv)
+        if os.path.exists(ruta_catalogo):
+            with open(ruta_catalogo, encoding='utf-8') as f: guardado = json.load(f)
+            if guardado.get("firma") == firma: return guardado["base"]
+        df = pd.read_csv(ruta_csv, encoding='utf-8')
+        if 'Marca' not in df.columns or 'Modelo' not in df.columns: return BASE_POR_DEFECTO
+        base = construir_base_vehiculos(df)
+    except Exception:
+        METRICAS.contar_fallo("cargar_base_vehiculos"); return BASE_POR_DEFECTO
+    try:
+        temporal = ruta_catalogo + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f: json.dump({"firma": firma, "base": base}, f, ensure_ascii=False)
+        os.replace(temporal, ruta_catalogo)
+    except Exception: METRICAS.contar_fallo("guardar_catalogo_vehiculos")
+    return base
+
+# ==========================================
+# ÍNDICE DE BÚSQUEDA (PREFIJO / SUBCADENA)
+# ==========================================
+def normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceVehiculos:
+    # Una entrada por (marca, modelo) con el texto "marca modelo" normalizado (sin mayúsculas ni tildes).
+    # Los términos de 3+ letras se resuelven con un índice invertido de trigramas; los más cortos, recorriendo.
+    def __init__(self, base):
+        self.base = base
+        self._entradas = []
+        self._trigramas = {}
+        for marca, modelos in base.items():
+            if marca == OPCION_SIN_MARCA: continue
+            for modelo in modelos:
+                n = len(self._entradas)
+                texto = normalizar(f"{marca} {modelo}")
+                self._entradas.append((texto, marca, modelo, normalizar(marca), normalizar(modelo)))
+                for t in trigramas(texto): self._trigramas.setdefault(t, []).append(n)
+
+    def _candidatos(self, terminos):
+        largos = [t for t in terminos if len(t) >= 3]
+        if not largos: return range(len(self._entradas))
+        candidatos = None
+        for termino in largos:
+            for t in trigramas(termino):
+                posiciones = self._trigramas.get(t)
+                if not posiciones: return []
+                candidatos = set(posiciones) if candidatos is None else candidatos.intersection(posiciones)
+                if not candidatos: return []
+        return sorted(candidatos)
+
+    def buscar(self, consulta):
+        # Devuelve {marca: [modelos]} con los que contienen todos los términos; primero los que empiezan
+        # por el primer término (en la marca o en el modelo) y, dentro de eso, en el orden del catálogo.
+        terminos = normalizar(consulta).split()
+        if not terminos: return self.base
+        por_prefijo, por_subcadena = [], []
+        for n in self._candidatos(terminos):
+            texto, marca, modelo, marca_n, modelo_n = self._entradas[n]
+            if all(t in texto for t in terminos):
+                (por_prefijo if marca_n.startswith(terminos[0]) or modelo_n.startswith(terminos[0]) else por_subcadena).append((marca, modelo))
+        resultado = {}
+        for marca, modelo in por_prefijo + por_subcadena: resultado.setdefault(marca, []).append(modelo)
+        return resultado